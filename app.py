@@ -4,6 +4,8 @@ import io
 from datetime import datetime
 import plotly.express as px
 import plotly.graph_objects as go
+import motor_calculo as motor
+from historial_tasas import HistorialTasas
 
 # Configuración de la página
 st.set_page_config(
@@ -86,6 +88,11 @@ class Producto:
             'peso_unitario_kg': self.peso_unitario_kg
         }
 
+@st.cache_resource
+def obtener_historial_tasas():
+    """Historial de tasas compartido entre reejecuciones (el CSV se lee una vez)"""
+    return HistorialTasas()
+
 class CalculadoraImportaciones:
     def __init__(self):
         self.tasa_cambio = self.obtener_tasa_cambio()
@@ -93,34 +100,24 @@ class CalculadoraImportaciones:
         self.anticipo_iva = 0.10
     
     def obtener_tasa_cambio(self):
-        return 3950
+        # Última TRM del historial local; 3950 si todavía no hay historial
+        tasa = obtener_historial_tasas().tasa('USD_COP')
+        return tasa if tasa is not None else 3950
     
     def calcular_cif(self, valor_producto, flete_internacional, seguro):
-        return valor_producto + flete_internacional + seguro
+        return motor.calcular_cif(valor_producto, flete_internacional, seguro)
     
     def calcular_dai(self, cif, tasa_arancel):
-        return cif * tasa_arancel
+        return motor.calcular_dai(cif, tasa_arancel)
     
     def calcular_iva(self, cif, dai):
-        base_iva = cif + dai
-        return base_iva * self.iva
+        return motor.calcular_iva(cif, dai, self.iva)
     
     def calcular_anticipo_iva(self, iva):
-        return iva * self.anticipo_iva
+        return motor.calcular_anticipo_iva(iva, self.anticipo_iva)
     
     def calcular_gastos_varios(self, cif, peso_total_kg):
-        agencia_aduanal = max(cif * 0.015, 300000)
-        almacenamiento = max(150000, peso_total_kg * 500)
-        transporte_interno = max(200000, peso_total_kg * 800)
-        otros_gastos = 100000
-        
-        return {
-            'agencia_aduanal': agencia_aduanal,
-            'almacenamiento': almacenamiento,
-            'transporte_interno': transporte_interno,
-            'otros_gastos': otros_gastos,
-            'total': agencia_aduanal + almacenamiento + transporte_interno + otros_gastos
-        }
+        return motor.calcular_gastos_varios(cif, peso_total_kg)
     
     def formato_moneda(self, valor, moneda='COP'):
         if moneda == 'COP':
@@ -362,44 +359,13 @@ def pestaña_calculadora_principal(calc):
 
 def calcular_costos_importacion(calc, valor_productos_usd, peso_total_kg, flete_usd, seguro_usd, tasa_arancel):
     if valor_productos_usd > 0:
-        # Conversión a COP
-        valor_producto_cop = valor_productos_usd * calc.tasa_cambio
-        flete_internacional_cop = flete_usd * calc.tasa_cambio
-        seguro_cop = seguro_usd * calc.tasa_cambio
-        
-        # Cálculos
-        cif_cop = calc.calcular_cif(valor_producto_cop, flete_internacional_cop, seguro_cop)
-        dai_cop = calc.calcular_dai(cif_cop, tasa_arancel)
-        iva_cop = calc.calcular_iva(cif_cop, dai_cop)
-        anticipo_iva_cop = calc.calcular_anticipo_iva(iva_cop)
-        gastos_varios = calc.calcular_gastos_varios(cif_cop, peso_total_kg)
-        
-        costo_total_cop = cif_cop + dai_cop + iva_cop + gastos_varios['total']
-        costo_total_usd = calc.convertir_a_usd(costo_total_cop)
-        
-        # Calcular precios de venta
-        precio_venta_sugerido_cop = costo_total_cop * (1 + st.session_state.porcentaje_rentabilidad / 100)
-        precio_venta_sugerido_usd = precio_venta_sugerido_cop / calc.tasa_cambio
-        
-        # Guardar resultados
-        st.session_state.resultados_calculo = {
-            'valor_producto_cop': valor_producto_cop,
-            'flete_internacional_cop': flete_internacional_cop,
-            'seguro_cop': seguro_cop,
-            'cif_cop': cif_cop,
-            'dai_cop': dai_cop,
-            'iva_cop': iva_cop,
-            'anticipo_iva_cop': anticipo_iva_cop,
-            'gastos_varios': gastos_varios,
-            'costo_total_cop': costo_total_cop,
-            'costo_total_usd': costo_total_usd,
-            'tasa_arancel': tasa_arancel,
-            'iva_usado': calc.iva,
-            'precio_venta_sugerido_cop': precio_venta_sugerido_cop,
-            'precio_venta_sugerido_usd': precio_venta_sugerido_usd,
-            'utilidad_esperada_cop': precio_venta_sugerido_cop - costo_total_cop,
-            'utilidad_esperada_usd': (precio_venta_sugerido_cop - costo_total_cop) / calc.tasa_cambio
-        }
+        st.session_state.resultados_calculo = motor.calcular_costos_importacion(
+            valor_productos_usd, peso_total_kg, flete_usd, seguro_usd, tasa_arancel,
+            tasa_cambio=calc.tasa_cambio,
+            tasa_iva=calc.iva,
+            tasa_anticipo_iva=calc.anticipo_iva,
+            porcentaje_rentabilidad=st.session_state.porcentaje_rentabilidad
+        )
 
 def mostrar_resultados_calculo(calc):
     resultados = st.session_state.resultados_calculo
@@ -6,6 +6,11 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import json
+from cache_resultados import CacheResultados, huella_entradas
+from motor_calculo import (
+    BASES_FLETE, DIVISORES_VOLUMETRICOS, ErrorCalculo, LandedCostIncremental, calcular_ventas, parametros_por_defecto
+)
+from validacion import validar_productos, verificar_catalogo
 
 # Configuración de la página
 st.set_page_config(
@@ -22,23 +27,7 @@ class CalculadoraImportacionesStreamlit:
     def inicializar_datos(self):
         """Inicializar datos en session_state si no existen"""
         if 'parametros' not in st.session_state:
-            st.session_state.parametros = {
-                'USD_COP': 3800.0,
-                'CNY_USD': 0.14,
-                'flete_internacional': 2500.0,
-                'seguro_porcentaje': 0.02,
-                'iva_importacion': 0.19,
-                'despacho_aduana': 850000.0,
-                'transporte_interno': 1200000.0,
-                'almacenaje': 500000.0,
-                'margen_objetivo': 0.35,
-                'costo_packaging': 2500.0,
-                'costo_envio_local': 12000.0,
-                'comision_ml_electronicos': 0.12,
-                'comision_ml_hogar': 0.14,
-                'comision_ml_moda': 0.16,
-                'porcentaje_perdidas': 0.02
-            }
+            st.session_state.parametros = parametros_por_defecto()
         
         if 'productos' not in st.session_state:
             st.session_state.productos = pd.DataFrame({
@@ -75,6 +64,9 @@ class CalculadoraImportacionesStreamlit:
             
         if 'calculos_realizados' not in st.session_state:
             st.session_state.calculos_realizados = False
+        
+        if 'cache_resultados' not in st.session_state:
+            st.session_state.cache_resultados = CacheResultados()
 
     def ejecutar_aplicacion(self):
         """Ejecutar la aplicación principal"""
@@ -151,6 +143,12 @@ class CalculadoraImportacionesStreamlit:
                 self.recalcular_todo()
                 st.success("¡Sistema actualizado!")
             
+            stats = st.session_state.cache_resultados.estadisticas()
+            st.caption(
+                f"⚡ Caché: {stats['aciertos']} aciertos • {stats['fallos']} fallos • "
+                f"{stats['bytes_global'] / 1e6:,.1f} MB"
+            )
+            
             st.markdown("---")
             st.caption(f"© 2024 • {datetime.now().strftime('%d/%m/%Y %H:%M')}")
 
@@ -308,6 +306,29 @@ class CalculadoraImportacionesStreamlit:
                     key="flete_input"
                 )
                 
+                st.session_state.parametros['base_flete'] = st.selectbox(
+                    "Prorrateo del flete",
+                    BASES_FLETE,
+                    index=BASES_FLETE.index(st.session_state.parametros['base_flete']),
+                    format_func={'valor': "Por valor FOB", 'peso_cobrable': "Por peso cobrable"}.get,
+                    help="El peso cobrable es el mayor entre el peso real y el volumétrico; "
+                         "evita subcostear productos livianos y voluminosos",
+                    key="base_flete_input"
+                )
+                
+                modos = list(DIVISORES_VOLUMETRICOS)
+                divisor = st.session_state.parametros['divisor_volumetrico']
+                modo = st.selectbox(
+                    "Modo de transporte",
+                    modos,
+                    index=modos.index(next((m for m in modos if DIVISORES_VOLUMETRICOS[m] == divisor), modos[0])),
+                    format_func={'maritimo_lcl': "Marítimo LCL (1:1000)", 'aereo': "Aéreo (1:6000)"}.get,
+                    help="Divisor volumétrico: cm³ por kg cobrable",
+                    disabled=st.session_state.parametros['base_flete'] != 'peso_cobrable',
+                    key="modo_transporte_input"
+                )
+                st.session_state.parametros['divisor_volumetrico'] = DIVISORES_VOLUMETRICOS[modo]
+                
                 st.session_state.parametros['seguro_porcentaje'] = st.number_input(
                     "Seguro (% sobre valor)",
                     value=st.session_state.parametros['seguro_porcentaje'],
@@ -571,7 +592,7 @@ class CalculadoraImportacionesStreamlit:
                 edited_df = edited_df.drop(['Total FOB USD', 'Peso Total kg', 'Volumen Total m³'], axis=1)
             
             if st.button("💾 Guardar Cambios en Productos", use_container_width=True, type="primary", key="guardar_productos_btn"):
-                st.session_state.productos = edited_df
+                self.guardar_edicion_productos(edited_df, "productos_editor_unique")
                 st.session_state.calculos_realizados = False
                 st.success("✅ Productos actualizados correctamente")
                 st.rerun()
@@ -645,6 +666,24 @@ class CalculadoraImportacionesStreamlit:
             else:
                 st.info("No hay productos registrados")
 
+    def guardar_edicion_productos(self, edited_df, clave_editor):
+        """Guardar productos editados y refrescar el Landed Cost solo en las filas modificadas"""
+        estado = st.session_state.get(clave_editor, {})
+        motor = st.session_state.get('motor_landed_cost')
+        solo_ediciones = not estado.get('added_rows') and not estado.get('deleted_rows')
+        
+        if (
+            motor is not None and solo_ediciones and
+            motor.vigente(st.session_state.productos, st.session_state.aranceles, st.session_state.parametros) and
+            motor.admite_edicion(edited_df, st.session_state.aranceles, st.session_state.parametros)
+        ):
+            filas = [int(fila) for fila in estado.get('edited_rows', {})]
+            motor.actualizar(edited_df, filas)
+            if not st.session_state.landed_cost.empty:
+                st.session_state.landed_cost = motor.resultado(st.session_state.parametros)
+        
+        st.session_state.productos = edited_df
+
     def pagina_aranceles(self):
         """Página de gestión de aranceles"""
         st.header("📊 Gestión de Aranceles e Impuestos")
@@ -776,12 +815,13 @@ class CalculadoraImportacionesStreamlit:
             **🧮 Fórmulas aplicadas:**
             
             **Valor FOB USD** = Cantidad × Precio Unitario
-            **Flete Proporcional** = (Valor FOB / Total FOB) × Flete Internacional  
+            **Peso Cobrable** = máx(Peso real, Volumen cm³ / Divisor volumétrico)
+            **Flete Proporcional** = (Peso Cobrable / Total Peso Cobrable) × Flete Internacional (o por Valor FOB, según el parámetro)  
             **Seguro** = Valor FOB × % Seguro
             **Valor CIF USD** = FOB + Flete + Seguro
             **Valor CIF COP** = CIF USD × Tipo Cambio
             
-            **Arancel** = CIF COP × % Arancel
+            **Arancel** = CIF COP × % Arancel (HS Code exacto, o por subpartida, partida o capítulo; 10% si no hay coincidencia)
             **IVA** = (CIF COP + Arancel) × % IVA
             **Costos Nacionales** = Proporcional por cantidad
             
@@ -829,7 +869,8 @@ class CalculadoraImportacionesStreamlit:
             st.write("""
             **🧮 Fórmulas aplicadas:**
             
-            **Precio Venta** = Costo Landed / (1 - Margen Objetivo)
+            **Precio Venta** = (Costo Landed × (1 + Margen Objetivo) + Envío + Packaging) / (1 - % Comisión)
+            **Precio Equilibrio** = (Costo Landed + Envío + Packaging) / (1 - % Comisión)
             **Comisión ML** = Precio Venta × % Comisión (según categoría)
             **Precio Neto** = Precio Venta - Comisión - Envío - Packaging
             **Rentabilidad** = (Precio Neto - Costo Landed) / Costo Landed
@@ -919,73 +960,26 @@ class CalculadoraImportacionesStreamlit:
     def calcular_landed_cost(self):
         """Calcular Landed Cost para todos los productos"""
         try:
-            parametros = st.session_state.parametros
             productos = st.session_state.productos
             aranceles = st.session_state.aranceles
+            parametros = st.session_state.parametros
             
-            usd_cop = parametros['USD_COP']
-            flete = parametros['flete_internacional']
-            seguro = parametros['seguro_porcentaje']
-            iva = parametros['iva_importacion']
-            costos_nacionales = (
-                parametros['despacho_aduana'] +
-                parametros['transporte_interno'] + 
-                parametros['almacenaje']
-            )
+            # Los errores del catálogo (cantidades en cero, HS Codes malformados...) bloquean el cálculo
+            try:
+                verificar_catalogo(productos, aranceles, parametros)
+            except ErrorCalculo as e:
+                st.error(f"❌ {str(e)}")
+                st.dataframe(validar_productos(productos, aranceles, parametros).drop(columns='regla'),
+                             hide_index=True, use_container_width=True)
+                return
             
-            resultados = []
-            total_fob_usd = (productos['cantidad'] * productos['precio_unitario_usd']).sum()
+            # Reutilizar el motor incremental si sigue sincronizado con los datos
+            motor = st.session_state.get('motor_landed_cost')
+            if motor is None or not motor.vigente(productos, aranceles, parametros):
+                motor = LandedCostIncremental(productos, aranceles, parametros)
+                st.session_state.motor_landed_cost = motor
             
-            for _, producto in productos.iterrows():
-                # Cálculos básicos
-                valor_fob_usd = producto['cantidad'] * producto['precio_unitario_usd']
-                flete_proporcional = (valor_fob_usd / total_fob_usd) * flete if total_fob_usd > 0 else 0
-                seguro_proporcional = valor_fob_usd * seguro
-                
-                valor_cif_usd = valor_fob_usd + flete_proporcional + seguro_proporcional
-                valor_cif_cop = valor_cif_usd * usd_cop
-                
-                # Buscar arancel
-                arancel_info = aranceles[aranceles['hs_code'] == producto['hs_code']]
-                if not arancel_info.empty:
-                    arancel_porcentaje = arancel_info['arancel_porcentaje'].iloc[0]
-                    iva_porcentaje = arancel_info['iva_porcentaje'].iloc[0]
-                    otros_impuestos = arancel_info['otros_impuestos'].iloc[0]
-                else:
-                    # Valores por defecto si no encuentra HS Code
-                    arancel_porcentaje = 0.10
-                    iva_porcentaje = iva
-                    otros_impuestos = 0.0
-                
-                arancel_cop = valor_cif_cop * arancel_porcentaje
-                iva_cop = (valor_cif_cop + arancel_cop) * iva_porcentaje
-                otros_impuestos_cop = valor_cif_cop * otros_impuestos
-                
-                # Costos nacionales proporcionales
-                costos_nacionales_prop = (producto['cantidad'] / productos['cantidad'].sum()) * costos_nacionales
-                
-                # Ajustar por pérdidas
-                factor_perdidas = 1 + parametros['porcentaje_perdidas']
-                
-                costo_total = (valor_cif_cop + arancel_cop + iva_cop + otros_impuestos_cop + costos_nacionales_prop) * factor_perdidas
-                costo_unitario = costo_total / producto['cantidad'] if producto['cantidad'] > 0 else 0
-                
-                resultados.append({
-                    'sku': producto['sku'],
-                    'descripcion': producto['descripcion'],
-                    'cantidad': producto['cantidad'],
-                    'cif_usd': valor_cif_usd,
-                    'cif_cop': valor_cif_cop,
-                    'arancel_cop': arancel_cop,
-                    'iva_cop': iva_cop,
-                    'otros_impuestos_cop': otros_impuestos_cop,
-                    'costos_nacionales': costos_nacionales_prop,
-                    'costo_total': costo_total,
-                    'costo_unitario': costo_unitario,
-                    'factor_perdidas': factor_perdidas
-                })
-            
-            st.session_state.landed_cost = pd.DataFrame(resultados)
+            st.session_state.landed_cost = motor.resultado(parametros)
             st.session_state.calculos_realizados = True
             st.success("✅ Landed Cost calculado correctamente")
             
@@ -999,51 +993,11 @@ class CalculadoraImportacionesStreamlit:
                 st.warning("⚠️ Primero calcula el Landed Cost")
                 return
             
-            parametros = st.session_state.parametros
-            landed_cost = st.session_state.landed_cost
-            productos = st.session_state.productos
-            
-            margen = parametros['margen_objetivo']
-            packaging = parametros['costo_packaging']
-            envio = parametros['costo_envio_local']
-            
-            resultados = []
-            
-            for _, landed in landed_cost.iterrows():
-                producto = productos[productos['sku'] == landed['sku']].iloc[0]
-                costo_unitario = landed['costo_unitario']
-                categoria = producto['categoria']
-                
-                # Determinar comisión según categoría
-                if categoria == 'Electrónicos':
-                    comision_ml = parametros['comision_ml_electronicos']
-                elif categoria == 'Hogar':
-                    comision_ml = parametros['comision_ml_hogar']
-                elif categoria == 'Moda':
-                    comision_ml = parametros['comision_ml_moda']
-                else:
-                    comision_ml = 0.15
-                
-                # Cálculos de venta
-                precio_venta = costo_unitario / (1 - margen)
-                comision = precio_venta * comision_ml
-                precio_neto = precio_venta - comision - envio - packaging
-                rentabilidad = (precio_neto - costo_unitario) / costo_unitario
-                markup = precio_venta / costo_unitario
-                
-                resultados.append({
-                    'sku': landed['sku'],
-                    'descripcion': landed['descripcion'],
-                    'categoria': categoria,
-                    'costo_landed': costo_unitario,
-                    'precio_venta': precio_venta,
-                    'comision_ml': comision,
-                    'precio_neto': precio_neto,
-                    'rentabilidad': rentabilidad,
-                    'markup': markup
-                })
-            
-            st.session_state.ventas = pd.DataFrame(resultados)
+            st.session_state.ventas = calcular_ventas(
+                st.session_state.landed_cost,
+                st.session_state.productos,
+                st.session_state.parametros
+            )
             st.session_state.calculos_realizados = True
             st.success("✅ Ventas calculadas correctamente")
             
@@ -1051,12 +1005,35 @@ class CalculadoraImportacionesStreamlit:
             st.error(f"❌ Error en el cálculo: {str(e)}")
 
     def recalcular_todo(self):
-        """Recalcular todos los módulos"""
+        """Recalcular todos los módulos, reutilizando resultados de entradas idénticas"""
         try:
             if not st.session_state.productos.empty and not st.session_state.aranceles.empty:
-                self.calcular_landed_cost()
-                if not st.session_state.landed_cost.empty:
+                cache = st.session_state.cache_resultados
+                clave = huella_entradas(
+                    st.session_state.parametros,
+                    st.session_state.productos,
+                    st.session_state.aranceles
+                )
+                resultados = cache.obtener(clave)
+                
+                if resultados is None:
+                    st.session_state.landed_cost = pd.DataFrame()
+                    st.session_state.ventas = pd.DataFrame()
+                    
+                    self.calcular_landed_cost()
+                    if st.session_state.landed_cost.empty:
+                        # Cálculo fallido: no se guarda en la caché
+                        return
                     self.calcular_ventas()
+                    
+                    resultados = {
+                        'landed_cost': st.session_state.landed_cost,
+                        'ventas': st.session_state.ventas
+                    }
+                    cache.guardar(clave, resultados)
+                else:
+                    st.session_state.landed_cost = resultados['landed_cost']
+                    st.session_state.ventas = resultados['ventas']
             
             st.session_state.calculos_realizados = True
             st.success("✅ Todos los cálculos han sido actualizados")
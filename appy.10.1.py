@@ -8,6 +8,25 @@ from datetime import datetime
 import json
 import io
 import base64
+from base_aranceles import COLUMNAS_BASE, obtener_base, tabla_vigente
+from busqueda_aranceles import (
+    PUNTAJE_MINIMO, codigos_faltantes, obtener_indice_descripciones, sugerir_hs_codes
+)
+from cache_resultados import CacheResultados, huella_entradas
+from contenedores import APROVECHAMIENTO_POR_DEFECTO, TARIFA_LCL_USD_WM, estimar_contenedores, tipos_contenedor
+from esquema_compacto import actualizar_filas, compactar, expandir, memoria_tablas, reporte_memoria
+from historial_tasas import PARES, HistorialTasas
+from importar_excel import hojas_xlsx, leer_xlsx
+from simulacion_riesgo import (
+    NOMBRES_PARAMETROS, VOLATILIDADES_POR_DEFECTO, analizar_sensibilidad, barrido_grilla, rango_parametro,
+    simular_montecarlo
+)
+from motor_calculo import (
+    BASES_FLETE, COLUMNAS_DEFINICION_ESCENARIOS, DIVISORES_VOLUMETRICOS, LandedCostIncremental, bajo_margen,
+    calcular_escenarios, calcular_evolucion, calcular_tabla_precios, calcular_ventas, datos_backup,
+    escenarios_estandar, parametros_por_defecto, prorratea_por_peso, serializar_backup, submuestrear
+)
+from validacion import validar_productos
 
 # Configuración de la página
 st.set_page_config(
@@ -24,26 +43,10 @@ class CalculadoraImportacionesStreamlit:
     def inicializar_datos(self):
         """Inicializar datos en session_state si no existen"""
         if 'parametros' not in st.session_state:
-            st.session_state.parametros = {
-                'USD_COP': 3800.0,
-                'CNY_USD': 0.14,
-                'flete_internacional': 2500.0,
-                'seguro_porcentaje': 0.02,
-                'iva_importacion': 0.19,
-                'despacho_aduana': 850000.0,
-                'transporte_interno': 1200000.0,
-                'almacenaje': 500000.0,
-                'margen_objetivo': 0.35,
-                'costo_packaging': 2500.0,
-                'costo_envio_local': 12000.0,
-                'comision_ml_electronicos': 0.12,
-                'comision_ml_hogar': 0.14,
-                'comision_ml_moda': 0.16,
-                'porcentaje_perdidas': 0.02
-            }
+            st.session_state.parametros = parametros_por_defecto()
         
         if 'productos' not in st.session_state:
-            st.session_state.productos = pd.DataFrame({
+            st.session_state.productos = compactar(pd.DataFrame({
                 'sku': ['AUD-001', 'CAM-002', 'CAR-003'],
                 'descripcion': ['Auriculares Bluetooth', 'Cámara Seguridad IP', 'Cargador Rápido USB-C'],
                 'cantidad': [500, 200, 1000],
@@ -53,10 +56,14 @@ class CalculadoraImportacionesStreamlit:
                 'hs_code': ['8518.30.00', '8525.80.19', '8504.40.40'],
                 'incoterm': ['FOB', 'FOB', 'FOB'],
                 'categoria': ['Electrónicos', 'Electrónicos', 'Electrónicos']
-            })
+            }), 'productos')
+        
+        # Con la base completa de aranceles, la sesión solo guarda sus ediciones encima de ella
+        if 'aranceles' not in st.session_state and obtener_base() is not None:
+            st.session_state.aranceles = pd.DataFrame(columns=COLUMNAS_BASE)
         
         if 'aranceles' not in st.session_state:
-            st.session_state.aranceles = pd.DataFrame({
+            st.session_state.aranceles = compactar(pd.DataFrame({
                 'hs_code': ['8518.30.00', '8525.80.19', '8504.40.40'],
                 'descripcion': ['Auriculares, audífonos', 'Cámaras de televisión', 'Cargadores eléctricos'],
                 'arancel_porcentaje': [0.05, 0.08, 0.06],
@@ -64,7 +71,7 @@ class CalculadoraImportacionesStreamlit:
                 'otros_impuestos': [0.0, 0.0, 0.0],
                 'fuente': ['DIAN', 'DIAN', 'DIAN'],
                 'fecha_actualizacion': [datetime.now().date()] * 3
-            })
+            }), 'aranceles')
         
         if 'landed_cost' not in st.session_state:
             st.session_state.landed_cost = pd.DataFrame()
@@ -74,9 +81,20 @@ class CalculadoraImportacionesStreamlit:
             
         if 'escenarios' not in st.session_state:
             st.session_state.escenarios = pd.DataFrame()
+        
+        if 'escenarios_personalizados' not in st.session_state:
+            # Entrada fija del editor; las ediciones se leen de lo que devuelve
+            st.session_state.escenarios_personalizados_base = pd.DataFrame(columns=COLUMNAS_DEFINICION_ESCENARIOS)
+            st.session_state.escenarios_personalizados = st.session_state.escenarios_personalizados_base
             
         if 'calculos_realizados' not in st.session_state:
             st.session_state.calculos_realizados = False
+        
+        if 'cache_resultados' not in st.session_state:
+            st.session_state.cache_resultados = CacheResultados()
+        
+        if 'historial_tasas' not in st.session_state:
+            st.session_state.historial_tasas = HistorialTasas()
 
     def ejecutar_aplicacion(self):
         """Ejecutar la aplicación principal"""
@@ -154,12 +172,66 @@ class CalculadoraImportacionesStreamlit:
             
             # Botón de recálculo
             if st.button("🔄 Recalcular Todo", use_container_width=True, type="primary", key="btn_recalcular_sidebar"):
-                self.recalcular_todo()
-                st.success("¡Sistema actualizado!")
+                if self.recalcular_todo():
+                    st.success("¡Sistema actualizado!")
+            
+            self.mostrar_estadisticas_cache()
+            self.mostrar_memoria_sesion()
             
             st.markdown("---")
             st.caption(f"© 2024 • {datetime.now().strftime('%d/%m/%Y %H:%M')}")
 
+    def mostrar_estadisticas_cache(self):
+        """Mostrar aciertos y memoria de la caché de cálculos"""
+        stats = st.session_state.cache_resultados.estadisticas()
+        with st.expander("⚡ Caché de Cálculos"):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Aciertos", stats['aciertos'])
+                st.metric("Entradas", stats['entradas'])
+            with col2:
+                st.metric("Fallos", stats['fallos'])
+                st.metric("Tasa", f"{stats['tasa_aciertos']:.0%}")
+            st.caption(
+                f"Sesión: {stats['bytes_sesion'] / 1e6:,.1f} MB • "
+                f"Global: {stats['bytes_global'] / 1e6:,.1f} MB • "
+                f"Descartes: {stats['descartes']}"
+            )
+
+    def mostrar_memoria_sesion(self):
+        """Medir la memoria de las tablas de la sesión y lo que ahorra la representación compacta"""
+        with st.expander("🧠 Memoria de la Sesión"):
+            st.caption("Productos y aranceles se guardan con categóricas, números de 32 bits y textos internados.")
+            if not st.button("📏 Medir Memoria", use_container_width=True, key="btn_medir_memoria"):
+                return
+            tablas = memoria_tablas({
+                'Productos': st.session_state.productos,
+                'Aranceles': st.session_state.aranceles,
+                'Landed Cost': st.session_state.landed_cost,
+                'Ventas': st.session_state.ventas,
+                'Escenarios': st.session_state.escenarios
+            })
+            for fila in tablas.itertuples():
+                st.caption(f"{fila.tabla}: {fila.filas:,} filas • {fila.bytes / 1e6:,.2f} MB")
+            
+            productos = st.session_state.productos
+            # Antes: la tabla ancha con una cadena por celda, como se importa (sin las internadas)
+            reporte = reporte_memoria(expandir(productos, 'productos', copiar_textos=True), productos)
+            total = reporte.iloc[-1]
+            st.metric("Productos compactos", f"{total['bytes_despues'] / 1e6:,.2f} MB",
+                      f"-{total['ahorro']:.0%} vs. {total['bytes_antes'] / 1e6:,.2f} MB", delta_color="inverse")
+            st.dataframe(
+                reporte[['columna', 'tipo_despues', 'bytes_despues', 'ahorro']],
+                column_config={
+                    'columna': st.column_config.TextColumn("Columna"),
+                    'tipo_despues': st.column_config.TextColumn("Tipo"),
+                    'bytes_despues': st.column_config.NumberColumn("Bytes", format="%,d"),
+                    'ahorro': st.column_config.NumberColumn("Ahorro", format="%.1%")
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+
     def pagina_inicio(self):
         """Página de inicio"""
         st.title("🚀 Calculadora de Importaciones Pro")
@@ -204,7 +276,7 @@ class CalculadoraImportacionesStreamlit:
             pasos = [
                 ("⚙️ Configurar parámetros", st.session_state.parametros['USD_COP'] > 0),
                 ("📦 Agregar productos", len(st.session_state.productos) > 0),
-                ("📊 Configurar aranceles", len(st.session_state.aranceles) > 0),
+                ("📊 Configurar aranceles", len(self.aranceles_calculo()) > 0),
                 ("💰 Calcular Landed Cost", not st.session_state.landed_cost.empty),
                 ("🛍️ Calcular ventas", not st.session_state.ventas.empty),
                 ("📈 Analizar escenarios", not st.session_state.escenarios.empty)
@@ -233,8 +305,9 @@ class CalculadoraImportacionesStreamlit:
             
             if st.button("📊 Calcular Todo Automáticamente", use_container_width=True, key="btn_calcular_todo"):
                 with st.spinner("Calculando todos los módulos..."):
-                    self.recalcular_todo()
-                st.success("¡Análisis completo!")
+                    completo = self.recalcular_todo()
+                if completo:
+                    st.success("¡Análisis completo!")
             
             if st.button("🆕 Reiniciar Datos", use_container_width=True, key="btn_reiniciar"):
                 if st.button("⚠️ Confirmar Reinicio", type="secondary", key="btn_confirmar_reinicio"):
@@ -268,7 +341,7 @@ class CalculadoraImportacionesStreamlit:
             completados += 1
         if len(st.session_state.productos) > 0:
             completados += 1
-        if len(st.session_state.aranceles) > 0:
+        if len(self.aranceles_calculo()) > 0:
             completados += 1
         if not st.session_state.landed_cost.empty:
             completados += 1
@@ -292,6 +365,7 @@ class CalculadoraImportacionesStreamlit:
             
             with col1:
                 st.subheader("💱 Tipos de Cambio")
+                self.seccion_historial_tasas()
                 st.session_state.parametros['USD_COP'] = st.number_input(
                     "USD → COP",
                     value=float(st.session_state.parametros['USD_COP']),
@@ -324,6 +398,29 @@ class CalculadoraImportacionesStreamlit:
                     key="flete_input"
                 )
                 
+                st.session_state.parametros['base_flete'] = st.selectbox(
+                    "Prorrateo del flete",
+                    BASES_FLETE,
+                    index=BASES_FLETE.index(st.session_state.parametros['base_flete']),
+                    format_func={'valor': "Por valor FOB", 'peso_cobrable': "Por peso cobrable"}.get,
+                    help="El peso cobrable es el mayor entre el peso real y el volumétrico; "
+                         "evita subcostear productos livianos y voluminosos",
+                    key="base_flete_input"
+                )
+                
+                modos = list(DIVISORES_VOLUMETRICOS)
+                divisor = st.session_state.parametros['divisor_volumetrico']
+                modo = st.selectbox(
+                    "Modo de transporte",
+                    modos,
+                    index=modos.index(next((m for m in modos if DIVISORES_VOLUMETRICOS[m] == divisor), modos[0])),
+                    format_func={'maritimo_lcl': "Marítimo LCL (1:1000)", 'aereo': "Aéreo (1:6000)"}.get,
+                    help="Divisor volumétrico: cm³ por kg cobrable",
+                    disabled=st.session_state.parametros['base_flete'] != 'peso_cobrable',
+                    key="modo_transporte_input"
+                )
+                st.session_state.parametros['divisor_volumetrico'] = DIVISORES_VOLUMETRICOS[modo]
+                
                 st.session_state.parametros['seguro_porcentaje'] = st.number_input(
                     "Seguro (% sobre valor)",
                     value=st.session_state.parametros['seguro_porcentaje'],
@@ -361,6 +458,15 @@ class CalculadoraImportacionesStreamlit:
                     help="IVA aplicable a la importación (19% en Colombia)",
                     key="iva_input"
                 )
+                
+                fecha_aduana = st.session_state.parametros.get('fecha_aduana')
+                st.session_state.parametros['fecha_aduana'] = st.date_input(
+                    "Fecha de Nacionalización",
+                    value=pd.Timestamp(fecha_aduana).date() if fecha_aduana else datetime.now().date(),
+                    help="Se aplican los aranceles vigentes en esta fecha; una fecha futura "
+                         "permite planear cambios de arancel ya anunciados",
+                    key="fecha_aduana_input"
+                ).isoformat()
             
             with col2:
                 st.subheader("🇨🇴 Costos Nacionales (COP)")
@@ -473,13 +579,64 @@ class CalculadoraImportacionesStreamlit:
         
         with col_btn2:
             if st.button("🔄 Recalcular Todo", use_container_width=True, key="btn_recalcular_parametros"):
-                self.recalcular_todo()
-                st.success("✅ Todos los cálculos actualizados")
+                if self.recalcular_todo():
+                    st.success("✅ Todos los cálculos actualizados")
         
         with col_btn3:
             if st.button("📊 Validar Parámetros", use_container_width=True, key="btn_validar_parametros"):
                 self.validar_parametros()
 
+    def seccion_historial_tasas(self):
+        """Tasas de cambio a una fecha desde el historial local, con importación de TRM y registro diario"""
+        historial = st.session_state.historial_tasas
+        with st.expander("📅 Historial de Tasas"):
+            for par in PARES:
+                ultima = historial.ultima_fecha(par)
+                if ultima is None:
+                    st.caption(f"{par}: sin historial")
+                else:
+                    st.caption(f"{par}: {historial.tasa(par):,.4f} al {ultima} "
+                               f"({len(historial.serie(par)[0]):,} días desde {historial.primera_fecha(par)})")
+            
+            fecha = st.date_input("Fecha de cálculo", value=datetime.now().date(), key="fecha_tasas_input")
+            if st.button("Usar tasas de esa fecha", key="btn_tasas_fecha"):
+                parametros = historial.parametros_a_fecha(st.session_state.parametros, fecha)
+                if all(historial.tasa(par, fecha) is None for par in PARES):
+                    st.warning("⚠️ No hay tasas registradas en o antes de esa fecha")
+                else:
+                    st.session_state.parametros.update(parametros)
+                    # Sincronizar los campos de Parámetros, que se dibujan después
+                    st.session_state.usd_cop_input = float(parametros['USD_COP'])
+                    st.session_state.cny_usd_input = float(parametros['CNY_USD'])
+                    # Los aranceles también se toman vigentes a esa fecha
+                    st.session_state.parametros['fecha_aduana'] = fecha.isoformat()
+                    st.session_state.fecha_aduana_input = fecha
+                    st.success(f"✅ Tasas vigentes al {fecha} aplicadas")
+            
+            st.markdown("**Importar archivo de TRM (CSV)**")
+            par_importar = st.selectbox("Par", PARES, key="par_importar_tasas")
+            archivo = st.file_uploader("Archivo", type=['csv'], key="archivo_tasas")
+            if archivo is not None and st.button("📥 Importar", key="btn_importar_tasas"):
+                try:
+                    agregadas = historial.importar_csv(par_importar, archivo)
+                    st.success(f"✅ {agregadas:,} fechas nuevas de {par_importar}")
+                except Exception as e:
+                    st.error(f"❌ Error importando tasas: {str(e)}")
+            
+            with st.form("form_registrar_tasas"):
+                st.markdown("**Registrar tasas del día**")
+                fecha_registro = st.date_input("Fecha", value=datetime.now().date())
+                usd_cop = st.number_input("USD → COP", value=float(st.session_state.parametros['USD_COP']), step=1.0)
+                cny_usd = st.number_input("CNY → USD", value=float(st.session_state.parametros['CNY_USD']),
+                                          step=0.0001, format="%.4f")
+                if st.form_submit_button("Registrar"):
+                    try:
+                        for par, valor in [('USD_COP', usd_cop), ('CNY_USD', cny_usd)]:
+                            historial.registrar(par, fecha_registro, valor)
+                        st.success(f"✅ Tasas del {fecha_registro} registradas")
+                    except ValueError as e:
+                        st.error(f"❌ {str(e)}")
+
     def mostrar_resumen_parametros(self):
         """Mostrar resumen de parámetros"""
         st.subheader("📋 Resumen de Parámetros Actuales")
@@ -547,7 +704,7 @@ class CalculadoraImportacionesStreamlit:
             st.subheader("📋 Lista de Productos")
             
             # Calcular totales automáticamente
-            productos_con_totales = st.session_state.productos.copy()
+            productos_con_totales = expandir(st.session_state.productos, 'productos')
             if not productos_con_totales.empty:
                 productos_con_totales['Total FOB USD'] = productos_con_totales['cantidad'] * productos_con_totales['precio_unitario_usd']
                 productos_con_totales['Peso Total kg'] = productos_con_totales['cantidad'] * productos_con_totales['peso_unitario_kg']
@@ -587,10 +744,14 @@ class CalculadoraImportacionesStreamlit:
                 edited_df = edited_df.drop(['Total FOB USD', 'Peso Total kg', 'Volumen Total m³'], axis=1)
             
             if st.button("💾 Guardar Cambios en Productos", use_container_width=True, type="primary", key="btn_guardar_productos"):
-                st.session_state.productos = edited_df
+                self.guardar_edicion_productos(edited_df, "productos_editor")
                 st.session_state.calculos_realizados = False
                 st.success("✅ Productos actualizados correctamente")
                 st.rerun()
+            
+            self.seccion_importar_excel('productos')
+            self.seccion_sugerencias_hs()
+            self.seccion_validacion()
 
         with col2:
             st.subheader("🚀 Acciones Rápidas")
@@ -600,12 +761,18 @@ class CalculadoraImportacionesStreamlit:
                 st.write("➕ Agregar Producto Rápido")
                 nuevo_sku = st.text_input("SKU*", value=f"SKU_{datetime.now().strftime('%y%m%d%H%M')}", key="nuevo_sku")
                 nueva_desc = st.text_input("Descripción*", key="nueva_desc")
+                nuevo_hs = st.text_input("HS Code", placeholder="Vacío: se sugiere por la descripción", key="nuevo_hs")
                 nueva_cant = st.number_input("Cantidad*", min_value=1, value=100, key="nueva_cant")
                 nuevo_precio = st.number_input("Precio USD*", min_value=0.0, value=10.0, step=0.1, key="nuevo_precio")
                 nueva_categoria = st.selectbox("Categoría*", ["Electrónicos", "Hogar", "Moda", "Deportes", "Otros"], key="nueva_categoria")
                 
                 if st.form_submit_button("🎯 Agregar Producto", use_container_width=True):
                     if nuevo_sku and nueva_desc:
+                        if not nuevo_hs:
+                            sugerencias = self.indice_descripciones().sugerir(nueva_desc, limite=1)
+                            if not sugerencias.empty and sugerencias['puntaje'].iloc[0] >= PUNTAJE_MINIMO:
+                                nuevo_hs = sugerencias['hs_code'].iloc[0]
+                                st.info(f"🔎 HS Code sugerido: {nuevo_hs} ({sugerencias['descripcion'].iloc[0]})")
                         nuevo_producto = {
                             'sku': nuevo_sku,
                             'descripcion': nueva_desc,
@@ -613,15 +780,15 @@ class CalculadoraImportacionesStreamlit:
                             'peso_unitario_kg': 0.1,
                             'volumen_unitario_m3': 0.001,
                             'precio_unitario_usd': nuevo_precio,
-                            'hs_code': '',
+                            'hs_code': nuevo_hs,
                             'incoterm': 'FOB',
                             'categoria': nueva_categoria
                         }
                         
-                        st.session_state.productos = pd.concat([
+                        st.session_state.productos = compactar(pd.concat([
                             st.session_state.productos,
                             pd.DataFrame([nuevo_producto])
-                        ], ignore_index=True)
+                        ], ignore_index=True), 'productos')
                         
                         st.success(f"✅ Producto {nuevo_sku} agregado")
                         st.session_state.calculos_realizados = False
@@ -661,6 +828,168 @@ class CalculadoraImportacionesStreamlit:
             else:
                 st.info("No hay productos registrados")
 
+    def seccion_importar_excel(self, esquema):
+        """Importar productos (proformas de proveedor) o aranceles desde un libro de Excel"""
+        with st.expander("📥 Importar desde Excel"):
+            st.caption("Los encabezados se reconocen automáticamente (español o inglés); "
+                       "las filas de totales y notas se omiten.")
+            if esquema == 'aranceles' and obtener_base() is not None:
+                st.caption("Las filas importadas prevalecen sobre el arancel completo para sus HS Codes.")
+            archivo = st.file_uploader("Archivo XLSX", type=['xlsx', 'xlsm'], key=f"archivo_importar_{esquema}")
+            if archivo is None:
+                return
+            hojas = hojas_xlsx(archivo)
+            hoja = st.selectbox("Hoja", hojas, key=f"hoja_importar_{esquema}") if len(hojas) > 1 else hojas[0]
+            modo = st.radio("Filas importadas", ["Agregar a la tabla actual", "Reemplazar la tabla"],
+                            horizontal=True, key=f"modo_importar_{esquema}")
+            
+            if st.button("📥 Importar", key=f"btn_importar_{esquema}"):
+                barra = st.progress(0.0, text="Leyendo archivo...")
+                
+                def progreso(filas, total):
+                    barra.progress(min(filas / total, 1.0) if total else 0.0, text=f"{filas:,} filas leídas")
+                
+                try:
+                    archivo.seek(0)
+                    importadas = leer_xlsx(archivo, esquema, hoja=hoja, progreso=progreso)
+                except Exception as e:
+                    st.error(f"❌ Error importando: {str(e)}")
+                    return
+                
+                tabla = importadas
+                if modo == "Agregar a la tabla actual":
+                    tabla = pd.concat([st.session_state[esquema], importadas], ignore_index=True)
+                st.session_state[esquema] = compactar(tabla, esquema)
+                st.session_state.calculos_realizados = False
+                st.success(f"✅ {len(importadas):,} filas importadas")
+                st.rerun()
+
+    def seccion_sugerencias_hs(self):
+        """Sugerir HS Codes por descripción a los productos sin código o con uno desconocido"""
+        productos = st.session_state.productos
+        if productos.empty:
+            return
+        faltantes = int(codigos_faltantes(productos, self.aranceles_calculo()).sum())
+        if faltantes == 0:
+            return
+        
+        with st.expander(f"🔎 Sugerir HS Codes ({faltantes} productos sin código reconocido)"):
+            st.caption("Estos productos pagarían el arancel por defecto. Las sugerencias comparan su descripción "
+                       "con el arancel y con los productos ya clasificados.")
+            sugerencias = sugerir_hs_codes(productos, self.aranceles_busqueda())
+            if sugerencias.empty:
+                st.info("No se encontraron descripciones parecidas")
+                return
+            sugerencias.insert(0, 'aplicar', sugerencias['puntaje'] >= PUNTAJE_MINIMO)
+            
+            revisadas = st.data_editor(
+                sugerencias,
+                column_config={
+                    'aplicar': st.column_config.CheckboxColumn("Aplicar"),
+                    'fila': None,
+                    'sku': st.column_config.TextColumn("SKU", disabled=True),
+                    'descripcion_producto': st.column_config.TextColumn("Producto", disabled=True),
+                    'hs_code': st.column_config.TextColumn("HS Code Sugerido", disabled=True),
+                    'descripcion_arancel': st.column_config.TextColumn("Descripción Similar", disabled=True),
+                    'puntaje': st.column_config.ProgressColumn("Similitud", min_value=0.0, max_value=1.0, format="%.2f")
+                },
+                hide_index=True,
+                use_container_width=True,
+                key="sugerencias_hs_editor"
+            )
+            
+            if st.button("✅ Aplicar HS Codes Seleccionados", key="btn_aplicar_hs"):
+                aplicar = revisadas[revisadas['aplicar']]
+                # Sobre la tabla expandida: los códigos nuevos no están entre las categorías
+                productos = expandir(productos, 'productos')
+                productos.loc[productos.index[aplicar['fila'].to_numpy()], 'hs_code'] = aplicar['hs_code'].to_numpy()
+                st.session_state.productos = compactar(productos, 'productos')
+                st.session_state.calculos_realizados = False
+                st.success(f"✅ {len(aplicar)} HS Codes aplicados")
+                st.rerun()
+
+    def guardar_edicion_productos(self, edited_df, clave_editor):
+        """Guardar productos editados y refrescar el Landed Cost solo en las filas modificadas"""
+        estado = st.session_state.get(clave_editor, {})
+        motor = st.session_state.get('motor_landed_cost')
+        solo_ediciones = not estado.get('added_rows') and not estado.get('deleted_rows')
+        filas = [int(fila) for fila in estado.get('edited_rows', {})]
+        if solo_ediciones:
+            # Solo las filas editadas pasan a la representación compacta
+            edited_df = actualizar_filas(st.session_state.productos, edited_df, filas, 'productos')
+        else:
+            edited_df = compactar(edited_df, 'productos')
+        
+        if (
+            motor is not None and solo_ediciones and
+            motor.vigente(st.session_state.productos, self.aranceles_calculo(), st.session_state.parametros) and
+            motor.admite_edicion(edited_df, self.aranceles_calculo(), st.session_state.parametros)
+        ):
+            motor.actualizar(edited_df, filas)
+            if not st.session_state.landed_cost.empty:
+                st.session_state.landed_cost = motor.resultado(st.session_state.parametros)
+        
+        st.session_state.productos = edited_df
+
+    def aranceles_calculo(self):
+        """Aranceles para calcular: la base compartida con las ediciones de la sesión encima"""
+        return tabla_vigente(st.session_state.aranceles)
+
+    def validar_catalogo(self):
+        """Reporte de validación del catálogo, recalculado solo si cambian los datos"""
+        productos = st.session_state.productos
+        aranceles = self.aranceles_calculo()
+        parametros = st.session_state.parametros
+        clave = huella_entradas('validacion', productos, aranceles, prorratea_por_peso(parametros))
+        return st.session_state.cache_resultados.memoizar(
+            clave, lambda: validar_productos(productos, aranceles, parametros)
+        )
+
+    def mostrar_reporte_validacion(self, reporte):
+        """Tabla de reglas violadas: severidad, filas afectadas y SKUs de ejemplo"""
+        st.dataframe(
+            reporte.drop(columns='regla'),
+            column_config={
+                'severidad': st.column_config.TextColumn("Severidad"),
+                'mensaje': st.column_config.TextColumn("Problema"),
+                'filas': st.column_config.NumberColumn("Filas", format="%,d"),
+                'ejemplos': st.column_config.TextColumn("Ejemplos")
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+
+    def seccion_validacion(self):
+        """Revisar el catálogo completo antes de calcular"""
+        if st.session_state.productos.empty:
+            return
+        try:
+            reporte = self.validar_catalogo()
+        except Exception as e:
+            st.error(f"❌ Error validando productos: {str(e)}")
+            return
+        errores = int((reporte['severidad'] == 'error').sum())
+        if reporte.empty:
+            titulo = "🔍 Validación del Catálogo: sin problemas"
+        else:
+            titulo = f"🔍 Validación del Catálogo: {errores} errores, {len(reporte) - errores} advertencias"
+        with st.expander(titulo, expanded=errores > 0):
+            if reporte.empty:
+                st.success("✅ Todos los productos pasan las validaciones")
+            else:
+                if errores:
+                    st.caption("Los errores impiden calcular el Landed Cost; las advertencias solo se informan.")
+                self.mostrar_reporte_validacion(reporte)
+
+    def aranceles_busqueda(self):
+        """Aranceles del cálculo con sus descripciones, para sugerir HS Codes"""
+        return tabla_vigente(st.session_state.aranceles, columnas=['hs_code', 'descripcion', 'arancel_porcentaje',
+                                                                   'iva_porcentaje', 'otros_impuestos'])
+
+    def indice_descripciones(self):
+        """Índice de descripciones del arancel y de los productos ya clasificados"""
+        return obtener_indice_descripciones(self.aranceles_busqueda(), st.session_state.productos)
+
     def pagina_aranceles(self):
         """Página de gestión de aranceles"""
         st.header("📊 Gestión de Aranceles e Impuestos")
@@ -670,8 +999,16 @@ class CalculadoraImportacionesStreamlit:
         with col1:
             st.subheader("🏛️ Tabla de Aranceles por HS Code")
             
+            base = obtener_base()
+            if base is not None:
+                st.caption(
+                    f"Arancel completo cargado: {len(base):,} subpartidas"
+                    f"{f' (versión {base.version})' if base.version else ''}. "
+                    "Aquí solo se editan las subpartidas que cambian o faltan; prevalecen sobre la base."
+                )
+            
             edited_df = st.data_editor(
-                st.session_state.aranceles,
+                expandir(st.session_state.aranceles, 'aranceles'),
                 num_rows="dynamic",
                 use_container_width=True,
                 column_config={
@@ -681,18 +1018,36 @@ class CalculadoraImportacionesStreamlit:
                     "iva_porcentaje": st.column_config.NumberColumn("IVA %", format="%.1%", min_value=0.0, max_value=1.0, step=0.01),
                     "otros_impuestos": st.column_config.NumberColumn("Otros %", format="%.1%", min_value=0.0, max_value=1.0, step=0.01),
                     "fuente": st.column_config.TextColumn("Fuente"),
-                    "fecha_actualizacion": st.column_config.DateColumn("Fecha Actualización")
+                    "fecha_actualizacion": st.column_config.DateColumn(
+                        "Vigente Desde", help="Fecha desde la que rigen estas tasas; repita el HS Code para versiones"
+                    )
                 },
                 key="aranceles_editor"
             )
             
             if st.button("💾 Guardar Cambios en Aranceles", use_container_width=True, type="primary", key="btn_guardar_aranceles"):
-                st.session_state.aranceles = edited_df
+                st.session_state.aranceles = compactar(edited_df, 'aranceles')
                 st.session_state.calculos_realizados = False
                 st.success("✅ Aranceles actualizados correctamente")
                 st.rerun()
+            
+            self.seccion_importar_excel('aranceles')
 
         with col2:
+            st.subheader("🔎 Buscar HS Code")
+            busqueda = st.text_input("Descripción del producto", placeholder="ej. audífonos inalámbricos",
+                                     key="buscar_hs_descripcion")
+            if busqueda:
+                resultados = self.indice_descripciones().sugerir(busqueda)
+                if resultados.empty:
+                    st.info("Sin coincidencias")
+                else:
+                    st.dataframe(
+                        resultados[['hs_code', 'descripcion', 'puntaje']].style.format({'puntaje': '{:.2f}'}),
+                        use_container_width=True,
+                        hide_index=True
+                    )
+            
             st.subheader("📥 Agregar HS Code")
             with st.form("nuevo_hs_code"):
                 hs_code = st.text_input("HS Code*", placeholder="ej. 8518.30.00", key="nuevo_hs_code")
@@ -701,6 +1056,8 @@ class CalculadoraImportacionesStreamlit:
                 iva = st.number_input("IVA %*", min_value=0.0, max_value=1.0, value=0.19, step=0.01, format="%.3f", key="nuevo_iva")
                 otros = st.number_input("Otros Impuestos %", min_value=0.0, max_value=1.0, value=0.0, step=0.01, format="%.3f", key="nuevos_otros")
                 fuente = st.text_input("Fuente", value="DIAN", key="nueva_fuente")
+                vigente_desde = st.date_input("Vigente desde", value=datetime.now().date(), key="nueva_vigencia_hs",
+                                              help="Para un cambio anunciado, agregue el mismo HS Code con su fecha")
                 
                 if st.form_submit_button("➕ Agregar HS Code", use_container_width=True, key="btn_agregar_hs"):
                     if hs_code and descripcion:
@@ -711,13 +1068,13 @@ class CalculadoraImportacionesStreamlit:
                             'iva_porcentaje': iva,
                             'otros_impuestos': otros,
                             'fuente': fuente,
-                            'fecha_actualizacion': datetime.now().date()
+                            'fecha_actualizacion': vigente_desde
                         }
                         
-                        st.session_state.aranceles = pd.concat([
+                        st.session_state.aranceles = compactar(pd.concat([
                             st.session_state.aranceles,
                             pd.DataFrame([nuevo_arancel])
-                        ], ignore_index=True)
+                        ], ignore_index=True), 'aranceles')
                         
                         st.success(f"✅ HS Code {hs_code} agregado")
                         st.session_state.calculos_realizados = False
@@ -727,10 +1084,11 @@ class CalculadoraImportacionesStreamlit:
             
             # Estadísticas de aranceles
             st.subheader("📈 Resumen Aranceles")
-            if not st.session_state.aranceles.empty:
-                avg_arancel = st.session_state.aranceles['arancel_porcentaje'].mean()
-                max_arancel = st.session_state.aranceles['arancel_porcentaje'].max()
-                min_arancel = st.session_state.aranceles['arancel_porcentaje'].min()
+            aranceles = self.aranceles_calculo()
+            if not aranceles.empty:
+                avg_arancel = aranceles['arancel_porcentaje'].mean()
+                max_arancel = aranceles['arancel_porcentaje'].max()
+                min_arancel = aranceles['arancel_porcentaje'].min()
                 
                 st.metric("Arancel Promedio", f"{avg_arancel:.1%}")
                 st.metric("Arancel Máximo", f"{max_arancel:.1%}")
@@ -747,10 +1105,12 @@ class CalculadoraImportacionesStreamlit:
             st.error("❌ Primero agregue productos en la pestaña '📦 Productos'")
             return
         
-        if st.session_state.aranceles.empty:
+        if self.aranceles_calculo().empty:
             st.error("❌ Primero configure aranceles en la pestaña '📊 Aranceles'")
             return
         
+        self.seccion_contenedores()
+        
         col1, col2 = st.columns([2, 1])
         
         with col1:
@@ -815,12 +1175,13 @@ class CalculadoraImportacionesStreamlit:
             **🧮 Fórmulas aplicadas:**
             
             **Valor FOB USD** = Cantidad × Precio Unitario
-            **Flete Proporcional** = (Valor FOB / Total FOB) × Flete Internacional  
+            **Peso Cobrable** = máx(Peso real, Volumen cm³ / Divisor volumétrico)
+            **Flete Proporcional** = (Peso Cobrable / Total Peso Cobrable) × Flete Internacional (o por Valor FOB, según el parámetro)  
             **Seguro** = Valor FOB × % Seguro
             **Valor CIF USD** = FOB + Flete + Seguro
             **Valor CIF COP** = CIF USD × Tipo Cambio
             
-            **Arancel** = CIF COP × % Arancel
+            **Arancel** = CIF COP × % Arancel (HS Code exacto, o por subpartida, partida o capítulo; 10% si no hay coincidencia)
             **IVA** = (CIF COP + Arancel) × % IVA
             **Costos Nacionales** = Proporcional por cantidad
             
@@ -863,73 +1224,27 @@ class CalculadoraImportacionesStreamlit:
     def calcular_landed_cost(self):
         """Calcular Landed Cost para todos los productos"""
         try:
-            parametros = st.session_state.parametros
             productos = st.session_state.productos
-            aranceles = st.session_state.aranceles
-            
-            usd_cop = parametros['USD_COP']
-            flete = parametros['flete_internacional']
-            seguro = parametros['seguro_porcentaje']
-            iva = parametros['iva_importacion']
-            costos_nacionales = (
-                parametros['despacho_aduana'] +
-                parametros['transporte_interno'] + 
-                parametros['almacenaje']
-            )
+            aranceles = self.aranceles_calculo()
+            parametros = st.session_state.parametros
             
-            resultados = []
-            total_fob_usd = (productos['cantidad'] * productos['precio_unitario_usd']).sum()
+            # Los errores del catálogo (cantidades en cero, SKUs repetidos...) bloquean el cálculo
+            reporte = self.validar_catalogo()
+            if (reporte['severidad'] == 'error').any():
+                st.error("❌ El catálogo tiene errores que impiden calcular el Landed Cost")
+                self.mostrar_reporte_validacion(reporte)
+                return
+            if not reporte.empty:
+                st.warning(f"⚠️ {len(reporte)} advertencias en el catálogo: "
+                           f"{'; '.join(reporte['mensaje'])} (detalle en Productos → Validación del Catálogo)")
             
-            for _, producto in productos.iterrows():
-                # Cálculos básicos
-                valor_fob_usd = producto['cantidad'] * producto['precio_unitario_usd']
-                flete_proporcional = (valor_fob_usd / total_fob_usd) * flete if total_fob_usd > 0 else 0
-                seguro_proporcional = valor_fob_usd * seguro
-                
-                valor_cif_usd = valor_fob_usd + flete_proporcional + seguro_proporcional
-                valor_cif_cop = valor_cif_usd * usd_cop
-                
-                # Buscar arancel
-                arancel_info = aranceles[aranceles['hs_code'] == producto['hs_code']]
-                if not arancel_info.empty:
-                    arancel_porcentaje = arancel_info['arancel_porcentaje'].iloc[0]
-                    iva_porcentaje = arancel_info['iva_porcentaje'].iloc[0]
-                    otros_impuestos = arancel_info['otros_impuestos'].iloc[0]
-                else:
-                    # Valores por defecto si no encuentra HS Code
-                    arancel_porcentaje = 0.10  # 10% por defecto
-                    iva_porcentaje = iva
-                    otros_impuestos = 0.0
-                
-                arancel_cop = valor_cif_cop * arancel_porcentaje
-                iva_cop = (valor_cif_cop + arancel_cop) * iva_porcentaje
-                otros_impuestos_cop = valor_cif_cop * otros_impuestos
-                
-                # Costos nacionales proporcionales
-                costos_nacionales_prop = (producto['cantidad'] / productos['cantidad'].sum()) * costos_nacionales
-                
-                # Ajustar por pérdidas
-                factor_perdidas = 1 + parametros['porcentaje_perdidas']
-                
-                costo_total = (valor_cif_cop + arancel_cop + iva_cop + otros_impuestos_cop + costos_nacionales_prop) * factor_perdidas
-                costo_unitario = costo_total / producto['cantidad'] if producto['cantidad'] > 0 else 0
-                
-                resultados.append({
-                    'sku': producto['sku'],
-                    'descripcion': producto['descripcion'],
-                    'cantidad': producto['cantidad'],
-                    'cif_usd': valor_cif_usd,
-                    'cif_cop': valor_cif_cop,
-                    'arancel_cop': arancel_cop,
-                    'iva_cop': iva_cop,
-                    'otros_impuestos_cop': otros_impuestos_cop,
-                    'costos_nacionales': costos_nacionales_prop,
-                    'costo_total': costo_total,
-                    'costo_unitario': costo_unitario,
-                    'factor_perdidas': factor_perdidas
-                })
+            # Reutilizar el motor incremental si sigue sincronizado con los datos
+            motor = st.session_state.get('motor_landed_cost')
+            if motor is None or not motor.vigente(productos, aranceles, parametros):
+                motor = LandedCostIncremental(productos, aranceles, parametros)
+                st.session_state.motor_landed_cost = motor
             
-            st.session_state.landed_cost = pd.DataFrame(resultados)
+            st.session_state.landed_cost = motor.resultado(parametros)
             st.session_state.calculos_realizados = True
             st.success("✅ Landed Cost calculado correctamente")
             
@@ -937,6 +1252,76 @@ class CalculadoraImportacionesStreamlit:
             st.error(f"❌ Error en el cálculo: {str(e)}")
             st.info("💡 Verifique que todos los productos tengan HS Code válido en la tabla de aranceles")
 
+    def seccion_contenedores(self):
+        """Estimar contenedores FCL/LCL del embarque y usar su costo como flete internacional"""
+        with st.expander("🚢 Estimación de Contenedores (FCL/LCL)"):
+            col1, col2 = st.columns([2, 1])
+            with col1:
+                tipos = st.data_editor(
+                    pd.DataFrame.from_dict(tipos_contenedor(), orient='index').rename_axis('tipo').reset_index(),
+                    column_config={
+                        'tipo': st.column_config.TextColumn("Tipo", disabled=True),
+                        'volumen_m3': st.column_config.NumberColumn("Volumen (m³)", min_value=1.0, format="%.1f"),
+                        'peso_max_kg': st.column_config.NumberColumn("Peso Máx. (kg)", min_value=1.0, format="%,.0f"),
+                        'costo_usd': st.column_config.NumberColumn("Costo (USD)", min_value=0.0, format="$%,.0f")
+                    },
+                    hide_index=True,
+                    use_container_width=True,
+                    key="tipos_contenedor_editor"
+                )
+            with col2:
+                tarifa_lcl = st.number_input("Tarifa LCL (USD por W/M)", value=TARIFA_LCL_USD_WM, min_value=0.0,
+                                             step=5.0, key="tarifa_lcl_input")
+                aprovechamiento = st.slider("Aprovechamiento del volumen (%)", 50, 100,
+                                            int(APROVECHAMIENTO_POR_DEFECTO * 100), key="aprovechamiento_input")
+            
+            clave = huella_entradas(
+                'contenedores', st.session_state.productos, tipos, [tarifa_lcl, aprovechamiento]
+            )
+            try:
+                estimacion = st.session_state.cache_resultados.memoizar(clave, lambda: estimar_contenedores(
+                    st.session_state.productos,
+                    tipos.set_index('tipo').to_dict(orient='index'),
+                    tarifa_lcl=tarifa_lcl,
+                    aprovechamiento=aprovechamiento / 100
+                ))
+            except Exception as e:
+                st.error(f"❌ Error estimando contenedores: {str(e)}")
+                return
+            
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Volumen Total", f"{estimacion['volumen_m3']:,.1f} m³")
+            with col2:
+                st.metric("Peso Total", f"{estimacion['peso_kg']:,.0f} kg")
+            with col3:
+                st.metric("Contenedores", " + ".join(
+                    f"{n}×{tipo}" for tipo, n in estimacion['contenedores'].items() if n
+                ) or "Solo LCL")
+            with col4:
+                st.metric("Flete Estimado", f"${estimacion['costo_flete_usd']:,.0f} USD")
+            
+            st.dataframe(
+                estimacion['plan'].style.format({
+                    'volumen_m3': '{:,.2f}',
+                    'peso_kg': '{:,.0f}',
+                    'ocupacion_volumen': '{:.1%}',
+                    'ocupacion_peso': '{:.1%}',
+                    'costo_usd': '${:,.0f}'
+                }, na_rep='-'),
+                use_container_width=True,
+                hide_index=True
+            )
+            if not estimacion['lcl'].empty:
+                st.caption(f"📦 {len(estimacion['lcl'])} SKUs con carga en LCL "
+                           f"({estimacion['lcl']['volumen_m3'].sum():,.2f} m³)")
+            
+            if st.button("✅ Usar como Flete Internacional", key="btn_usar_flete_contenedores"):
+                # También el valor del campo de Parámetros, para que no lo sobrescriba al volver
+                st.session_state.parametros['flete_internacional'] = float(estimacion['costo_flete_usd'])
+                st.session_state.flete_input = float(estimacion['costo_flete_usd'])
+                self.calcular_landed_cost()
+
     def pagina_ventas(self):
         """Página de simulación de ventas"""
         st.header("🛍️ Simulación de Ventas y Rentabilidad")
@@ -967,7 +1352,8 @@ class CalculadoraImportacionesStreamlit:
                         'packaging': '${:,.0f}',
                         'precio_neto': '${:,.0f}',
                         'rentabilidad': '{:.1%}',
-                        'markup': '{:.1f}x'
+                        'markup': '{:.1f}x',
+                        'precio_equilibrio': '${:,.0f}'
                     }),
                     use_container_width=True,
                     height=400
@@ -1007,6 +1393,8 @@ class CalculadoraImportacionesStreamlit:
                         barmode='group'
                     )
                     st.plotly_chart(fig_precios, use_container_width=True)
+                    
+                    self.mostrar_tabla_precios()
                 
                 with tab3:
                     self.mostrar_recomendaciones_ventas()
@@ -1019,7 +1407,8 @@ class CalculadoraImportacionesStreamlit:
             st.write("""
             **🧮 Fórmulas aplicadas:**
             
-            **Precio Venta** = Costo Landed / (1 - Margen Objetivo)
+            **Precio Venta** = (Costo Landed × (1 + Margen Objetivo) + Envío + Packaging) / (1 - % Comisión)
+            **Precio Equilibrio** = (Costo Landed + Envío + Packaging) / (1 - % Comisión)
             **Comisión ML** = Precio Venta × % Comisión (según categoría)
             **Precio Neto** = Precio Venta - Comisión - Envío - Packaging
             **Rentabilidad** = (Precio Neto - Costo Landed) / Costo Landed
@@ -1041,12 +1430,40 @@ class CalculadoraImportacionesStreamlit:
                 st.metric("📉 Peor Producto", f"{peor_producto['rentabilidad']:.1%}")
                 
                 # Productos que no alcanzan margen objetivo
-                productos_bajos = st.session_state.ventas[st.session_state.ventas['rentabilidad'] < margen_objetivo]
+                productos_bajos = st.session_state.ventas[bajo_margen(st.session_state.ventas['rentabilidad'], margen_objetivo)]
                 if not productos_bajos.empty:
                     st.warning(f"⚠️ {len(productos_bajos)} productos no alcanzan el margen objetivo")
                     for _, producto in productos_bajos.iterrows():
                         st.write(f"• {producto['sku']}: {producto['rentabilidad']:.1%}")
 
+    def mostrar_tabla_precios(self):
+        """Precios de lista por SKU para varios márgenes objetivo"""
+        st.write("**📐 Tabla de Precios por Margen**")
+        margenes = st.multiselect(
+            "Márgenes objetivo (%)",
+            options=[0, 10, 15, 20, 25, 30, 35, 40, 45, 50, 60],
+            default=[20, 35, 50],
+            key="margenes_tabla_precios"
+        )
+        if not margenes:
+            return
+        
+        tabla = calcular_tabla_precios(
+            st.session_state.landed_cost,
+            st.session_state.productos,
+            st.session_state.parametros,
+            [m / 100 for m in sorted(margenes)]
+        )
+        columnas_precio = [c for c in tabla.columns if c.startswith('precio_')]
+        st.dataframe(
+            tabla.style.format({
+                'costo_landed': '${:,.0f}',
+                'comision_porcentaje': '{:.1%}',
+                **{c: '${:,.0f}' for c in columnas_precio}
+            }),
+            use_container_width=True
+        )
+
     def mostrar_recomendaciones_ventas(self):
         """Mostrar recomendaciones basadas en el análisis de ventas"""
         if st.session_state.ventas.empty:
@@ -1056,8 +1473,8 @@ class CalculadoraImportacionesStreamlit:
         margen_objetivo = st.session_state.parametros['margen_objetivo']
         
         # Análisis
-        productos_sobre_margen = ventas[ventas['rentabilidad'] >= margen_objetivo]
-        productos_bajo_margen = ventas[ventas['rentabilidad'] < margen_objetivo]
+        productos_sobre_margen = ventas[~bajo_margen(ventas['rentabilidad'], margen_objetivo)]
+        productos_bajo_margen = ventas[bajo_margen(ventas['rentabilidad'], margen_objetivo)]
         
         st.subheader("🎯 Recomendaciones Estratégicas")
         
@@ -1086,54 +1503,11 @@ class CalculadoraImportacionesStreamlit:
                 st.warning("⚠️ Primero calcula el Landed Cost")
                 return
             
-            parametros = st.session_state.parametros
-            landed_cost = st.session_state.landed_cost
-            productos = st.session_state.productos
-            
-            margen = parametros['margen_objetivo']
-            packaging = parametros['costo_packaging']
-            envio = parametros['costo_envio_local']
-            
-            resultados = []
-            
-            for _, landed in landed_cost.iterrows():
-                producto = productos[productos['sku'] == landed['sku']].iloc[0]
-                costo_unitario = landed['costo_unitario']
-                categoria = producto['categoria']
-                
-                # Determinar comisión según categoría
-                if categoria == 'Electrónicos':
-                    comision_ml = parametros['comision_ml_electronicos']
-                elif categoria == 'Hogar':
-                    comision_ml = parametros['comision_ml_hogar']
-                elif categoria == 'Moda':
-                    comision_ml = parametros['comision_ml_moda']
-                else:
-                    comision_ml = 0.15  # Default
-                
-                # Cálculos de venta
-                precio_venta = costo_unitario / (1 - margen)
-                comision = precio_venta * comision_ml
-                precio_neto = precio_venta - comision - envio - packaging
-                rentabilidad = (precio_neto - costo_unitario) / costo_unitario
-                markup = precio_venta / costo_unitario
-                
-                resultados.append({
-                    'sku': landed['sku'],
-                    'descripcion': landed['descripcion'],
-                    'categoria': categoria,
-                    'costo_landed': costo_unitario,
-                    'precio_venta': precio_venta,
-                    'comision_ml': comision,
-                    'comision_porcentaje': comision_ml,
-                    'envio': envio,
-                    'packaging': packaging,
-                    'precio_neto': precio_neto,
-                    'rentabilidad': rentabilidad,
-                    'markup': markup
-                })
-            
-            st.session_state.ventas = pd.DataFrame(resultados)
+            st.session_state.ventas = calcular_ventas(
+                st.session_state.landed_cost,
+                st.session_state.productos,
+                st.session_state.parametros
+            )
             st.session_state.calculos_realizados = True
             st.success("✅ Ventas calculadas correctamente")
             
@@ -1164,8 +1538,10 @@ class CalculadoraImportacionesStreamlit:
                     st.session_state.escenarios.style.format({
                         'tipo_cambio': '{:,.0f}',
                         'arancel_porcentaje': '{:.1%}',
+                        'factor_arancel': '{:.2f}x',
                         'flete_usd': '{:,.0f}',
                         'costo_promedio': '{:,.0f}',
+                        'costo_total': '{:,.0f}',
                         'rentabilidad_promedio': '{:.1%}',
                         'impacto_rentabilidad': '{:+.1%}'
                     }),
@@ -1219,30 +1595,37 @@ class CalculadoraImportacionesStreamlit:
 
         with col2:
             st.subheader("🎯 Configuración de Escenarios")
-            st.write("""
-            **Escenarios predefinidos:**
-            
-            **🟢 Optimista:**
-            - USD → COP: 4,200 (+10%)
-            - Arancel: 4% (-33%)
-            - Flete: $2,200 USD (-12%)
-            
-            **🟡 Base:**
-            - USD → COP: 3,800  
-            - Arancel: 6%
-            - Flete: $2,500 USD
-            
-            **🔴 Pesimista:**
-            - USD → COP: 3,400 (-10%)
-            - Arancel: 8% (+33%)
-            - Flete: $2,800 USD (+12%)
-            """)
+            st.write("**Escenarios predefinidos:**")
+            predefinidos = self.definir_escenarios()
+            iconos = {'Optimista': '🟢', 'Base': '🟡', 'Pesimista': '🔴'}
+            for escenario in predefinidos.head(3).itertuples():
+                st.markdown(
+                    f"**{iconos.get(escenario.escenario, '⚪')} {escenario.escenario}:**  \n"
+                    f"- USD → COP: {escenario.tipo_cambio:,.0f}  \n"
+                    f"- Arancel: {escenario.factor_arancel:.2f}x la tasa de cada SKU  \n"
+                    f"- Flete: ${escenario.flete_usd:,.0f} USD"
+                )
+            st.caption("Cada escenario recalcula el Landed Cost de todo el catálogo con precios de lista del caso base.")
             
             # Personalizar escenarios
             with st.expander("⚙️ Personalizar Escenarios"):
                 st.number_input("Variación Tipo Cambio (%)", value=10.0, key="var_tc")
                 st.number_input("Variación Arancel (%)", value=33.0, key="var_arancel")
                 st.number_input("Variación Flete (%)", value=12.0, key="var_flete")
+                
+                st.write("**Escenarios adicionales:**")
+                st.session_state.escenarios_personalizados = st.data_editor(
+                    st.session_state.escenarios_personalizados_base,
+                    num_rows="dynamic",
+                    column_config={
+                        'escenario': st.column_config.TextColumn("Escenario", required=True),
+                        'tipo_cambio': st.column_config.NumberColumn("USD → COP", min_value=0.0, required=True),
+                        'flete_usd': st.column_config.NumberColumn("Flete USD", min_value=0.0, required=True),
+                        'factor_arancel': st.column_config.NumberColumn("Factor Arancel", min_value=0.0, required=True)
+                    },
+                    use_container_width=True,
+                    key="escenarios_personalizados_editor"
+                )
             
             if not st.session_state.escenarios.empty:
                 st.subheader("📋 Recomendaciones")
@@ -1255,65 +1638,251 @@ class CalculadoraImportacionesStreamlit:
                     st.warning("⚠️ Negocio viable solo en escenarios favorables")
                 else:
                     st.error("❌ Reconsiderar el negocio en todos los escenarios")
+        
+        st.markdown("---")
+        self.seccion_sensibilidad()
+        
+        st.markdown("---")
+        self.seccion_grilla()
+        
+        st.markdown("---")
+        self.seccion_montecarlo()
+
+    def seccion_sensibilidad(self):
+        """Tornado de impacto de cada parámetro sobre la utilidad del portafolio"""
+        st.subheader("🌪️ Sensibilidad por Parámetro")
+        
+        col1, col2 = st.columns([2, 1])
+        with col2:
+            variacion = st.slider("Variación de cada parámetro (%)", 1, 50, 10, key="variacion_sensibilidad")
+            if st.button("🌪️ Analizar Sensibilidad", use_container_width=True, key="btn_sensibilidad"):
+                with st.spinner("Evaluando todos los parámetros..."):
+                    try:
+                        st.session_state.sensibilidad = analizar_sensibilidad(
+                            st.session_state.productos,
+                            self.aranceles_calculo(),
+                            st.session_state.parametros,
+                            variacion=variacion / 100
+                        )
+                    except Exception as e:
+                        st.error(f"❌ Error en el análisis: {str(e)}")
+        
+        with col1:
+            if 'sensibilidad' not in st.session_state:
+                st.info("👉 Analiza qué parámetros mueven más la utilidad del negocio")
+                return
+            
+            sensibilidad = st.session_state.sensibilidad
+            tornado = sensibilidad['tornado'].iloc[::-1]
+            base = sensibilidad['utilidad_base']
+            
+            fig_tornado = go.Figure()
+            fig_tornado.add_trace(go.Bar(
+                y=tornado['nombre'], x=tornado['utilidad_baja'] - base, orientation='h',
+                name=f"-{sensibilidad['variacion']:.0%}", marker_color='#ef553b'
+            ))
+            fig_tornado.add_trace(go.Bar(
+                y=tornado['nombre'], x=tornado['utilidad_alta'] - base, orientation='h',
+                name=f"+{sensibilidad['variacion']:.0%}", marker_color='#00cc96'
+            ))
+            fig_tornado.update_layout(
+                title=f"Impacto en Utilidad del Portafolio (base ${base:,.0f})",
+                barmode='overlay', xaxis_title='Cambio en utilidad (COP)', height=500
+            )
+            st.plotly_chart(fig_tornado, use_container_width=True)
+        
+        with st.expander("📋 Detalle de Sensibilidad"):
+            st.dataframe(
+                sensibilidad['tornado'][[
+                    'nombre', 'valor_base', 'utilidad_baja', 'utilidad_alta',
+                    'rentabilidad_baja', 'rentabilidad_alta', 'rango_utilidad'
+                ]].style.format({
+                    'valor_base': '{:,.4g}',
+                    'utilidad_baja': '${:,.0f}',
+                    'utilidad_alta': '${:,.0f}',
+                    'rentabilidad_baja': '{:.1%}',
+                    'rentabilidad_alta': '{:.1%}',
+                    'rango_utilidad': '${:,.0f}'
+                }),
+                use_container_width=True
+            )
+            st.write("**Parámetro dominante por SKU:**")
+            st.dataframe(
+                sensibilidad['por_sku']['parametro_dominante'].value_counts().rename('skus'),
+                use_container_width=True
+            )
+
+    def seccion_grilla(self):
+        """Mapa de calor de rentabilidad del portafolio sobre dos parámetros"""
+        st.subheader("🗺️ Mapa de Rentabilidad por Dos Parámetros")
+        
+        opciones = list(NOMBRES_PARAMETROS)
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            parametro_x = st.selectbox("Eje X", opciones, index=opciones.index('USD_COP'),
+                                       format_func=NOMBRES_PARAMETROS.get, key="grilla_x")
+        with col2:
+            parametro_y = st.selectbox("Eje Y", opciones, index=opciones.index('flete_internacional'),
+                                       format_func=NOMBRES_PARAMETROS.get, key="grilla_y")
+        with col3:
+            variacion = st.slider("Rango (± %)", 5, 90, 30, key="grilla_variacion")
+        with col4:
+            puntos = st.slider("Resolución", 10, 200, 50, step=10, key="grilla_puntos")
+        
+        if parametro_x == parametro_y:
+            st.warning("Elija dos parámetros distintos")
+            return
+        
+        # Las grillas se guardan por huella de entradas: volver a la página no recalcula
+        clave = huella_entradas(
+            'grilla', st.session_state.parametros, st.session_state.productos, self.aranceles_calculo(),
+            [parametro_x, parametro_y, variacion, puntos]
+        )
+        try:
+            grilla = st.session_state.cache_resultados.memoizar(clave, lambda: barrido_grilla(
+                st.session_state.productos,
+                self.aranceles_calculo(),
+                st.session_state.parametros,
+                parametro_x, rango_parametro(st.session_state.parametros, parametro_x, variacion / 100, puntos),
+                parametro_y, rango_parametro(st.session_state.parametros, parametro_y, variacion / 100, puntos)
+            ))
+        except Exception as e:
+            st.error(f"❌ Error en la grilla: {str(e)}")
+            return
+        
+        fig_grilla = go.Figure()
+        fig_grilla.add_trace(go.Heatmap(
+            x=grilla['valores_x'], y=grilla['valores_y'], z=grilla['rentabilidad'],
+            colorscale='RdYlGn', zmid=0, colorbar=dict(title='Rentabilidad', tickformat='.0%'),
+            hovertemplate='X: %{x:,.4g}<br>Y: %{y:,.4g}<br>Rentabilidad: %{z:.1%}<extra></extra>'
+        ))
+        fig_grilla.add_trace(go.Contour(
+            x=grilla['valores_x'], y=grilla['valores_y'], z=grilla['rentabilidad'],
+            contours=dict(start=0, end=0, size=1, coloring='lines', showlabels=True),
+            line=dict(color='black', width=2, dash='dash'), showscale=False,
+            name='Punto de equilibrio', hoverinfo='skip'
+        ))
+        fig_grilla.add_trace(go.Scatter(
+            x=[st.session_state.parametros[parametro_x]], y=[st.session_state.parametros[parametro_y]],
+            mode='markers', marker=dict(symbol='x', size=12, color='black'), name='Caso base'
+        ))
+        fig_grilla.update_layout(
+            title='Rentabilidad del Portafolio (línea punteada: punto de equilibrio)',
+            xaxis_title=NOMBRES_PARAMETROS[parametro_x], yaxis_title=NOMBRES_PARAMETROS[parametro_y],
+            height=550
+        )
+        st.plotly_chart(fig_grilla, use_container_width=True)
+        
+        if (grilla['rentabilidad'] > 0).all():
+            st.success("✅ Rentable en toda la grilla")
+        elif (grilla['rentabilidad'] <= 0).all():
+            st.error("❌ Sin rentabilidad en ningún punto de la grilla")
+        else:
+            st.info(f"Rentable en el {(grilla['rentabilidad'] > 0).mean():.0%} de la grilla")
+
+    def seccion_montecarlo(self):
+        """Simulación Monte Carlo de tipo de cambio, flete, aranceles y pérdidas"""
+        st.subheader("🎲 Simulación Monte Carlo")
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            n_simulaciones = st.select_slider(
+                "Simulaciones", options=[10_000, 50_000, 100_000, 500_000, 1_000_000], value=10_000,
+                format_func=lambda n: f"{n:,}", key="mc_simulaciones"
+            )
+            semilla = st.number_input("Semilla", value=42, step=1, key="mc_semilla")
+        with col2:
+            vol_tc = st.number_input("Volatilidad Tipo Cambio (%)", value=VOLATILIDADES_POR_DEFECTO['tipo_cambio'] * 100, key="mc_vol_tc")
+            vol_flete = st.number_input("Volatilidad Flete (%)", value=VOLATILIDADES_POR_DEFECTO['flete_usd'] * 100, key="mc_vol_flete")
+        with col3:
+            vol_arancel = st.number_input("Volatilidad Aranceles (%)", value=VOLATILIDADES_POR_DEFECTO['factor_arancel'] * 100, key="mc_vol_arancel")
+            vol_perdidas = st.number_input("Desviación Pérdidas (pp)", value=VOLATILIDADES_POR_DEFECTO['porcentaje_perdidas'] * 100, key="mc_vol_perdidas")
+        
+        if st.button("🎲 Ejecutar Simulación", use_container_width=True, key="btn_montecarlo"):
+            with st.spinner(f"Simulando {n_simulaciones:,} escenarios..."):
+                try:
+                    st.session_state.montecarlo = simular_montecarlo(
+                        st.session_state.productos,
+                        self.aranceles_calculo(),
+                        st.session_state.parametros,
+                        n_simulaciones=n_simulaciones,
+                        semilla=int(semilla),
+                        volatilidades={
+                            'tipo_cambio': vol_tc / 100,
+                            'flete_usd': vol_flete / 100,
+                            'factor_arancel': vol_arancel / 100,
+                            'porcentaje_perdidas': vol_perdidas / 100
+                        }
+                    )
+                except Exception as e:
+                    st.error(f"❌ Error en la simulación: {str(e)}")
+        
+        if 'montecarlo' not in st.session_state:
+            st.info("👆 Ejecuta la simulación para ver la distribución de rentabilidad")
+            return
+        
+        resumen = st.session_state.montecarlo['resumen']
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Rentabilidad Mediana", f"{resumen['rentabilidad_p50']:.1%}",
+                      f"P5 {resumen['rentabilidad_p5']:.1%} • P95 {resumen['rentabilidad_p95']:.1%}", delta_color="off")
+        with col2:
+            st.metric("Probabilidad de Pérdida", f"{resumen['probabilidad_perdida']:.1%}")
+        with col3:
+            st.metric(f"VaR {resumen['nivel_confianza']:.0%}", f"${resumen['var']:,.0f}")
+        with col4:
+            st.metric(f"CVaR {resumen['nivel_confianza']:.0%}", f"${resumen['cvar']:,.0f}")
+        
+        muestras = st.session_state.montecarlo['muestras']
+        if len(muestras) > 100_000:
+            muestras = muestras.sample(100_000, random_state=0)
+        fig_distribucion = px.histogram(
+            muestras,
+            x='rentabilidad_portafolio',
+            nbins=80,
+            title=f"Distribución de Rentabilidad del Portafolio ({resumen['simulaciones']:,} simulaciones)",
+            labels={'rentabilidad_portafolio': 'Rentabilidad'}
+        )
+        fig_distribucion.add_vline(x=0, line_dash="dash", line_color="red")
+        st.plotly_chart(fig_distribucion, use_container_width=True)
+        
+        with st.expander("📋 Rentabilidad por SKU"):
+            st.caption("Los 1.000 SKUs con mayor probabilidad de pérdida")
+            st.dataframe(
+                st.session_state.montecarlo['por_sku'].nlargest(1000, 'probabilidad_perdida').style.format({
+                    'rentabilidad_media': '{:.1%}',
+                    'rentabilidad_p5': '{:.1%}',
+                    'rentabilidad_p25': '{:.1%}',
+                    'rentabilidad_p50': '{:.1%}',
+                    'rentabilidad_p75': '{:.1%}',
+                    'rentabilidad_p95': '{:.1%}',
+                    'probabilidad_perdida': '{:.1%}'
+                }),
+                use_container_width=True
+            )
+
+    def definir_escenarios(self):
+        """Escenarios predefinidos con variaciones personalizables, más los adicionales"""
+        predefinidos = escenarios_estandar(
+            st.session_state.parametros,
+            var_tc=st.session_state.get("var_tc", 10.0) / 100,
+            var_arancel=st.session_state.get("var_arancel", 33.0) / 100,
+            var_flete=st.session_state.get("var_flete", 12.0) / 100
+        )
+        adicionales = st.session_state.escenarios_personalizados.dropna()
+        if adicionales.empty:
+            return predefinidos
+        return pd.concat([predefinidos, adicionales[COLUMNAS_DEFINICION_ESCENARIOS]], ignore_index=True)
 
     def calcular_escenarios(self):
         """Calcular escenarios de sensibilidad"""
         try:
-            # Obtener datos base
-            costo_base = st.session_state.landed_cost['costo_unitario'].mean()
-            rentabilidad_base = st.session_state.ventas['rentabilidad'].mean()
-            parametros = st.session_state.parametros
-            
-            # Escenarios predefinidos con variaciones personalizables
-            var_tc = st.session_state.get("var_tc", 10.0) / 100
-            var_arancel = st.session_state.get("var_arancel", 33.0) / 100
-            var_flete = st.session_state.get("var_flete", 12.0) / 100
-            
-            escenarios_config = [
-                {
-                    'nombre': 'Optimista', 
-                    'tipo_cambio': parametros['USD_COP'] * (1 + var_tc),
-                    'arancel': max(0.01, parametros['iva_importacion'] * (1 - var_arancel)),
-                    'flete': max(100, parametros['flete_internacional'] * (1 - var_flete)),
-                    'factor_costo': 0.85,
-                    'factor_rentabilidad': 1.3
-                },
-                {
-                    'nombre': 'Base',
-                    'tipo_cambio': parametros['USD_COP'],
-                    'arancel': parametros['iva_importacion'],
-                    'flete': parametros['flete_internacional'],
-                    'factor_costo': 1.0,
-                    'factor_rentabilidad': 1.0
-                },
-                {
-                    'nombre': 'Pesimista',
-                    'tipo_cambio': parametros['USD_COP'] * (1 - var_tc),
-                    'arancel': parametros['iva_importacion'] * (1 + var_arancel),
-                    'flete': parametros['flete_internacional'] * (1 + var_flete),
-                    'factor_costo': 1.15,
-                    'factor_rentabilidad': 0.7
-                }
-            ]
-            
-            escenarios_data = []
-            
-            for escenario in escenarios_config:
-                costo_ajustado = costo_base * escenario['factor_costo']
-                rentabilidad_ajustada = rentabilidad_base * escenario['factor_rentabilidad']
-                impacto = rentabilidad_ajustada - rentabilidad_base
-                
-                escenarios_data.append({
-                    'escenario': escenario['nombre'],
-                    'tipo_cambio': escenario['tipo_cambio'],
-                    'arancel_porcentaje': escenario['arancel'],
-                    'flete_usd': escenario['flete'],
-                    'costo_promedio': costo_ajustado,
-                    'rentabilidad_promedio': rentabilidad_ajustada,
-                    'impacto_rentabilidad': impacto
-                })
-            
-            st.session_state.escenarios = pd.DataFrame(escenarios_data)
+            st.session_state.escenarios = calcular_escenarios(
+                st.session_state.productos,
+                self.aranceles_calculo(),
+                st.session_state.parametros,
+                self.definir_escenarios()
+            )
             st.session_state.calculos_realizados = True
             st.success("✅ Escenarios calculados correctamente")
             
@@ -1374,15 +1943,7 @@ class CalculadoraImportacionesStreamlit:
                     st.plotly_chart(fig_composicion, use_container_width=True)
                 
                 with tab2:
-                    costos_por_sku = st.session_state.landed_cost[['sku', 'costo_unitario']].sort_values('costo_unitario')
-                    fig_evolucion = px.bar(
-                        costos_por_sku,
-                        x='sku',
-                        y='costo_unitario',
-                        title='Costo Unitario por SKU (Ordenado)',
-                        color='costo_unitario'
-                    )
-                    st.plotly_chart(fig_evolucion, use_container_width=True)
+                    self.mostrar_evolucion()
             
             if not st.session_state.ventas.empty:
                 st.subheader("📊 Análisis de Rentabilidad")
@@ -1425,7 +1986,7 @@ class CalculadoraImportacionesStreamlit:
             
             if not st.session_state.ventas.empty:
                 margen_objetivo = st.session_state.parametros['margen_objetivo']
-                productos_bajos = st.session_state.ventas[st.session_state.ventas['rentabilidad'] < margen_objetivo]
+                productos_bajos = st.session_state.ventas[bajo_margen(st.session_state.ventas['rentabilidad'], margen_objetivo)]
                 
                 if len(productos_bajos) > 0:
                     st.error(f"❌ {len(productos_bajos)} productos no alcanzan margen objetivo")
@@ -1464,6 +2025,73 @@ class CalculadoraImportacionesStreamlit:
                 for kpi, valor in kpis.items():
                     st.metric(kpi, valor)
 
+    def mostrar_evolucion(self):
+        """Landed Cost y rentabilidad diarios del catálogo con el historial de tasas"""
+        historial = st.session_state.historial_tasas
+        primera = historial.primera_fecha('USD_COP')
+        if primera is None:
+            st.info("📅 Importe un historial de TRM en '⚙️ Parámetros' para ver la evolución de costos")
+            return
+        ultima = historial.ultima_fecha('USD_COP')
+        rango = st.date_input(
+            "Rango de fechas",
+            value=(max(primera, ultima - 364).astype(object), ultima.astype(object)),
+            min_value=primera.astype(object),
+            key="rango_evolucion"
+        )
+        if len(rango) != 2:
+            return
+        
+        tasas = historial.serie_diaria('USD_COP', *rango)
+        # Líneas por SKU para los cinco de mayor valor FOB
+        productos = st.session_state.productos
+        skus = np.argsort(-(productos['cantidad'] * productos['precio_unitario_usd']).to_numpy())[:5]
+        clave = huella_entradas(
+            'evolucion', st.session_state.parametros, st.session_state.productos, self.aranceles_calculo(),
+            tasas, skus.tolist()
+        )
+        try:
+            evolucion, por_sku = st.session_state.cache_resultados.memoizar(clave, lambda: calcular_evolucion(
+                st.session_state.productos, self.aranceles_calculo(), st.session_state.parametros,
+                tasas['fecha'].to_numpy(), tasas['valor'].to_numpy(), skus=skus
+            ))
+        except Exception as e:
+            st.error(f"❌ Error calculando la evolución: {str(e)}")
+            return
+        
+        inicio, fin = evolucion.iloc[0], evolucion.iloc[-1]
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Costo Unitario Promedio", f"${fin['costo_promedio']:,.0f}",
+                      f"{fin['costo_promedio'] / inicio['costo_promedio'] - 1:+.1%}", delta_color="inverse")
+        with col2:
+            st.metric("Rentabilidad Promedio", f"{fin['rentabilidad_promedio']:.1%}",
+                      f"{fin['rentabilidad_promedio'] - inicio['rentabilidad_promedio']:+.1%}")
+        
+        grafico = submuestrear(evolucion, 'costo_promedio')
+        fig_evolucion = go.Figure()
+        fig_evolucion.add_trace(go.Scatter(
+            x=grafico['fecha'], y=grafico['costo_promedio'], name='Costo unitario promedio', line=dict(color='#1f77b4')
+        ))
+        fig_evolucion.add_trace(go.Scatter(
+            x=grafico['fecha'], y=grafico['rentabilidad_promedio'], name='Rentabilidad promedio',
+            yaxis='y2', line=dict(color='#2ca02c')
+        ))
+        fig_evolucion.update_layout(
+            title='Evolución del Landed Cost (precios de lista del caso base)',
+            yaxis=dict(title='Costo unitario (COP)'),
+            yaxis2=dict(title='Rentabilidad', overlaying='y', side='right', tickformat='.0%'),
+            hovermode='x unified'
+        )
+        st.plotly_chart(fig_evolucion, use_container_width=True)
+        
+        fig_skus = px.line(
+            por_sku[por_sku['fecha'].isin(grafico['fecha'])],
+            x='fecha', y='costo_unitario', color='sku',
+            title='Costo Unitario de los 5 SKUs de Mayor Valor FOB'
+        )
+        st.plotly_chart(fig_skus, use_container_width=True)
+
     def pagina_exportar(self):
         """Página de exportación de datos"""
         st.header("💾 Exportar Datos y Reportes")
@@ -1675,20 +2303,18 @@ RESUMEN POR PRODUCTO:
 
     def crear_backup_completo(self):
         """Crear backup de todos los datos"""
-        backup_data = {
-            'parametros': st.session_state.parametros,
-            'productos': st.session_state.productos.to_dict(),
-            'aranceles': st.session_state.aranceles.to_dict(),
-            'landed_cost': st.session_state.landed_cost.to_dict() if not st.session_state.landed_cost.empty else {},
-            'ventas': st.session_state.ventas.to_dict() if not st.session_state.ventas.empty else {},
-            'escenarios': st.session_state.escenarios.to_dict() if not st.session_state.escenarios.empty else {},
-            'fecha_backup': datetime.now().isoformat(),
-            'version': '1.0'
-        }
+        backup_data = datos_backup(
+            st.session_state.parametros,
+            expandir(st.session_state.productos, 'productos'),
+            expandir(st.session_state.aranceles, 'aranceles'),
+            st.session_state.landed_cost,
+            st.session_state.ventas,
+            st.session_state.escenarios
+        )
         
         st.download_button(
             label="📥 Descargar Backup Completo",
-            data=json.dumps(backup_data, indent=2, ensure_ascii=False),
+            data=serializar_backup(backup_data),
             file_name=f"backup_calculadora_{datetime.now().strftime('%Y%m%d_%H%M')}.json",
             mime="application/json",
             use_container_width=True,
@@ -1702,11 +2328,12 @@ RESUMEN POR PRODUCTO:
                 datos = json.load(archivo)
                 
                 if 'parametros' in datos:
-                    st.session_state.parametros = datos['parametros']
+                    # Los backups anteriores no traen todos los parámetros: los faltantes toman el valor por defecto
+                    st.session_state.parametros = {**parametros_por_defecto(), **datos['parametros']}
                 if 'productos' in datos:
-                    st.session_state.productos = pd.DataFrame(datos['productos'])
+                    st.session_state.productos = compactar(pd.DataFrame(datos['productos']), 'productos')
                 if 'aranceles' in datos:
-                    st.session_state.aranceles = pd.DataFrame(datos['aranceles'])
+                    st.session_state.aranceles = compactar(pd.DataFrame(datos['aranceles']), 'aranceles')
                 if 'landed_cost' in datos and datos['landed_cost']:
                     st.session_state.landed_cost = pd.DataFrame(datos['landed_cost'])
                 if 'ventas' in datos and datos['ventas']:
@@ -1724,19 +2351,51 @@ RESUMEN POR PRODUCTO:
             st.error(f"Error al cargar el archivo: {str(e)}")
 
     def recalcular_todo(self):
-        """Recalcular todos los módulos"""
+        """Recalcular todos los módulos, reutilizando resultados de entradas idénticas
+
+        Devuelve False si el Landed Cost no se pudo calcular.
+        """
         try:
-            if not st.session_state.productos.empty and not st.session_state.aranceles.empty:
-                self.calcular_landed_cost()
-                if not st.session_state.landed_cost.empty:
+            if not st.session_state.productos.empty and not self.aranceles_calculo().empty:
+                cache = st.session_state.cache_resultados
+                clave = huella_entradas(
+                    st.session_state.parametros,
+                    st.session_state.productos,
+                    self.aranceles_calculo(),
+                    self.definir_escenarios()
+                )
+                resultados = cache.obtener(clave)
+                
+                if resultados is None:
+                    st.session_state.landed_cost = pd.DataFrame()
+                    st.session_state.ventas = pd.DataFrame()
+                    st.session_state.escenarios = pd.DataFrame()
+                    
+                    self.calcular_landed_cost()
+                    if st.session_state.landed_cost.empty:
+                        # Cálculo fallido o bloqueado por la validación: no se guarda en la caché
+                        return False
                     self.calcular_ventas()
                     if not st.session_state.ventas.empty:
                         self.calcular_escenarios()
+                    
+                    resultados = {
+                        'landed_cost': st.session_state.landed_cost,
+                        'ventas': st.session_state.ventas,
+                        'escenarios': st.session_state.escenarios
+                    }
+                    cache.guardar(clave, resultados)
+                else:
+                    st.session_state.landed_cost = resultados['landed_cost']
+                    st.session_state.ventas = resultados['ventas']
+                    st.session_state.escenarios = resultados['escenarios']
             
             st.session_state.calculos_realizados = True
+            return True
             
         except Exception as e:
             st.error(f"Error en el recálculo: {str(e)}")
+            return False
 
 def main():
     """Función principal"""
@@ -0,0 +1,220 @@
+"""Arancel de aduanas completo en formato columnar mapeado en memoria
+
+La base se guarda como un directorio de ``.npy``: las tasas en float64, el
+HS Code en bytes de ancho fijo y la vigencia en datetime64[s]. Las columnas se
+abren con ``np.load(mmap_mode='r')`` solo cuando un cálculo las pide, y las
+tasas y la vigencia entran al DataFrame sin copiarse: esas páginas las
+comparte el sistema operativo entre todas las sesiones y procesos. El HS
+Code se decodifica a texto una vez por proceso (vectorizado), y la
+descripción y la fuente, guardadas como bloques de texto UTF-8, solo si se
+piden para buscar. Las ediciones de cada sesión se aplican encima como una
+tabla pequeña (ver ``tabla_vigente``).
+
+Ejemplo:
+    python base_aranceles.py arancel_dian.xlsx --salida aranceles_base --version 2024-01
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from indice_aranceles import COLUMNA_VIGENCIA, COLUMNAS_TASAS, huella_aranceles, huella_filas, normalizar_hs_code
+
+# Texto libre: bloque UTF-8 con los valores separados por NUL
+COLUMNAS_TEXTO = ['descripcion', 'fuente']
+
+# Versión del formato en disco; las bases de otra versión se deben reconstruir
+FORMATO = 2
+
+SEPARADOR = b'\x00'
+
+COLUMNAS_BASE = ['hs_code', 'descripcion'] + COLUMNAS_TASAS + ['fuente', 'fecha_actualizacion']
+
+DIRECTORIO_POR_DEFECTO = Path(os.environ.get('CALCULADORA_ARANCELES_DIR', Path(__file__).parent / 'aranceles_base'))
+
+_BLOQUEO = threading.Lock()
+_BASES = {}
+
+# Tablas base + ediciones recientes, compartidas por las sesiones con las mismas ediciones
+_CACHE_VIGENTES = OrderedDict()
+_MAX_VIGENTES = 8
+
+
+def construir_base(aranceles, directorio, version=None):
+    """Escribir la tabla de aranceles en formato columnar, ordenada por HS Code
+
+    Se escribe en un directorio temporal que luego reemplaza al destino, así
+    los procesos que tengan la base abierta siguen leyendo la versión anterior.
+    """
+    faltantes = [c for c in ['hs_code'] + COLUMNAS_TASAS if c not in aranceles.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en aranceles: {', '.join(faltantes)}")
+    clave = normalizar_hs_code(aranceles['hs_code'])
+    aranceles = aranceles.assign(_clave=clave.to_numpy()).sort_values('_clave', kind='stable')
+
+    directorio = Path(directorio)
+    directorio.parent.mkdir(parents=True, exist_ok=True)
+    temporal = Path(tempfile.mkdtemp(dir=directorio.parent, prefix=f".{directorio.name}."))
+    for columna in COLUMNAS_TASAS:
+        np.save(temporal / f"{columna}.npy", aranceles[columna].to_numpy(dtype=float))
+    hs_code = aranceles['hs_code'].astype('string').fillna('').str.strip()
+    np.save(temporal / 'hs_code.npy', hs_code.to_numpy(dtype=object).astype(bytes))
+    vigencia = aranceles[COLUMNA_VIGENCIA] if COLUMNA_VIGENCIA in aranceles.columns else pd.Series(None, index=aranceles.index)
+    np.save(temporal / f"{COLUMNA_VIGENCIA}.npy",
+            pd.to_datetime(vigencia, errors='coerce', format='mixed').to_numpy(dtype='datetime64[ns]').astype('datetime64[s]'))
+    for columna in COLUMNAS_TEXTO:
+        valores = aranceles[columna] if columna in aranceles.columns else pd.Series('', index=aranceles.index)
+        textos = valores.astype('string').fillna('').str.replace('\x00', '', regex=False)
+        (temporal / f"{columna}.txt").write_bytes(SEPARADOR.join(t.encode('utf-8') for t in textos))
+    (temporal / 'meta.json').write_text(json.dumps({
+        'formato': FORMATO,
+        'filas': len(aranceles),
+        'version': version,
+        'huella': huella_aranceles(aranceles),
+        'columnas': COLUMNAS_BASE
+    }, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    if directorio.exists():
+        anterior = directorio.with_name(f".{directorio.name}.anterior")
+        shutil.rmtree(anterior, ignore_errors=True)
+        os.replace(directorio, anterior)
+        os.replace(temporal, directorio)
+        shutil.rmtree(anterior, ignore_errors=True)
+    else:
+        os.replace(temporal, directorio)
+    return directorio
+
+
+class BaseAranceles:
+    """Columnas de la base abiertas bajo demanda como arreglos de solo lectura
+
+    ``modificada`` es la fecha de modificación (ns) de meta.json al abrirla:
+    si el archivo cambia, la base se reconstruyó y hay que volver a abrirla.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = Path(directorio)
+        # Antes de leer meta.json: si se reemplaza en medio, la próxima consulta la reabre
+        self.modificada = (self.directorio / 'meta.json').stat().st_mtime_ns
+        self.meta = json.loads((self.directorio / 'meta.json').read_text(encoding='utf-8'))
+        if self.meta.get('formato') != FORMATO:
+            raise ValueError(f"La base de aranceles en {self.directorio} tiene otro formato; "
+                             "reconstrúyala con base_aranceles.py")
+        self._columnas = {}
+
+    def __len__(self):
+        return self.meta['filas']
+
+    @property
+    def version(self):
+        return self.meta.get('version')
+
+    def columna(self, nombre):
+        """Arreglo de una columna
+
+        Tasas y vigencia son vistas de solo lectura sobre el archivo; el HS
+        Code y los textos se decodifican la primera vez que se piden.
+        """
+        if nombre not in self._columnas:
+            if nombre in COLUMNAS_TASAS or nombre == COLUMNA_VIGENCIA:
+                valores = np.load(self.directorio / f"{nombre}.npy", mmap_mode='r')
+            elif nombre == 'hs_code':
+                valores = np.load(self.directorio / 'hs_code.npy', mmap_mode='r').astype(str).astype(object)
+            elif nombre in COLUMNAS_TEXTO:
+                texto = (self.directorio / f"{nombre}.txt").read_bytes().decode('utf-8')
+                valores = np.array(texto.split(SEPARADOR.decode()) if len(self) else [], dtype=object)
+            else:
+                raise KeyError(f"Columna desconocida en la base de aranceles: {nombre}")
+            with _BLOQUEO:
+                self._columnas.setdefault(nombre, valores)
+        return self._columnas[nombre]
+
+    def tabla(self, columnas=None):
+        """DataFrame con las columnas pedidas (por defecto, las que usa el cálculo)"""
+        columnas = ['hs_code'] + COLUMNAS_TASAS + [COLUMNA_VIGENCIA] if columnas is None else columnas
+        # Sin copia: las columnas numéricas siguen siendo vistas del archivo mapeado
+        return pd.DataFrame({columna: self.columna(columna) for columna in columnas}, columns=columnas, copy=False)
+
+
+def obtener_base(directorio=None):
+    """Base compartida por todas las sesiones del proceso; None si no se ha construido"""
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_POR_DEFECTO
+    if not (directorio / 'meta.json').exists():
+        return None
+    with _BLOQUEO:
+        base = _BASES.get(directorio)
+        meta = (directorio / 'meta.json').stat().st_mtime_ns
+        if base is None or base.modificada != meta:
+            base = BaseAranceles(directorio)
+            _BASES[directorio] = base
+            _CACHE_VIGENTES.clear()
+    return base
+
+
+def tabla_vigente(ediciones, base=None, columnas=None):
+    """Tabla de cálculo: la base compartida con las ediciones de la sesión encima
+
+    Las filas editadas reemplazan a las de la base con el mismo HS Code
+    (comparando solo dígitos), con todas sus versiones por fecha. Sin base, las ediciones son la tabla completa.
+    Sesiones con las mismas ediciones reciben el mismo DataFrame. Por defecto
+    solo trae las columnas del cálculo; la descripción se pide para buscar.
+    """
+    base = obtener_base() if base is None else base
+    columnas = ['hs_code'] + COLUMNAS_TASAS + [COLUMNA_VIGENCIA] if columnas is None else list(columnas)
+    if base is None:
+        return ediciones
+    if ediciones is None or ediciones.empty:
+        clave = (id(base), tuple(columnas), None)
+    else:
+        huella = huella_filas(ediciones[columnas])
+        clave = (id(base), tuple(columnas), len(ediciones), huella)
+
+    with _BLOQUEO:
+        tabla = _CACHE_VIGENTES.get(clave)
+        if tabla is not None:
+            _CACHE_VIGENTES.move_to_end(clave)
+            return tabla
+
+    tabla = base.tabla(columnas)
+    if clave[2] is not None:
+        editados = pd.Index(normalizar_hs_code(ediciones['hs_code']))
+        reemplazadas = editados.get_indexer(normalizar_hs_code(tabla['hs_code'])) >= 0
+        tabla = pd.concat([tabla[~reemplazadas], ediciones[columnas]], ignore_index=True)
+
+    with _BLOQUEO:
+        _CACHE_VIGENTES[clave] = tabla
+        if len(_CACHE_VIGENTES) > _MAX_VIGENTES:
+            _CACHE_VIGENTES.popitem(last=False)
+    return tabla
+
+
+def main(argv=None):
+    from calculo_lote import leer_tabla
+    from importar_excel import leer_xlsx
+
+    parser = argparse.ArgumentParser(description="Construir la base columnar de aranceles")
+    parser.add_argument('aranceles', help="Arancel completo (CSV, XLSX o Parquet) con hs_code y tasas")
+    parser.add_argument('--salida', default=str(DIRECTORIO_POR_DEFECTO), help="Directorio de la base")
+    parser.add_argument('--version', help="Versión o fecha del arancel")
+    args = parser.parse_args(argv)
+
+    if Path(args.aranceles).suffix.lower() in ('.xlsx', '.xlsm'):
+        # El arancel oficial trae sus propios encabezados (Código, Gravamen, ...)
+        aranceles = leer_xlsx(args.aranceles, 'aranceles')
+    else:
+        aranceles = leer_tabla(args.aranceles)
+    directorio = construir_base(aranceles, args.salida, args.version)
+    print(f"{len(aranceles):,} subpartidas en {directorio}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
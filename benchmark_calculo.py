@@ -0,0 +1,236 @@
+"""Benchmark reproducible del flujo de cálculo
+
+Genera catálogos sintéticos con semilla fija (mismos esquemas que la app) y
+mide tiempo y memoria pico de cada etapa entre 10² y 10⁶ SKUs. El reporte
+JSON incluye el commit y las versiones, para comparar entre commits.
+
+Ejemplo:
+    python benchmark_calculo.py --salida benchmark.json
+    python benchmark_calculo.py --tamanos 100 10000 --comparar benchmark.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import motor_calculo as motor
+
+TAMANOS_POR_DEFECTO = (100, 1_000, 10_000, 100_000, 1_000_000)
+
+SEMILLA_POR_DEFECTO = 20240101
+
+# Tamaño aproximado del arancel de aduanas (subpartidas de 10 dígitos)
+MAX_LINEAS_ARANCEL = 8_000
+
+INCOTERMS = ['FOB', 'EXW', 'FCA', 'CIF', 'DDP']
+
+CATEGORIAS = ['Electrónicos', 'Hogar', 'Moda', 'Juguetes']
+
+ETAPAS = ['landed_cost', 'ventas', 'escenarios', 'escenarios_50', 'backup', 'app_py']
+
+# Proporción de SKUs con HS Code que no está en la tabla (ejercita el respaldo por prefijo)
+PROPORCION_SIN_ARANCEL = 0.10
+
+
+def _formatear_hs_code(codigos):
+    """Dar formato '8518.30.00.00' a códigos numéricos de 10 dígitos"""
+    texto = pd.Series(codigos).astype(str).str.zfill(10)
+    return (texto.str[:4] + '.' + texto.str[4:6] + '.' + texto.str[6:8] + '.' + texto.str[8:]).to_numpy()
+
+
+def generar_aranceles(n_lineas, semilla=SEMILLA_POR_DEFECTO):
+    """Tabla de aranceles sintética con el esquema de la app"""
+    rng = np.random.default_rng(semilla)
+    capitulos = rng.integers(1, 98, n_lineas)
+    resto = rng.integers(0, 10**8, n_lineas)
+    codigos = np.unique(capitulos * 10**8 + resto)
+    n_lineas = len(codigos)
+    return pd.DataFrame({
+        'hs_code': _formatear_hs_code(codigos),
+        'descripcion': [f"Subpartida {i}" for i in range(n_lineas)],
+        'arancel_porcentaje': rng.choice([0.0, 0.05, 0.10, 0.15, 0.20, 0.35], n_lineas),
+        'iva_porcentaje': rng.choice([0.0, 0.05, 0.19], n_lineas, p=[0.1, 0.1, 0.8]),
+        'otros_impuestos': np.where(rng.random(n_lineas) < 0.05, 0.08, 0.0),
+        'fuente': 'DIAN',
+        'fecha_actualizacion': '2024-01-01'
+    })
+
+
+def generar_productos(n_skus, aranceles, semilla=SEMILLA_POR_DEFECTO):
+    """Catálogo sintético de productos cuyos HS Codes salen de la tabla de aranceles"""
+    rng = np.random.default_rng(semilla + 1)
+    hs_code = aranceles['hs_code'].to_numpy()[rng.integers(0, len(aranceles), n_skus)]
+    sin_arancel = rng.random(n_skus) < PROPORCION_SIN_ARANCEL
+    hs_code[sin_arancel] = _formatear_hs_code(rng.integers(10**9, 98 * 10**8, sin_arancel.sum()))
+    return pd.DataFrame({
+        'sku': [f"SKU-{i:07d}" for i in range(n_skus)],
+        'descripcion': [f"Producto {i}" for i in range(n_skus)],
+        'cantidad': rng.integers(1, 2_000, n_skus),
+        'peso_unitario_kg': np.round(rng.lognormal(-1.0, 1.0, n_skus), 3),
+        'volumen_unitario_m3': np.round(rng.lognormal(-6.5, 1.0, n_skus), 5),
+        'precio_unitario_usd': np.round(rng.lognormal(2.0, 1.0, n_skus), 2),
+        'hs_code': hs_code,
+        'incoterm': rng.choice(INCOTERMS, n_skus),
+        'categoria': rng.choice(CATEGORIAS, n_skus)
+    })
+
+
+def generar_escenarios(n_escenarios, parametros, semilla=SEMILLA_POR_DEFECTO):
+    """Escenarios personalizados alrededor de los parámetros base"""
+    rng = np.random.default_rng(semilla + 2)
+    return pd.DataFrame({
+        'escenario': [f"Escenario {i + 1}" for i in range(n_escenarios)],
+        'tipo_cambio': parametros['USD_COP'] * rng.uniform(0.85, 1.15, n_escenarios),
+        'flete_usd': parametros['flete_internacional'] * rng.uniform(0.8, 1.2, n_escenarios),
+        'factor_arancel': rng.uniform(0.67, 1.33, n_escenarios)
+    })
+
+
+def _etapa_app_py(productos, aranceles, parametros):
+    """Calculadora simple de app.py, un embarque por SKU"""
+    valor = (productos['cantidad'] * productos['precio_unitario_usd']).to_numpy()
+    peso = (productos['cantidad'] * productos['peso_unitario_kg']).to_numpy()
+    for valor_usd, peso_kg in zip(valor.tolist(), peso.tolist()):
+        motor.calcular_costos_importacion(
+            valor_usd, peso_kg, parametros['flete_internacional'], valor_usd * parametros['seguro_porcentaje'],
+            0.10, parametros['USD_COP']
+        )
+
+
+def preparar_etapas(productos, aranceles, parametros):
+    """Etapas del flujo en orden; cada una recibe lo que calcularon las anteriores"""
+    escenarios_50 = generar_escenarios(50, parametros)
+    landed_cost = motor.calcular_landed_cost(productos, aranceles, parametros)
+    ventas = motor.calcular_ventas(landed_cost, productos, parametros)
+    escenarios = motor.calcular_escenarios(productos, aranceles, parametros)
+    return {
+        'landed_cost': lambda: motor.calcular_landed_cost(productos, aranceles, parametros),
+        'ventas': lambda: motor.calcular_ventas(landed_cost, productos, parametros),
+        'escenarios': lambda: motor.calcular_escenarios(productos, aranceles, parametros),
+        'escenarios_50': lambda: motor.calcular_escenarios(productos, aranceles, parametros, escenarios_50),
+        'backup': lambda: motor.serializar_backup(motor.datos_backup(
+            parametros, productos, aranceles, landed_cost, ventas, escenarios
+        )),
+        'app_py': lambda: _etapa_app_py(productos, aranceles, parametros)
+    }
+
+
+def medir(funcion, repeticiones):
+    """Tiempos de ``repeticiones`` ejecuciones y memoria pico de una ejecución aparte
+
+    La memoria se mide con tracemalloc en una corrida adicional para que su
+    sobrecosto no afecte los tiempos.
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    try:
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return tiempos, pico
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=Path(__file__).parent, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ejecutar_benchmark(tamanos=TAMANOS_POR_DEFECTO, etapas=None, repeticiones=3, semilla=SEMILLA_POR_DEFECTO):
+    """Medir cada etapa en cada tamaño de catálogo y devolver el reporte"""
+    parametros = motor.parametros_por_defecto()
+    resultados = []
+    for n_skus in tamanos:
+        aranceles = generar_aranceles(min(MAX_LINEAS_ARANCEL, max(10, n_skus)), semilla)
+        productos = generar_productos(n_skus, aranceles, semilla)
+        for etapa, funcion in preparar_etapas(productos, aranceles, parametros).items():
+            if etapas and etapa not in etapas:
+                continue
+            tiempos, pico = medir(funcion, repeticiones)
+            resultados.append({
+                'etapa': etapa,
+                'skus': n_skus,
+                'lineas_arancel': len(aranceles),
+                'segundos_min': min(tiempos),
+                'segundos_mediana': statistics.median(tiempos),
+                'skus_por_segundo': n_skus / min(tiempos) if min(tiempos) > 0 else None,
+                'memoria_pico_mb': pico / 1024 / 1024
+            })
+            print(f"{etapa:>12} {n_skus:>9,} SKUs: {min(tiempos):8.4f} s  {pico / 1024 / 1024:9.1f} MB",
+                  file=sys.stderr)
+
+    return {
+        'fecha': datetime.now().isoformat(),
+        'commit': _commit_actual(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'semilla': semilla,
+        'repeticiones': repeticiones,
+        'resultados': resultados
+    }
+
+
+def comparar_reportes(base, actual):
+    """Razón de tiempo y memoria (actual / base) por etapa y tamaño"""
+    claves = ['etapa', 'skus']
+    tabla = pd.DataFrame(base['resultados']).merge(
+        pd.DataFrame(actual['resultados']), on=claves, suffixes=('_base', '_actual')
+    )
+    return pd.DataFrame({
+        'etapa': tabla['etapa'],
+        'skus': tabla['skus'],
+        'razon_tiempo': tabla['segundos_min_actual'] / tabla['segundos_min_base'],
+        'razon_memoria': tabla['memoria_pico_mb_actual'] / tabla['memoria_pico_mb_base']
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del flujo de cálculo con datos sintéticos")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=list(TAMANOS_POR_DEFECTO),
+                        help="Cantidades de SKUs a medir")
+    parser.add_argument('--etapas', nargs='+', choices=ETAPAS,
+                        help="Etapas a medir (por defecto, todas)")
+    parser.add_argument('--repeticiones', type=int, default=3, help="Ejecuciones cronometradas por etapa")
+    parser.add_argument('--semilla', type=int, default=SEMILLA_POR_DEFECTO, help="Semilla del generador")
+    parser.add_argument('--salida', help="Archivo JSON del reporte (por defecto, salida estándar)")
+    parser.add_argument('--comparar', help="Reporte JSON anterior contra el cual comparar")
+    args = parser.parse_args(argv)
+
+    reporte = ejecutar_benchmark(args.tamanos, args.etapas, args.repeticiones, args.semilla)
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if args.salida:
+        Path(args.salida).write_text(texto, encoding='utf-8')
+    else:
+        print(texto)
+
+    if args.comparar:
+        base = json.loads(Path(args.comparar).read_text(encoding='utf-8'))
+        print(f"\nComparación contra {base.get('commit') or args.comparar}:", file=sys.stderr)
+        print(comparar_reportes(base, reporte).to_string(index=False, float_format='{:.2f}'.format),
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""Sugerencia de HS Codes por descripción con un índice invertido de trigramas
+
+Cada descripción (del arancel y de productos ya clasificados) se parte en
+trigramas de caracteres por palabra, sin tildes ni mayúsculas, que toleran
+errores de digitación, plurales y palabras cortadas. El índice guarda, por
+trigrama, las descripciones que lo contienen con peso IDF normalizado; una
+consulta solo recorre las listas de sus trigramas y el puntaje es el coseno
+entre consulta y descripción.
+
+Ejemplo:
+    indice = obtener_indice_descripciones(aranceles, productos)
+    indice.sugerir('audifonos inalambricos')
+    sugerir_hs_codes(productos, aranceles)
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from indice_aranceles import huella_filas, normalizar_hs_code, obtener_indice
+
+TAMANO_NGRAMA = 3
+
+MAX_SUGERENCIAS = 5
+
+# Puntaje mínimo (coseno entre 0 y 1) para aplicar una sugerencia sin revisión
+PUNTAJE_MINIMO = 0.35
+
+# Trigramas presentes en más de esta fracción de descripciones no discriminan y se omiten
+FRECUENCIA_MAXIMA = 0.25
+
+# Celdas consulta x descripción de la matriz de puntajes de cada bloque de consultas
+MAX_CELDAS_BLOQUE = 2 ** 22
+
+COLUMNAS_SUGERENCIAS = ['consulta', 'hs_code', 'descripcion', 'origen', 'puntaje']
+
+_CACHE_INDICES = OrderedDict()
+_MAX_INDICES = 4
+
+
+def normalizar_texto(textos):
+    """Minúsculas, sin tildes y solo letras y números separados por un espacio"""
+    serie = pd.Series(textos, copy=False).astype('string').fillna('')
+    return (serie.str.lower().str.normalize('NFKD').str.replace('[\u0300-\u036f]', '', regex=True)
+            .str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip())
+
+
+def _ngramas(textos):
+    """Pares (posición del texto, trigrama) de cada texto, sin repetir por texto"""
+    posiciones, ngramas = [], []
+    for posicion, texto in enumerate(normalizar_texto(textos).tolist()):
+        propios = set()
+        for palabra in texto.split():
+            palabra = f" {palabra} "
+            propios.update(palabra[i:i + TAMANO_NGRAMA] for i in range(len(palabra) - TAMANO_NGRAMA + 1))
+        posiciones.extend([posicion] * len(propios))
+        ngramas.extend(propios)
+    return np.asarray(posiciones, dtype=np.int64), np.asarray(ngramas, dtype=object)
+
+
+class IndiceDescripciones:
+    """Índice invertido de trigramas sobre descripciones con HS Code conocido"""
+
+    def __init__(self, aranceles, productos=None):
+        documentos = [pd.DataFrame({
+            'hs_code': aranceles['hs_code'].astype('string'),
+            'descripcion': aranceles['descripcion'].astype('string'),
+            'origen': 'arancel'
+        })]
+        if productos is not None and not productos.empty:
+            # Productos ya clasificados con un código que existe en el arancel
+            niveles = obtener_indice(aranceles).resolver(productos['hs_code'], 0.0)[3]
+            clasificados = productos[niveles >= 8]
+            documentos.append(pd.DataFrame({
+                'hs_code': clasificados['hs_code'].astype('string'),
+                'descripcion': clasificados['descripcion'].astype('string'),
+                'origen': 'producto'
+            }))
+        self.documentos = pd.concat(documentos, ignore_index=True)
+        # Descripciones del mismo HS Code contiguas, para quedarse con la mejor de cada código
+        claves = normalizar_hs_code(self.documentos['hs_code']).to_numpy(dtype=object)
+        orden = np.argsort(claves, kind='stable')
+        orden = orden[claves[orden] != '']
+        self.documentos = self.documentos.iloc[orden].reset_index(drop=True)
+        claves = claves[orden]
+        self._grupos = np.flatnonzero(np.r_[True, claves[1:] != claves[:-1]]) if len(claves) else orden
+
+        documento, ngramas = _ngramas(self.documentos['descripcion'])
+        ids, vocabulario = pd.factorize(ngramas)
+        total = max(len(self.documentos), 1)
+        frecuencia = np.bincount(ids, minlength=len(vocabulario))
+        idf = np.log((1 + total) / (1 + frecuencia)) + 1
+        idf[frecuencia > max(FRECUENCIA_MAXIMA * total, 50)] = 0.0
+
+        pesos = idf[ids]
+        normas = np.sqrt(np.bincount(documento, weights=pesos ** 2, minlength=len(self.documentos)))
+        utiles = pesos > 0
+        ids, documento, pesos = ids[utiles], documento[utiles], pesos[utiles]
+
+        # Listas invertidas contiguas por trigrama (formato CSR)
+        orden = np.argsort(ids, kind='stable')
+        self._vocabulario = pd.Index(vocabulario)
+        self._idf = idf
+        self._inicio = np.concatenate([[0], np.cumsum(np.bincount(ids, minlength=len(vocabulario)))])
+        self._documentos = documento[orden]
+        self._pesos = (pesos / normas[documento])[orden]
+
+    def __len__(self):
+        return len(self.documentos)
+
+    def _consultas(self, textos):
+        """Trigramas conocidos de cada consulta con su peso normalizado"""
+        consulta, ngramas = _ngramas(textos)
+        ids = self._vocabulario.get_indexer(ngramas)
+        conocidos = ids >= 0
+        consulta, ids = consulta[conocidos], ids[conocidos]
+        pesos = self._idf[ids]
+        normas = np.sqrt(np.bincount(consulta, weights=pesos ** 2, minlength=len(textos)))
+        utiles = pesos > 0
+        consulta, ids, pesos = consulta[utiles], ids[utiles], pesos[utiles]
+        return consulta, ids, pesos / normas[consulta]
+
+    def _puntuar(self, consulta, ids, pesos, consultas, limite):
+        """Mejores HS Codes de un bloque de consultas sobre una matriz densa de puntajes
+
+        Cada trigrama suma su peso a las descripciones de su lista; luego se toma
+        la mejor descripción de cada HS Code y los ``limite`` mejores códigos.
+        """
+        documentos = len(self.documentos)
+        largos = self._inicio[ids + 1] - self._inicio[ids]
+        total = int(largos.sum())
+        # Expandir cada trigrama de la consulta a su lista de documentos
+        posiciones = np.repeat(self._inicio[ids] - np.cumsum(largos) + largos, largos) + np.arange(total)
+        puntajes = np.bincount(
+            np.repeat(consulta, largos) * documentos + self._documentos[posiciones],
+            weights=np.repeat(pesos, largos) * self._pesos[posiciones], minlength=consultas * documentos
+        ).reshape(consultas, documentos)
+
+        por_codigo = np.maximum.reduceat(puntajes, self._grupos, axis=1)
+        limite = min(limite, por_codigo.shape[1])
+        mejores = np.argpartition(-por_codigo, limite - 1, axis=1)[:, :limite]
+        mejores = np.take_along_axis(
+            mejores, np.argsort(-np.take_along_axis(por_codigo, mejores, axis=1), axis=1, kind='stable'), axis=1
+        )
+        filas = np.repeat(np.arange(consultas), limite)
+        grupos = mejores.ravel()
+        puntaje = por_codigo[filas, grupos]
+
+        # Primera descripción del grupo con el puntaje máximo
+        inicio = self._grupos[grupos]
+        fin = np.append(self._grupos[1:], documentos)[grupos]
+        documento = inicio.copy()
+        for paso in range(1, int((fin - inicio).max(initial=1))):
+            pendiente = (inicio + paso < fin) & (puntajes[filas, np.minimum(documento, documentos - 1)] < puntaje)
+            documento[pendiente] += 1
+
+        encontrados = puntaje > 0
+        return filas[encontrados], documento[encontrados], puntaje[encontrados]
+
+    def sugerir_lote(self, textos, limite=MAX_SUGERENCIAS):
+        """Hasta ``limite`` HS Codes por texto, ordenados por puntaje, en una sola pasada
+
+        Los textos repetidos (tras normalizarlos) se puntúan una sola vez, y por
+        bloques de consultas para acotar la matriz de puntajes en memoria.
+        """
+        codigos, textos = pd.factorize(normalizar_texto(textos))
+        consulta, ids, pesos = self._consultas(textos)
+        por_bloque = max(1, MAX_CELDAS_BLOQUE // max(len(self.documentos), 1))
+        resultados = []
+        if len(self.documentos):
+            for primera in range(0, len(textos), por_bloque):
+                ultima = min(primera + por_bloque, len(textos))
+                inicio, fin = np.searchsorted(consulta, [primera, ultima])
+                filas, documento, puntaje = self._puntuar(
+                    consulta[inicio:fin] - primera, ids[inicio:fin], pesos[inicio:fin], ultima - primera, limite
+                )
+                resultados.append((filas + primera, documento, puntaje))
+
+        consultas = np.concatenate([r[0] for r in resultados]) if resultados else np.empty(0, dtype=np.int64)
+        documentos = np.concatenate([r[1] for r in resultados]) if resultados else np.empty(0, dtype=np.int64)
+        puntajes = np.concatenate([r[2] for r in resultados]) if resultados else np.empty(0)
+
+        # Repetir las sugerencias de cada texto distinto en todas sus apariciones
+        apariciones = np.argsort(codigos, kind='stable')
+        veces = np.bincount(codigos, minlength=len(textos))
+        primeras = np.cumsum(veces) - veces
+        repeticiones = veces[consultas]
+        salto = np.arange(repeticiones.sum()) - np.repeat(np.cumsum(repeticiones) - repeticiones, repeticiones)
+        destino = apariciones[np.repeat(primeras[consultas], repeticiones) + salto]
+        orden = np.argsort(destino, kind='stable')
+        consultas = destino[orden]
+        documentos = np.repeat(documentos, repeticiones)[orden]
+        puntajes = np.repeat(puntajes, repeticiones)[orden]
+        encontrados = self.documentos.iloc[documentos]
+        return pd.DataFrame({
+            'consulta': consultas,
+            'hs_code': encontrados['hs_code'].to_numpy(),
+            'descripcion': encontrados['descripcion'].to_numpy(),
+            'origen': encontrados['origen'].to_numpy(),
+            'puntaje': puntajes
+        }, columns=COLUMNAS_SUGERENCIAS)
+
+    def sugerir(self, texto, limite=MAX_SUGERENCIAS):
+        """HS Codes más parecidos a un texto, ordenados por puntaje"""
+        return self.sugerir_lote([texto], limite).drop(columns='consulta')
+
+
+def obtener_indice_descripciones(aranceles, productos=None):
+    """Índice de descripciones de los aranceles (y productos), construido solo si cambiaron"""
+    huella = (len(aranceles), huella_filas(aranceles[['hs_code', 'descripcion']]))
+    if productos is not None and not productos.empty:
+        huella += (huella_filas(productos[['hs_code', 'descripcion']]),)
+    indice = _CACHE_INDICES.get(huella)
+    if indice is None:
+        indice = IndiceDescripciones(aranceles, productos)
+        _CACHE_INDICES[huella] = indice
+        if len(_CACHE_INDICES) > _MAX_INDICES:
+            _CACHE_INDICES.popitem(last=False)
+    else:
+        _CACHE_INDICES.move_to_end(huella)
+    return indice
+
+
+def codigos_faltantes(productos, aranceles):
+    """Máscara de productos sin HS Code o con un código que no aparece en el arancel"""
+    niveles = obtener_indice(aranceles).resolver(productos['hs_code'], 0.0)[3]
+    return (normalizar_hs_code(productos['hs_code']).to_numpy() == '') | (niveles == 0)
+
+
+def sugerir_hs_codes(productos, aranceles, limite=1):
+    """Sugerencias para todos los productos con HS Code faltante o desconocido
+
+    Devuelve una fila por sugerencia con la posición del producto en
+    ``fila``, su SKU y descripción, y la descripción más parecida (del arancel
+    o de un producto ya clasificado del catálogo) con su HS Code.
+    """
+    faltantes = np.flatnonzero(codigos_faltantes(productos, aranceles))
+    indice = obtener_indice_descripciones(aranceles, productos)
+    sugerencias = indice.sugerir_lote(productos['descripcion'].iloc[faltantes], limite)
+    filas = faltantes[sugerencias['consulta'].to_numpy()]
+    return pd.DataFrame({
+        'fila': filas,
+        'sku': productos['sku'].iloc[filas].to_numpy(),
+        'descripcion_producto': productos['descripcion'].iloc[filas].to_numpy(),
+        'hs_code': sugerencias['hs_code'].to_numpy(),
+        'descripcion_arancel': sugerencias['descripcion'].to_numpy(),
+        'puntaje': sugerencias['puntaje'].to_numpy()
+    })
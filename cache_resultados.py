@@ -0,0 +1,146 @@
+"""Caché de resultados por huella de contenido de las entradas
+
+Cada sesión tiene su propio LRU acotado en entradas; además todas las sesiones
+del proceso comparten un tope de memoria global. Al superarlo se descartan las
+entradas usadas hace más tiempo, sin importar a qué sesión pertenecen.
+"""
+import hashlib
+import json
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Tope de memoria compartido por todas las sesiones del proceso
+MEMORIA_MAXIMA_MB = float(os.environ.get('CALCULADORA_CACHE_MB', 512))
+
+_BLOQUEO = threading.RLock()
+_USO_GLOBAL = OrderedDict()  # (id de caché, clave) -> bytes, en orden de uso
+_CACHES = weakref.WeakValueDictionary()
+
+
+def huella_entradas(*entradas):
+    """Huella rápida del contenido de DataFrames, diccionarios y escalares"""
+    h = hashlib.blake2b(digest_size=16)
+    for entrada in entradas:
+        if isinstance(entrada, pd.DataFrame):
+            h.update(repr((list(entrada.columns), [str(t) for t in entrada.dtypes])).encode())
+            h.update(pd.util.hash_pandas_object(entrada, index=True).to_numpy().tobytes())
+        elif isinstance(entrada, pd.Series):
+            h.update(pd.util.hash_pandas_object(entrada, index=True).to_numpy().tobytes())
+        elif isinstance(entrada, np.ndarray):
+            h.update(str(entrada.dtype).encode())
+            h.update(np.ascontiguousarray(entrada).tobytes())
+        else:
+            h.update(json.dumps(entrada, sort_keys=True, default=str).encode())
+        h.update(b'|')
+    return h.hexdigest()
+
+
+def _tamano(valor):
+    """Bytes aproximados de un resultado (DataFrames, arreglos y contenedores)"""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, dict):
+        return sum(_tamano(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(_tamano(v) for v in valor)
+    return 64
+
+
+def _liberar_global():
+    """Descartar entradas globales menos usadas hasta respetar el tope de memoria"""
+    limite = MEMORIA_MAXIMA_MB * 1024 * 1024
+    total = sum(_USO_GLOBAL.values())
+    while _USO_GLOBAL and total > limite:
+        (id_cache, clave), tamano = _USO_GLOBAL.popitem(last=False)
+        total -= tamano
+        cache = _CACHES.get(id_cache)
+        if cache is not None and cache._entradas.pop(clave, None) is not None:
+            cache.descartes += 1
+
+
+def uso_global_bytes():
+    """Memoria total ocupada por las cachés de todas las sesiones"""
+    with _BLOQUEO:
+        return sum(_USO_GLOBAL.values())
+
+
+class CacheResultados:
+    """LRU de resultados por sesión, con conteo de aciertos y fallos"""
+
+    def __init__(self, max_entradas=8):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+        self.descartes = 0
+        _CACHES[id(self)] = self
+
+    def obtener(self, clave):
+        """Resultado guardado para la clave, o None si no está"""
+        with _BLOQUEO:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+            self._entradas.move_to_end(clave)
+            if (id(self), clave) in _USO_GLOBAL:
+                _USO_GLOBAL.move_to_end((id(self), clave))
+            return entrada[0]
+
+    def guardar(self, clave, valor):
+        """Guardar un resultado, descartando lo menos usado si se superan los topes"""
+        tamano = _tamano(valor)
+        with _BLOQUEO:
+            self._entradas[clave] = (valor, tamano)
+            self._entradas.move_to_end(clave)
+            _USO_GLOBAL[(id(self), clave)] = tamano
+            _USO_GLOBAL.move_to_end((id(self), clave))
+            while len(self._entradas) > self.max_entradas:
+                antigua, _ = self._entradas.popitem(last=False)
+                _USO_GLOBAL.pop((id(self), antigua), None)
+                self.descartes += 1
+            _liberar_global()
+
+    def memoizar(self, clave, calcular):
+        """Devolver el resultado guardado o calcularlo y guardarlo"""
+        resultado = self.obtener(clave)
+        if resultado is None:
+            resultado = calcular()
+            self.guardar(clave, resultado)
+        return resultado
+
+    def limpiar(self):
+        with _BLOQUEO:
+            for clave in self._entradas:
+                _USO_GLOBAL.pop((id(self), clave), None)
+            self._entradas.clear()
+
+    def estadisticas(self):
+        """Aciertos, fallos, descartes y memoria usada (sesión y global)"""
+        with _BLOQUEO:
+            consultas = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+                'descartes': self.descartes,
+                'entradas': len(self._entradas),
+                'bytes_sesion': sum(tamano for _, tamano in self._entradas.values()),
+                'bytes_global': sum(_USO_GLOBAL.values())
+            }
+
+    def __del__(self):
+        try:
+            self.limpiar()
+        except Exception:
+            pass
@@ -0,0 +1,265 @@
+"""Cálculo por lotes de Landed Cost y ventas sin servidor de Streamlit
+
+Ejemplo:
+    python calculo_lote.py proveedor_a.csv proveedor_b.xlsx \\
+        --aranceles aranceles.parquet --parametros parametros.json \\
+        --salida resultados --procesos 4
+
+    # Catálogo consolidado muy grande, en bloques de 500.000 filas
+    python calculo_lote.py consolidado.csv --aranceles aranceles.csv --bloque 500000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from motor_calculo import ErrorCalculo, calcular_todo, parametros_por_defecto, totales_prorrateo
+from validacion import verificar_catalogo
+
+FORMATOS = ('csv', 'xlsx', 'parquet')
+
+# Columnas de texto que no deben convertirse a número al leer
+COLUMNAS_TEXTO = {'sku': str, 'descripcion': str, 'hs_code': str, 'incoterm': str, 'categoria': str}
+
+# Tabla de aranceles cargada una vez por proceso
+_ARANCELES = None
+
+
+def leer_tabla(ruta):
+    """Leer una tabla CSV, XLSX o Parquet según su extensión"""
+    ruta = Path(ruta)
+    extension = ruta.suffix.lower()
+    if extension == '.csv':
+        return pd.read_csv(ruta, dtype=COLUMNAS_TEXTO)
+    if extension in ('.xlsx', '.xlsm'):
+        return pd.read_excel(ruta, dtype=COLUMNAS_TEXTO)
+    if extension == '.parquet':
+        return pd.read_parquet(ruta)
+    raise ValueError(f"Formato no soportado: {ruta.name} (use CSV, XLSX o Parquet)")
+
+
+def escribir_tabla(df, ruta):
+    """Escribir una tabla en el formato indicado por la extensión"""
+    extension = ruta.suffix.lower()
+    if extension == '.csv':
+        df.to_csv(ruta, index=False)
+    elif extension == '.xlsx':
+        df.to_excel(ruta, index=False)
+    else:
+        df.to_parquet(ruta, index=False)
+
+
+def leer_parametros(ruta):
+    """Leer parámetros con la forma de st.session_state.parametros (o un backup completo)"""
+    parametros = parametros_por_defecto()
+    if ruta:
+        with open(ruta, encoding='utf-8') as archivo:
+            datos = json.load(archivo)
+        parametros.update(datos.get('parametros', datos))
+    return parametros
+
+
+def leer_por_bloques(ruta, tamano_bloque):
+    """Leer una tabla CSV, Parquet o XLSX en bloques de a lo sumo ``tamano_bloque`` filas
+
+    Los XLSX se leen en modo streaming y sus encabezados se reconocen como en
+    ``importar_excel`` (proformas de proveedor).
+    """
+    ruta = Path(ruta)
+    extension = ruta.suffix.lower()
+    if extension == '.csv':
+        yield from pd.read_csv(ruta, dtype=COLUMNAS_TEXTO, chunksize=tamano_bloque)
+    elif extension == '.parquet':
+        import pyarrow.parquet as pq
+        for lote in pq.ParquetFile(ruta).iter_batches(batch_size=tamano_bloque):
+            yield lote.to_pandas()
+    elif extension in ('.xlsx', '.xlsm'):
+        from importar_excel import lotes_xlsx
+        yield from lotes_xlsx(ruta, 'productos', tamano_lote=tamano_bloque)
+    else:
+        raise ValueError(f"El modo por bloques solo admite CSV, Parquet o XLSX: {ruta.name}")
+
+
+class EscritorPorBloques:
+    """Escritor incremental de una tabla CSV o Parquet"""
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self.extension = self.ruta.suffix.lower()
+        if self.extension not in ('.csv', '.parquet'):
+            raise ValueError(f"El modo por bloques solo escribe CSV o Parquet: {self.ruta.name}")
+        self._parquet = None
+        self._primero = True
+
+    def escribir(self, df):
+        if self.extension == '.csv':
+            df.to_csv(self.ruta, index=False, mode='w' if self._primero else 'a', header=self._primero)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._parquet is None:
+                # El esquema sale del primer bloque; una columna de texto vacía en él queda como texto
+                esquema = pa.Table.from_pandas(df, preserve_index=False).schema
+                esquema = pa.schema([
+                    campo.with_type(pa.string()) if pa.types.is_null(campo.type) else campo for campo in esquema
+                ], metadata=esquema.metadata)
+                self._parquet = pq.ParquetWriter(self.ruta, esquema)
+            # Cada bloque se convierte al esquema del archivo, no al que se infiere de sus valores
+            self._parquet.write_table(pa.Table.from_pandas(df, schema=self._parquet.schema, preserve_index=False))
+        self._primero = False
+
+    def cerrar(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def procesar_por_bloques(nombre, ruta, parametros, directorio, formato, tamano_bloque):
+    """Calcular un catálogo grande en dos pasadas sin cargarlo completo en memoria
+
+    La primera pasada valida cada bloque y acumula los totales de prorrateo
+    (FOB o peso cobrable y unidades); la segunda calcula y escribe cada bloque
+    con esos totales globales. Los SKUs repetidos solo se detectan dentro de
+    un mismo bloque.
+    """
+    inicio = time.perf_counter()
+
+    # Primera pasada: validación y totales globales
+    totales = {'total_fob_usd': 0.0, 'total_cantidad': 0, 'total_peso_cobrable': 0.0}
+    for bloque in leer_por_bloques(ruta, tamano_bloque):
+        verificar_catalogo(bloque, _ARANCELES, parametros)
+        for clave, valor in totales_prorrateo(bloque, parametros).items():
+            totales[clave] += valor
+
+    # Segunda pasada: resultados por SKU, bloque a bloque
+    directorio = Path(directorio)
+    escritores = [
+        EscritorPorBloques(directorio / f"{nombre}_landed_cost.{formato}"),
+        EscritorPorBloques(directorio / f"{nombre}_ventas.{formato}")
+    ]
+    filas = 0
+    try:
+        for bloque in leer_por_bloques(ruta, tamano_bloque):
+            for escritor, tabla in zip(escritores, calcular_todo(bloque, _ARANCELES, parametros, totales)):
+                escritor.escribir(tabla)
+            filas += len(bloque)
+    finally:
+        for escritor in escritores:
+            escritor.cerrar()
+
+    return nombre, filas, time.perf_counter() - inicio
+
+
+def _inicializar_worker(ruta_aranceles):
+    global _ARANCELES
+    _ARANCELES = leer_tabla(ruta_aranceles)
+
+
+def procesar_embarque(nombre, productos, parametros, directorio, formato):
+    """Calcular un embarque (tabla o ruta de archivo) y escribir sus tablas landed_cost y ventas"""
+    inicio = time.perf_counter()
+    if not isinstance(productos, pd.DataFrame):
+        productos = leer_tabla(productos)
+    verificar_catalogo(productos, _ARANCELES, parametros)
+    landed_cost, ventas = calcular_todo(productos, _ARANCELES, parametros)
+
+    directorio = Path(directorio)
+    escribir_tabla(landed_cost, directorio / f"{nombre}_landed_cost.{formato}")
+    escribir_tabla(ventas, directorio / f"{nombre}_ventas.{formato}")
+    return nombre, len(productos), time.perf_counter() - inicio
+
+
+def _embarques(rutas, columna_embarque):
+    """Generar (nombre, productos) por archivo, o por valor de la columna de embarque"""
+    for ruta in rutas:
+        nombre = Path(ruta).stem
+        if not columna_embarque:
+            # Cada worker lee su propio archivo
+            yield nombre, str(ruta)
+            continue
+        productos = leer_tabla(ruta)
+        if columna_embarque not in productos.columns:
+            yield nombre, productos
+            continue
+        for embarque, grupo in productos.groupby(columna_embarque, sort=False):
+            yield f"{nombre}_{embarque}", grupo.reset_index(drop=True)
+
+
+def _tareas(rutas_productos, parametros, directorio, formato, columna_embarque, tamano_bloque):
+    """Lista de (función, argumentos) por embarque independiente"""
+    if tamano_bloque:
+        if columna_embarque:
+            raise ValueError("El modo por bloques no admite --columna-embarque")
+        if formato not in ('csv', 'parquet'):
+            raise ValueError(f"El modo por bloques solo escribe CSV o Parquet, no {formato}")
+        return [
+            (procesar_por_bloques, (Path(ruta).stem, str(ruta), parametros, directorio, formato, tamano_bloque))
+            for ruta in rutas_productos
+        ]
+    return [
+        (procesar_embarque, (nombre, productos, parametros, directorio, formato))
+        for nombre, productos in _embarques(rutas_productos, columna_embarque)
+    ]
+
+
+def ejecutar_lote(rutas_productos, ruta_aranceles, parametros, directorio,
+                  formato='csv', procesos=None, columna_embarque=None, tamano_bloque=None):
+    """Procesar embarques independientes en paralelo y devolver el resumen de rendimiento"""
+    Path(directorio).mkdir(parents=True, exist_ok=True)
+    procesos = procesos or os.cpu_count() or 1
+
+    inicio = time.perf_counter()
+    tareas = _tareas(rutas_productos, parametros, directorio, formato, columna_embarque, tamano_bloque)
+    if procesos == 1:
+        _inicializar_worker(ruta_aranceles)
+        resumen = [funcion(*argumentos) for funcion, argumentos in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_worker,
+                                 initargs=(ruta_aranceles,)) as pool:
+            futuros = [pool.submit(funcion, *argumentos) for funcion, argumentos in tareas]
+            resumen = [futuro.result() for futuro in futuros]
+
+    duracion = time.perf_counter() - inicio
+    resumen = pd.DataFrame(resumen, columns=['embarque', 'filas', 'segundos'])
+    resumen['filas_por_segundo'] = resumen['filas'] / resumen['segundos']
+    return resumen, duracion
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcular Landed Cost y ventas por lotes")
+    parser.add_argument('productos', nargs='+', help="Archivos de productos (CSV, XLSX o Parquet)")
+    parser.add_argument('--aranceles', required=True, help="Tabla de aranceles (CSV, XLSX o Parquet)")
+    parser.add_argument('--parametros', help="JSON de parámetros; los faltantes toman el valor por defecto")
+    parser.add_argument('--salida', default='resultados', help="Directorio de salida")
+    parser.add_argument('--formato', choices=FORMATOS, default='csv', help="Formato de las tablas de salida")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos en paralelo (por defecto, uno por núcleo)")
+    parser.add_argument('--columna-embarque', help="Columna que separa un archivo en embarques independientes")
+    parser.add_argument('--bloque', type=int, default=None,
+                        help="Filas por bloque: procesa cada archivo en dos pasadas con memoria acotada")
+    args = parser.parse_args(argv)
+    if args.bloque and args.formato == 'xlsx':
+        parser.error("--bloque solo escribe CSV o Parquet; use --formato csv o parquet")
+
+    try:
+        resumen, duracion = ejecutar_lote(
+            args.productos, args.aranceles, leer_parametros(args.parametros), args.salida,
+            formato=args.formato, procesos=args.procesos, columna_embarque=args.columna_embarque,
+            tamano_bloque=args.bloque
+        )
+    except ErrorCalculo as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+
+    for fila in resumen.itertuples():
+        print(f"{fila.embarque}: {fila.filas:,} filas en {fila.segundos:.2f} s ({fila.filas_por_segundo:,.0f} filas/s)")
+    total = resumen['filas'].sum()
+    print(f"Total: {total:,} filas en {duracion:.2f} s ({total / duracion:,.0f} filas/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Consolidación de órdenes de compra en embarques
+
+Los costos de despacho, transporte interno, almacenaje y el flete se pagan
+una vez por embarque. Juntar órdenes los reparte entre más mercancía, pero
+obliga a esperar a la última orden lista. El optimizador agrupa el backlog
+en embarques que minimizan Landed Cost total más costo de espera.
+
+Ejemplo:
+    python consolidacion.py ordenes.csv --aranceles aranceles.csv --salida ordenes_embarques.csv
+    python calculo_lote.py ordenes_embarques.csv --aranceles aranceles.csv --columna-embarque embarque
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from indice_aranceles import obtener_indice
+from motor_calculo import (
+    COLUMNAS_ARANCELES, COLUMNAS_PRODUCTOS, DIVISOR_VOLUMETRICO_POR_DEFECTO, PARAMETROS_LANDED_COST, ErrorCalculo,
+    _verificar_entradas, calcular_landed_cost, coeficientes_landed, costo_total_landed, fecha_aduana,
+    peso_cobrable_kg, prorratea_por_peso
+)
+from validacion import verificar_catalogo
+
+COLUMNAS_ORDENES = ['orden', 'fecha_lista']
+
+# Coeficientes del costo que dependen de cómo se reparte el flete dentro del embarque
+COEFICIENTES_FLETE = ('flete', 'flete_arancel')
+
+# Costo de esperar: fracción del valor FOB en COP por día (capital inmovilizado y ventas perdidas)
+COSTO_ESPERA_DIARIO_POR_DEFECTO = 0.0005
+
+COLUMNAS_EMBARQUES = [
+    'embarque', 'fecha_salida', 'ordenes', 'lineas', 'valor_fob_usd', 'costo_landed', 'costo_espera', 'costo_total'
+]
+
+
+def agregados_ordenes(productos, aranceles, parametros):
+    """Sumas por orden de compra con las que el costo de cualquier grupo sale en forma cerrada
+
+    Los coeficientes de ``coeficientes_landed`` se suman por orden. El flete y
+    los costos nacionales se reparten dentro de cada embarque, así que se
+    acumulan con la base de reparto sin normalizar (valor FOB o peso cobrable,
+    y unidades) y cada grupo los divide por su propio total.
+    """
+    _verificar_entradas(
+        {'productos': (productos, COLUMNAS_PRODUCTOS + COLUMNAS_ORDENES), 'aranceles': (aranceles, COLUMNAS_ARANCELES)},
+        parametros, PARAMETROS_LANDED_COST
+    )
+    cantidad = productos['cantidad'].to_numpy(dtype=float)
+    valor_fob_usd = cantidad * productos['precio_unitario_usd'].to_numpy(dtype=float)
+    arancel, iva, otros, _ = obtener_indice(aranceles).resolver(
+        productos['hs_code'], parametros['iva_importacion'], fecha_aduana(productos, parametros)
+    )
+
+    codigos, ordenes = pd.factorize(productos['orden'], sort=False)
+    if (codigos < 0).any():
+        raise ErrorCalculo("Hay líneas sin orden de compra")
+    fecha = pd.to_datetime(productos['fecha_lista'])
+    if fecha.isna().any():
+        raise ErrorCalculo("Hay líneas sin fecha de disponibilidad")
+
+    def por_orden(valores):
+        return np.bincount(codigos, weights=valores, minlength=len(ordenes))
+
+    peso = np.zeros(len(cantidad))
+    if prorratea_por_peso(parametros):
+        peso = peso_cobrable_kg(productos, parametros.get('divisor_volumetrico', DIVISOR_VOLUMETRICO_POR_DEFECTO))
+    # Participación en el flete y en los costos nacionales sin dividir por el total del grupo
+    por_valor = coeficientes_landed(cantidad, valor_fob_usd, valor_fob_usd, 1.0, arancel, iva, otros)
+    por_peso = coeficientes_landed(cantidad, valor_fob_usd, peso, 1.0, arancel, iva, otros)
+    # Fecha de cada orden: la de su última línea lista
+    fecha_orden = pd.Series(fecha.to_numpy()).groupby(codigos).max().to_numpy()
+    return pd.DataFrame({
+        'orden': ordenes,
+        'fecha_lista': fecha_orden,
+        'lineas': np.bincount(codigos, minlength=len(ordenes)),
+        'cantidad': por_orden(cantidad),
+        'valor_fob_usd': por_orden(valor_fob_usd),
+        'peso': por_orden(peso),
+        **{f'coef_{clave}': por_orden(valores) for clave, valores in por_valor.items()},
+        **{f'coef_{clave}_peso': por_orden(por_peso[clave]) for clave in COEFICIENTES_FLETE}
+    })
+
+
+def _costos_grupos(acumulados, inicio, fin, parametros):
+    """Landed Cost de los grupos de órdenes [inicio, fin) a partir de sumas acumuladas"""
+    def suma(columna):
+        return acumulados[columna][fin] - acumulados[columna][inicio]
+
+    valor, peso, cantidad = suma('valor_fob_usd'), suma('peso'), suma('cantidad')
+    coeficientes = {clave: suma(f'coef_{clave}') for clave in ('fob', 'fob_arancel')}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Flete por valor FOB, o por peso cobrable si el grupo registra peso
+        for clave in COEFICIENTES_FLETE:
+            coeficientes[clave] = np.where(valor > 0, suma(f'coef_{clave}') / valor, 0.0)
+            coeficientes[clave] = np.where(peso > 0, suma(f'coef_{clave}_peso') / peso, coeficientes[clave])
+        coeficientes['nacional'] = np.where(cantidad > 0, suma('coef_nacional') / cantidad, 0.0)
+    return costo_total_landed(coeficientes, parametros)
+
+
+def _costos_espera(acumulados, dias, inicio, fin, costo_espera_diario, usd_cop):
+    """Costo de que cada orden del grupo espere hasta la salida (fecha de la última orden)"""
+    valor = acumulados['valor_fob_usd'][fin] - acumulados['valor_fob_usd'][inicio]
+    valor_dias = acumulados['valor_dias'][fin] - acumulados['valor_dias'][inicio]
+    return costo_espera_diario * usd_cop * (dias[fin - 1] * valor - valor_dias)
+
+
+def optimizar_consolidacion(productos, aranceles, parametros, costo_espera_diario=COSTO_ESPERA_DIARIO_POR_DEFECTO,
+                            max_espera_dias=None):
+    """Agrupar las órdenes de compra en embarques con el menor costo total
+
+    Las órdenes se ordenan por fecha de disponibilidad y cada embarque toma un
+    tramo consecutivo, que sale cuando su última orden está lista. La partición
+    óptima se halla por programación dinámica sobre sumas acumuladas: cada paso
+    evalúa en un solo vector todos los embarques que terminan en una orden, así
+    que cientos de órdenes se resuelven en O(órdenes²) operaciones vectoriales.
+    El Landed Cost de los embarques elegidos se recalcula con
+    ``calcular_landed_cost``.
+    """
+    # Un mismo SKU puede venir en varias órdenes de compra
+    verificar_catalogo(productos, aranceles, parametros, omitir=('sku_duplicado',))
+    ordenes = agregados_ordenes(productos, aranceles, parametros)
+    ordenes = ordenes.sort_values(['fecha_lista', 'orden'], kind='stable').reset_index(drop=True)
+    n = len(ordenes)
+    if n == 0:
+        raise ErrorCalculo("No hay órdenes de compra para consolidar")
+
+    dias = ((ordenes['fecha_lista'] - ordenes['fecha_lista'].iloc[0]) / pd.Timedelta(days=1)).to_numpy()
+    acumulados = {
+        columna: np.concatenate([[0.0], np.cumsum(ordenes[columna].to_numpy(dtype=float))])
+        for columna in ordenes.columns.drop(['orden', 'fecha_lista', 'lineas'])
+    }
+    acumulados['valor_dias'] = np.concatenate([[0.0], np.cumsum(ordenes['valor_fob_usd'].to_numpy() * dias)])
+
+    # mejor[j]: costo mínimo de embarcar las primeras j órdenes; corte[j]: inicio de su último embarque
+    mejor = np.zeros(n + 1)
+    corte = np.zeros(n + 1, dtype=np.int64)
+    for fin in range(1, n + 1):
+        inicio = np.arange(fin)
+        costo = (
+            mejor[:fin] + _costos_grupos(acumulados, inicio, fin, parametros) +
+            _costos_espera(acumulados, dias, inicio, fin, costo_espera_diario, parametros['USD_COP'])
+        )
+        if max_espera_dias is not None:
+            costo = np.where(dias[fin - 1] - dias[:fin] <= max_espera_dias, costo, np.inf)
+        corte[fin] = np.argmin(costo)
+        mejor[fin] = costo[corte[fin]]
+
+    # Reconstruir los tramos desde la última orden
+    tramos = []
+    fin = n
+    while fin > 0:
+        tramos.append((corte[fin], fin))
+        fin = corte[fin]
+    tramos.reverse()
+
+    ordenes['embarque'] = 0
+    ordenes['fecha_salida'] = ordenes['fecha_lista']
+    for numero, (inicio, fin) in enumerate(tramos, start=1):
+        ordenes.loc[inicio:fin - 1, 'embarque'] = numero
+        ordenes.loc[inicio:fin - 1, 'fecha_salida'] = ordenes['fecha_lista'].iloc[fin - 1]
+    ordenes['espera_dias'] = (ordenes['fecha_salida'] - ordenes['fecha_lista']).dt.days
+
+    asignacion = pd.Series(ordenes['embarque'].to_numpy(), index=ordenes['orden'])
+    productos = productos.assign(embarque=asignacion.reindex(productos['orden']).to_numpy())
+
+    embarques = []
+    for numero, (inicio, fin) in enumerate(tramos, start=1):
+        landed_cost = calcular_landed_cost(productos[productos['embarque'] == numero], aranceles, parametros)
+        costo_espera = float(_costos_espera(acumulados, dias, inicio, fin, costo_espera_diario,
+                                            parametros['USD_COP']))
+        embarques.append({
+            'embarque': numero,
+            'fecha_salida': ordenes['fecha_lista'].iloc[fin - 1],
+            'ordenes': fin - inicio,
+            'lineas': int(ordenes['lineas'].iloc[inicio:fin].sum()),
+            'valor_fob_usd': ordenes['valor_fob_usd'].iloc[inicio:fin].sum(),
+            'costo_landed': landed_cost['costo_total'].sum(),
+            'costo_espera': costo_espera,
+            'costo_total': landed_cost['costo_total'].sum() + costo_espera
+        })
+    embarques = pd.DataFrame(embarques, columns=COLUMNAS_EMBARQUES)
+
+    # Referencia: cada orden en su propio embarque, sin esperar
+    inicio = np.arange(n)
+    sin_consolidar = float(_costos_grupos(acumulados, inicio, inicio + 1, parametros).sum())
+
+    return {
+        'ordenes': ordenes[['orden', 'fecha_lista', 'embarque', 'fecha_salida', 'espera_dias',
+                            'lineas', 'valor_fob_usd']],
+        'embarques': embarques,
+        'productos': productos,
+        'costo_total': embarques['costo_total'].sum(),
+        'costo_sin_consolidar': sin_consolidar,
+        'ahorro': sin_consolidar - embarques['costo_total'].sum()
+    }
+
+
+def main(argv=None):
+    from calculo_lote import escribir_tabla, leer_parametros, leer_tabla
+
+    parser = argparse.ArgumentParser(description="Agrupar órdenes de compra en embarques de menor costo total")
+    parser.add_argument('productos', help="Líneas de las órdenes, con columnas orden y fecha_lista")
+    parser.add_argument('--aranceles', required=True, help="Tabla de aranceles (CSV, XLSX o Parquet)")
+    parser.add_argument('--parametros', help="JSON de parámetros; los faltantes toman el valor por defecto")
+    parser.add_argument('--costo-espera', type=float, default=COSTO_ESPERA_DIARIO_POR_DEFECTO,
+                        help="Costo diario de espera como fracción del valor FOB")
+    parser.add_argument('--max-espera', type=float, default=None, help="Días máximos que puede esperar una orden")
+    parser.add_argument('--salida', required=True,
+                        help="Archivo de líneas con la columna embarque, para calculo_lote.py --columna-embarque")
+    args = parser.parse_args(argv)
+
+    try:
+        resultado = optimizar_consolidacion(
+            leer_tabla(args.productos), leer_tabla(args.aranceles), leer_parametros(args.parametros),
+            costo_espera_diario=args.costo_espera, max_espera_dias=args.max_espera
+        )
+    except ErrorCalculo as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    escribir_tabla(resultado['productos'], Path(args.salida))
+
+    print(resultado['embarques'].to_string(index=False, float_format='{:,.0f}'.format))
+    print(f"Costo total: {resultado['costo_total']:,.0f} COP "
+          f"(sin consolidar: {resultado['costo_sin_consolidar']:,.0f}; ahorro: {resultado['ahorro']:,.0f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
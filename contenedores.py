@@ -0,0 +1,280 @@
+"""Estimación de contenedores FCL/LCL para un embarque
+
+Reparte las unidades del catálogo entre contenedores de 20', 40' y 40'HC
+respetando volumen (CBM) y peso máximo, y sugiere la combinación más barata
+de contenedores completos (FCL) y carga consolidada (LCL). El flete estimado
+se puede usar como ``flete_internacional`` del Landed Cost.
+"""
+import numpy as np
+import pandas as pd
+
+from motor_calculo import ErrorCalculo
+
+# Capacidad interna, carga útil y costo de referencia por contenedor
+TIPOS_CONTENEDOR = {
+    "20'": {'volumen_m3': 33.2, 'peso_max_kg': 28_200.0, 'costo_usd': 2_200.0},
+    "40'": {'volumen_m3': 67.7, 'peso_max_kg': 26_700.0, 'costo_usd': 3_600.0},
+    "40'HC": {'volumen_m3': 76.3, 'peso_max_kg': 26_500.0, 'costo_usd': 3_900.0}
+}
+
+# LCL: tarifa por W/M (el mayor entre m³ y toneladas) con un mínimo cobrable
+TARIFA_LCL_USD_WM = 95.0
+MINIMO_LCL_WM = 1.0
+
+# Fracción del volumen interno que se llena en la práctica (estiba de cajas)
+APROVECHAMIENTO_POR_DEFECTO = 0.85
+
+# Combinaciones con costo aproximado más bajo que se cargan unidad por unidad
+CANDIDATOS_CARGA = 5
+
+# Rondas en que se agregan contenedores para la carga que quedó fuera al cargar
+MAX_REFUERZOS = 3
+
+COLUMNAS_PLAN = [
+    'contenedor', 'tipo', 'volumen_m3', 'peso_kg', 'ocupacion_volumen', 'ocupacion_peso', 'costo_usd'
+]
+
+COLUMNAS_CARGA = ['contenedor', 'sku', 'unidades', 'volumen_m3', 'peso_kg']
+
+_TOLERANCIA = 1e-9
+
+
+def tipos_contenedor():
+    """Copia de los tipos de contenedor por defecto"""
+    return {tipo: dict(datos) for tipo, datos in TIPOS_CONTENEDOR.items()}
+
+
+def costo_lcl(volumen_m3, peso_kg, tarifa=TARIFA_LCL_USD_WM, minimo=MINIMO_LCL_WM):
+    """Costo LCL de la carga por W/M; cero si no queda carga"""
+    wm = np.maximum(volumen_m3, np.asarray(peso_kg) / 1000)
+    return np.where(wm > _TOLERANCIA, tarifa * np.maximum(wm, minimo), 0.0)
+
+
+def _unidades(productos):
+    """Cantidad, volumen y peso unitarios; vacíos cuentan como cero"""
+    faltantes = [c for c in ['sku', 'cantidad', 'peso_unitario_kg', 'volumen_unitario_m3'] if c not in productos.columns]
+    if faltantes:
+        raise ErrorCalculo(f"Faltan columnas en productos: {', '.join(faltantes)}")
+    cantidad = np.nan_to_num(productos['cantidad'].to_numpy(dtype=float, na_value=np.nan)).clip(min=0).astype(np.int64)
+    volumen = np.nan_to_num(productos['volumen_unitario_m3'].to_numpy(dtype=float, na_value=np.nan)).clip(min=0)
+    peso = np.nan_to_num(productos['peso_unitario_kg'].to_numpy(dtype=float, na_value=np.nan)).clip(min=0)
+    return cantidad, volumen, peso
+
+
+def _combinaciones(volumen, peso, capacidades, costos, tarifa, minimo):
+    """Combinaciones de contenedores completos con el resto en LCL, con su costo aproximado
+
+    Trata la carga como divisible y mezclada: n contenedores cubren la
+    fracción min(Σ vol / V, Σ peso / W) del embarque y el resto va en LCL. Como
+    el problema continuo tiene dos restricciones, una combinación óptima usa a
+    lo sumo dos tipos de contenedor; basta recorrer pares de tipos y la cantidad
+    del primero, con la del segundo completando (o dejando un resto en LCL).
+    """
+    n_tipos = len(costos)
+    filas = [np.zeros((1, n_tipos), dtype=np.int64)]
+    necesarios = np.ceil(np.maximum(volumen / capacidades[:, 0], peso / capacidades[:, 1])).astype(np.int64)
+    for a in range(n_tipos):
+        n_a = np.arange(necesarios[a] + 1)
+        for b in range(n_tipos):
+            if b == a:
+                conteos = np.zeros((len(n_a), n_tipos), dtype=np.int64)
+                conteos[:, a] = n_a
+                filas.append(conteos)
+                continue
+            faltante = np.maximum(
+                (volumen - n_a * capacidades[a, 0]) / capacidades[b, 0],
+                (peso - n_a * capacidades[a, 1]) / capacidades[b, 1]
+            )
+            completa = np.ceil(faltante - _TOLERANCIA).clip(min=0).astype(np.int64)
+            for n_b in (completa, (completa - 1).clip(min=0)):
+                conteos = np.zeros((len(n_a), n_tipos), dtype=np.int64)
+                conteos[:, a] = n_a
+                conteos[:, b] = n_b
+                filas.append(conteos)
+    conteos = np.unique(np.concatenate(filas), axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cubierto = np.minimum(
+            np.where(volumen > 0, conteos @ capacidades[:, 0] / volumen, np.inf),
+            np.where(peso > 0, conteos @ capacidades[:, 1] / peso, np.inf)
+        )
+    resto = (1 - cubierto).clip(min=0)
+    costo = conteos @ costos + costo_lcl(resto * volumen, resto * peso, tarifa, minimo)
+    orden = np.lexsort((conteos.sum(axis=1), costo))
+    return conteos[orden], costo[orden]
+
+
+def _orden_carga(volumen, peso):
+    """Orden de SKUs que alterna los más densos con los más livianos
+
+    Así los contenedores llenan volumen y peso a la vez en lugar de agotar
+    uno solo de los dos límites con tramos homogéneos del catálogo.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        densidad = np.where(volumen > 0, peso / volumen, np.inf)
+    orden = np.argsort(densidad, kind='stable')
+    alternado = np.empty_like(orden)
+    mitad = (len(orden) + 1) // 2
+    alternado[0::2] = orden[::-1][:mitad]
+    alternado[1::2] = orden[:len(orden) - mitad]
+    return alternado
+
+
+def _cargar(cantidad, volumen, peso, capacidades_contenedores):
+    """Llenar los contenedores en orden, partiendo SKUs por unidades (next-fit)
+
+    Con sumas acumuladas de volumen y peso del flujo de unidades, el punto
+    donde se llena cada contenedor se ubica con búsqueda binaria: el costo es
+    O(contenedores · log SKUs) más una fila por tramo cargado.
+    """
+    n = len(cantidad)
+    volumen_acumulado = np.concatenate([[0.0], np.cumsum(cantidad * volumen)])
+    peso_acumulado = np.concatenate([[0.0], np.cumsum(cantidad * peso)])
+    tramos = []
+    sku, tomadas = 0, 0
+    for contenedor, (cap_volumen, cap_peso) in enumerate(capacidades_contenedores):
+        if sku >= n:
+            break
+        limite_volumen = volumen_acumulado[sku] + tomadas * volumen[sku] + cap_volumen
+        limite_peso = peso_acumulado[sku] + tomadas * peso[sku] + cap_peso
+        fin = min(
+            np.searchsorted(volumen_acumulado, limite_volumen + _TOLERANCIA, side='right') - 1,
+            np.searchsorted(peso_acumulado, limite_peso + _TOLERANCIA, side='right') - 1
+        )
+        if fin >= n:
+            fin_sku, fin_unidades = n, 0
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                caben = min(
+                    np.floor((limite_volumen - volumen_acumulado[fin]) / volumen[fin] + _TOLERANCIA)
+                    if volumen[fin] > 0 else np.inf,
+                    np.floor((limite_peso - peso_acumulado[fin]) / peso[fin] + _TOLERANCIA)
+                    if peso[fin] > 0 else np.inf
+                )
+            fin_sku, fin_unidades = fin, int(min(caben, cantidad[fin]))
+
+        # Tramos: resto del SKU inicial, SKUs completos y el inicio del SKU final
+        skus = np.arange(sku, min(fin_sku, n - 1) + 1)
+        desde = np.where(skus == sku, tomadas, 0)
+        hasta = np.where(skus == fin_sku, fin_unidades, cantidad[skus])
+        unidades = hasta - desde
+        con_carga = unidades > 0
+        tramos.append((np.full(con_carga.sum(), contenedor), skus[con_carga], unidades[con_carga]))
+        sku, tomadas = fin_sku, fin_unidades
+        if sku < n and tomadas >= cantidad[sku]:
+            sku, tomadas = sku + 1, 0
+
+    if tramos:
+        contenedor, skus, unidades = (np.concatenate(partes) for partes in zip(*tramos))
+    else:
+        contenedor, skus, unidades = (np.array([], dtype=np.int64) for _ in range(3))
+
+    # Lo que no entró en los contenedores queda para LCL
+    pendientes = cantidad.copy()
+    np.subtract.at(pendientes, skus, unidades)
+    return contenedor, skus, unidades, pendientes
+
+
+def estimar_contenedores(productos, tipos=None, tarifa_lcl=TARIFA_LCL_USD_WM, minimo_lcl=MINIMO_LCL_WM,
+                         aprovechamiento=APROVECHAMIENTO_POR_DEFECTO):
+    """Sugerir la combinación FCL/LCL más barata para el embarque y cargar los SKUs
+
+    Evalúa en forma cerrada todas las combinaciones candidatas (ver
+    ``_combinaciones``) y carga unidad por unidad solo las más baratas, porque
+    las unidades enteras y los productos que no caben pueden dejar carga para
+    LCL. Devuelve el plan por contenedor, la carga por SKU, las unidades en LCL
+    y el costo total del flete en USD.
+    """
+    tipos = tipos_contenedor() if tipos is None else tipos
+    if not tipos:
+        raise ErrorCalculo("Se necesita al menos un tipo de contenedor")
+    if not 0 < aprovechamiento <= 1:
+        raise ErrorCalculo("El aprovechamiento debe estar entre 0 y 1")
+
+    nombres = list(tipos)
+    capacidades = np.array([
+        [tipos[t]['volumen_m3'] * aprovechamiento, tipos[t]['peso_max_kg']] for t in nombres
+    ], dtype=float)
+    costos = np.array([tipos[t]['costo_usd'] for t in nombres], dtype=float)
+
+    cantidad, volumen, peso = _unidades(productos)
+    orden = _orden_carga(volumen, peso)
+    cantidad, volumen, peso = cantidad[orden], volumen[orden], peso[orden]
+
+    volumen_total = float(cantidad @ volumen)
+    peso_total = float(cantidad @ peso)
+
+    # Unidades que no caben en ningún contenedor van directo a LCL
+    cabe = ((volumen[:, None] <= capacidades[:, 0]) & (peso[:, None] <= capacidades[:, 1])).any(axis=1)
+    fuera_de_medida = np.where(cabe, 0, cantidad)
+    cantidad_fcl = cantidad - fuera_de_medida
+    conteos, _ = _combinaciones(cantidad_fcl @ volumen, cantidad_fcl @ peso, capacidades, costos,
+                                tarifa_lcl, minimo_lcl)
+
+    mejor = None
+    for conteo in conteos[:CANDIDATOS_CARGA]:
+        for _ in range(MAX_REFUERZOS + 1):
+            # Contenedores más grandes primero
+            posiciones = np.repeat(np.arange(len(nombres)), conteo)
+            posiciones = posiciones[np.lexsort((-capacidades[posiciones, 1], -capacidades[posiciones, 0]))]
+            contenedor, skus, unidades, pendientes = _cargar(cantidad_fcl, volumen, peso, capacidades[posiciones])
+            pendientes = pendientes + fuera_de_medida
+            volumen_lcl, peso_lcl = pendientes @ volumen, pendientes @ peso
+            costo = costos[posiciones].sum() + float(costo_lcl(volumen_lcl, peso_lcl, tarifa_lcl, minimo_lcl))
+            if mejor is None or costo < mejor[0] - _TOLERANCIA:
+                mejor = (costo, posiciones, contenedor, skus, unidades, pendientes)
+
+            # Si el resto en LCL sale caro, sumar los contenedores que convienen para ese resto
+            refuerzo, _ = _combinaciones(volumen_lcl, peso_lcl, capacidades, costos, tarifa_lcl, minimo_lcl)
+            if not refuerzo[0].any():
+                break
+            conteo = conteo + refuerzo[0]
+
+    costo_total, posiciones, contenedor, skus, unidades, pendientes = mejor
+    etiquetas = np.array([f"{nombres[p]} #{i + 1}" for i, p in enumerate(posiciones)], dtype=object)
+
+    carga = pd.DataFrame({
+        'contenedor': etiquetas[contenedor] if len(contenedor) else np.array([], dtype=object),
+        'sku': productos['sku'].to_numpy(dtype=object)[orden][skus],
+        'unidades': unidades,
+        'volumen_m3': unidades * volumen[skus],
+        'peso_kg': unidades * peso[skus]
+    }, columns=COLUMNAS_CARGA)
+
+    volumen_contenedor = np.bincount(contenedor, weights=unidades * volumen[skus], minlength=len(posiciones))
+    peso_contenedor = np.bincount(contenedor, weights=unidades * peso[skus], minlength=len(posiciones))
+    volumen_lcl = float(pendientes @ volumen)
+    peso_lcl = float(pendientes @ peso)
+    plan = pd.DataFrame({
+        'contenedor': etiquetas,
+        'tipo': np.array(nombres, dtype=object)[posiciones],
+        'volumen_m3': volumen_contenedor,
+        'peso_kg': peso_contenedor,
+        'ocupacion_volumen': volumen_contenedor / (capacidades[posiciones, 0] / aprovechamiento),
+        'ocupacion_peso': peso_contenedor / capacidades[posiciones, 1],
+        'costo_usd': costos[posiciones]
+    }, columns=COLUMNAS_PLAN)
+    if volumen_lcl > _TOLERANCIA or peso_lcl > _TOLERANCIA:
+        plan = pd.concat([plan, pd.DataFrame([{
+            'contenedor': 'LCL', 'tipo': 'LCL', 'volumen_m3': volumen_lcl, 'peso_kg': peso_lcl,
+            'ocupacion_volumen': np.nan, 'ocupacion_peso': np.nan,
+            'costo_usd': float(costo_lcl(volumen_lcl, peso_lcl, tarifa_lcl, minimo_lcl))
+        }], columns=COLUMNAS_PLAN)], ignore_index=True)
+
+    en_lcl = pendientes > 0
+    lcl = pd.DataFrame({
+        'sku': productos['sku'].to_numpy(dtype=object)[orden][en_lcl],
+        'unidades': pendientes[en_lcl],
+        'volumen_m3': pendientes[en_lcl] * volumen[en_lcl],
+        'peso_kg': pendientes[en_lcl] * peso[en_lcl]
+    })
+
+    return {
+        'plan': plan,
+        'carga': carga,
+        'lcl': lcl,
+        'contenedores': {t: int((plan['tipo'] == t).sum()) for t in nombres},
+        'volumen_m3': volumen_total,
+        'peso_kg': peso_total,
+        'costo_flete_usd': costo_total
+    }
@@ -0,0 +1,244 @@
+"""Representación compacta y tipada de productos y aranceles en memoria
+
+Cada sesión guarda sus tablas con el tipo más angosto que no pierde datos:
+categóricas para los textos que se repiten (incoterm, categoría, HS Code),
+enteros de 32 bits para las cantidades, ``float32`` para pesos y volúmenes
+y para las tasas o precios que lo admiten sin pérdida, y los SKUs y
+descripciones como cadenas internadas (una sola copia de cada texto aunque
+aparezca en varias tablas). El motor de cálculo lee las columnas como
+``float64``/``int64``: precios y tasas solo se compactan sin pérdida, y los
+pesos y volúmenes conservan 6 decimales (el costo varía en fracciones de peso).
+
+Ejemplo:
+    productos = compactar(productos, 'productos')
+    reporte = reporte_memoria(expandir(productos, 'productos'), productos)
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Tipo lógico por columna; las columnas fuera del esquema no se tocan
+ESQUEMAS = {
+    'productos': {
+        'sku': 'texto',
+        'descripcion': 'texto',
+        'cantidad': 'entero',
+        'peso_unitario_kg': 'medida',
+        'volumen_unitario_m3': 'medida',
+        'precio_unitario_usd': 'exacto',
+        'hs_code': 'categoria',
+        'incoterm': 'categoria',
+        'categoria': 'categoria'
+    },
+    'aranceles': {
+        'hs_code': 'texto',
+        'descripcion': 'texto',
+        'arancel_porcentaje': 'exacto',
+        'iva_porcentaje': 'exacto',
+        'otros_impuestos': 'exacto',
+        'fuente': 'categoria'
+    }
+}
+
+# Decimales que conservan pesos y volúmenes en float32 (gramos y centímetros cúbicos sobran)
+DECIMALES_MEDIDA = 6
+
+# Una columna 'categoria' con más valores distintos que esta fracción de filas queda como texto
+FRACCION_CATEGORICA = 0.5
+
+COLUMNAS_REPORTE = ['columna', 'tipo_antes', 'tipo_despues', 'bytes_antes', 'bytes_despues', 'ahorro']
+
+
+def _es_texto(serie):
+    return serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype)
+
+
+def _internar(serie):
+    """Misma columna de texto con cada cadena reemplazada por su copia internada"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie
+    valores = serie.to_numpy(dtype=object)
+    internados = np.array([sys.intern(v) if type(v) is str else v for v in valores], dtype=object)
+    return pd.Series(pd.array(internados, dtype=serie.dtype), index=serie.index, name=serie.name)
+
+
+def _categoria(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype) or not _es_texto(serie):
+        return serie
+    if serie.nunique() > FRACCION_CATEGORICA * len(serie):
+        return _internar(serie)
+    return serie.astype('category')
+
+
+def _entero(serie):
+    """int32 si todas las cantidades son enteras y caben; si no, la columna tal cual"""
+    if not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+        return serie
+    valores = serie.to_numpy(dtype=float, na_value=np.nan)
+    limite = np.iinfo(np.int32)
+    if not (np.isfinite(valores).all() and (valores == np.round(valores)).all() and
+            (valores >= limite.min).all() and (valores <= limite.max).all()):
+        return serie
+    return pd.Series(valores.astype(np.int32), index=serie.index, name=serie.name)
+
+
+def _flotante(serie, decimales=None):
+    """float32 si conserva los valores: exactos, o hasta ``decimales`` si se indican"""
+    if not pd.api.types.is_float_dtype(serie) or serie.dtype == np.float32:
+        return serie
+    valores = serie.to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(over='ignore'):
+        compactos = valores.astype(np.float32)
+    recuperados = compactos.astype(float)
+    if decimales is not None:
+        recuperados, valores = np.round(recuperados, decimales), np.round(valores, decimales)
+    if not np.array_equal(recuperados, valores, equal_nan=True):
+        return serie
+    return pd.Series(compactos, index=serie.index, name=serie.name)
+
+
+_CONVERSIONES = {
+    'texto': _internar,
+    'categoria': _categoria,
+    'entero': _entero,
+    'medida': lambda serie: _flotante(serie, DECIMALES_MEDIDA),
+    'exacto': _flotante
+}
+
+
+def compactar(tabla, esquema):
+    """Nueva tabla con cada columna del esquema en su tipo compacto (las demás se comparten)"""
+    columnas = {
+        columna: _CONVERSIONES[tipo](tabla[columna])
+        for columna, tipo in ESQUEMAS[esquema].items() if columna in tabla.columns and len(tabla)
+    }
+    return tabla.assign(**columnas)
+
+
+def actualizar_filas(tabla, nueva, filas, esquema):
+    """Tabla compacta con las filas ``filas`` (posiciones) tomadas de ``nueva``
+
+    Para ediciones de celdas: solo se convierten las filas editadas, sin
+    recompactar el catálogo. Si ``nueva`` cambia de forma, o una fila editada
+    ya no cabe en el tipo compacto de su columna, se recompacta esa parte completa.
+    """
+    if len(nueva) != len(tabla) or list(nueva.columns) != list(tabla.columns):
+        return compactar(nueva, esquema)
+    filas = np.asarray(filas, dtype=np.int64)
+    columnas = {}
+    for columna in tabla.columns:
+        actual, tipo = tabla[columna], ESQUEMAS[esquema].get(columna)
+        if tipo is None:
+            columnas[columna] = nueva[columna]
+            continue
+        editadas = nueva[columna].iloc[filas]
+        if pd.Series(actual.iloc[filas].to_numpy(dtype=object)).equals(pd.Series(editadas.to_numpy(dtype=object))):
+            # Columna sin cambios: se comparte sin copiar
+            columnas[columna] = actual
+            continue
+        if isinstance(actual.dtype, pd.CategoricalDtype):
+            # Directo sobre los códigos: add_categories recorre todas las categorías
+            categorias = actual.cat.categories
+            nuevas = pd.Index(editadas.dropna().unique()).difference(categorias)
+            if len(nuevas):
+                categorias = categorias.append(nuevas)
+            codigos = actual.cat.codes.to_numpy().copy()
+            codigos[filas] = categorias.get_indexer(editadas)
+            columnas[columna] = pd.Series(pd.Categorical.from_codes(codigos, dtype=pd.CategoricalDtype(categorias)),
+                                          index=nueva.index, name=columna)
+            continue
+        if _es_texto(actual):
+            editadas = _internar(editadas)
+        elif actual.dtype != nueva[columna].dtype:
+            editadas = _CONVERSIONES[tipo](editadas)
+            if editadas.dtype != actual.dtype:
+                columnas[columna] = _CONVERSIONES[tipo](nueva[columna])
+                continue
+        serie = actual.copy()
+        serie.iloc[filas] = editadas.to_numpy()
+        columnas[columna] = serie
+    return pd.DataFrame(columnas, index=nueva.index)
+
+
+def _copiar_textos(serie):
+    """Misma columna de texto con una cadena propia por celda, como al leerla de un archivo"""
+    valores = serie.to_numpy(dtype=object)
+    copias = np.array([v.encode().decode() if type(v) is str else v for v in valores], dtype=object)
+    return pd.Series(pd.array(copias, dtype=serie.dtype), index=serie.index, name=serie.name)
+
+
+def expandir(tabla, esquema, copiar_textos=False):
+    """Nueva tabla con los tipos anchos de siempre: texto en lugar de categóricas, 64 bits en los números
+
+    Es la forma que esperan los editores (admiten valores nuevos) y los backups.
+    Con ``copiar_textos`` cada celda de texto recibe su propia cadena, así la
+    tabla ocupa lo mismo que antes de compactar (para medir el ahorro).
+    """
+    columnas = {}
+    for columna, tipo in ESQUEMAS[esquema].items():
+        if columna not in tabla.columns:
+            continue
+        serie = tabla[columna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            serie = serie.astype(serie.cat.categories.dtype)
+            columnas[columna] = _copiar_textos(serie) if copiar_textos and _es_texto(serie) else serie
+        elif copiar_textos and _es_texto(serie):
+            columnas[columna] = _copiar_textos(serie)
+        elif serie.dtype == np.float32:
+            valores = serie.to_numpy(dtype=float)
+            columnas[columna] = np.round(valores, DECIMALES_MEDIDA) if tipo == 'medida' else valores
+        elif serie.dtype == np.int32:
+            columnas[columna] = serie.to_numpy(dtype=np.int64)
+    return tabla.assign(**columnas)
+
+
+def _bytes_columna(serie, vistos):
+    """Bytes de una columna; cada objeto de texto se cuenta una vez entre todas las columnas"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy().nbytes + _bytes_columna(pd.Series(serie.cat.categories), vistos)
+    if _es_texto(serie):
+        valores = serie.to_numpy(dtype=object)
+        # Objetos distintos por identidad (las cadenas internadas comparten una sola)
+        ids, primeras = np.unique(np.fromiter(map(id, valores), dtype=np.int64, count=len(valores)),
+                                  return_index=True)
+        nuevos = np.fromiter((i not in vistos for i in ids.tolist()), dtype=bool, count=len(ids))
+        vistos.update(ids[nuevos].tolist())
+        return valores.nbytes + sum(map(sys.getsizeof, valores[primeras[nuevos]]))
+    return int(serie.memory_usage(index=False, deep=True))
+
+
+def memoria_columnas(tabla, vistos=None):
+    """Bytes por columna (Series), sin contar dos veces las cadenas compartidas"""
+    vistos = set() if vistos is None else vistos
+    return pd.Series({columna: _bytes_columna(tabla[columna], vistos) for columna in tabla.columns}, dtype=np.int64)
+
+
+def reporte_memoria(antes, despues):
+    """Tipo y bytes de cada columna antes y después de compactar, con una fila TOTAL"""
+    bytes_antes, bytes_despues = memoria_columnas(antes), memoria_columnas(despues)
+    reporte = pd.DataFrame({
+        'columna': list(despues.columns),
+        'tipo_antes': [str(antes[c].dtype) if c in antes.columns else '' for c in despues.columns],
+        'tipo_despues': [str(despues[c].dtype) for c in despues.columns],
+        'bytes_antes': bytes_antes.reindex(despues.columns, fill_value=0).to_numpy(),
+        'bytes_despues': bytes_despues.to_numpy()
+    })
+    total = {'columna': 'TOTAL', 'tipo_antes': '', 'tipo_despues': '',
+             'bytes_antes': int(bytes_antes.sum()), 'bytes_despues': int(bytes_despues.sum())}
+    reporte = pd.concat([reporte, pd.DataFrame([total])], ignore_index=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reporte['ahorro'] = np.where(
+            reporte['bytes_antes'] > 0, 1 - reporte['bytes_despues'] / reporte['bytes_antes'], 0.0
+        )
+    return reporte[COLUMNAS_REPORTE]
+
+
+def memoria_tablas(tablas):
+    """Filas y bytes de cada tabla de la sesión; las cadenas compartidas se cobran a la primera"""
+    vistos = set()
+    filas = [
+        {'tabla': nombre, 'filas': len(tabla), 'bytes': int(memoria_columnas(tabla, vistos).sum())}
+        for nombre, tabla in tablas.items() if isinstance(tabla, pd.DataFrame)
+    ]
+    return pd.DataFrame(filas, columns=['tabla', 'filas', 'bytes'])
@@ -0,0 +1,202 @@
+"""Historial diario de tasas de cambio en archivos locales
+
+Cada par (USD_COP, CNY_USD) se guarda en un CSV ``fecha,valor`` ordenado
+por fecha. En memoria queda como dos arreglos ordenados, así la tasa vigente
+en una fecha (la última publicada en o antes de ella) se obtiene por búsqueda
+binaria, para una fecha o para miles a la vez.
+
+Ejemplo:
+    historial = HistorialTasas()
+    historial.importar_csv('USD_COP', 'trm_banrep.csv')
+    historial.registrar('USD_COP', '2024-06-03', 4015.2)
+    parametros = historial.parametros_a_fecha(parametros, '2024-05-31')
+"""
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PARES = ('USD_COP', 'CNY_USD')
+
+DIRECTORIO_POR_DEFECTO = Path(os.environ.get('CALCULADORA_TASAS_DIR', Path(__file__).parent / 'tasas'))
+
+# Encabezados habituales de archivos de TRM (datos.gov.co, Banco de la República) y propios
+COLUMNAS_FECHA = ['vigenciadesde', 'fecha', 'fecha (dd/mm/aaaa)', 'date']
+COLUMNAS_VALOR = ['valor', 'trm', 'tasa', 'tasa de cambio representativa del mercado (trm)', 'value']
+
+# Las sesiones que escriben en el mismo directorio releen el archivo bajo este bloqueo
+_BLOQUEO = threading.Lock()
+
+
+def _fechas(valores):
+    """Convertir fechas (texto, datetime o datetime64) a datetime64[D]
+
+    Las fechas ISO (2024-01-31) se leen tal cual; las demás, día primero (31/01/2024).
+    """
+    valores = np.asarray(valores)
+    if np.issubdtype(valores.dtype, np.datetime64):
+        return valores.astype('datetime64[D]')
+    try:
+        fechas = pd.to_datetime(valores, format='ISO8601')
+    except (ValueError, TypeError):
+        fechas = pd.to_datetime(valores, dayfirst=True, format='mixed')
+    return np.asarray(fechas, dtype='datetime64[ns]').astype('datetime64[D]')
+
+
+def _numeros(valores):
+    """Leer valores numéricos con separadores locales ('4.123,45', '$4,123.45', '4123.45')"""
+    serie = pd.Series(valores)
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.to_numpy(dtype=float)
+    texto = serie.astype(str).str.replace(r'[^\d,.\-]', '', regex=True)
+    ultima_coma, ultimo_punto = texto.str.rfind(','), texto.str.rfind('.')
+    comas, puntos = texto.str.count(','), texto.str.count(r'\.')
+    # Con un solo tipo de separador, agrupa miles si se repite ('1.000.000') o si
+    # aparece una vez seguido de tres dígitos ('4,123', '1.000'), salvo tras un cero ('0,125')
+    miles = texto.str.fullmatch(r'-?[1-9]\d{0,2}[,.]\d{3}')
+    coma_decimal = (ultima_coma > ultimo_punto) & ~((puntos == 0) & ((comas > 1) | miles))
+    punto_decimal = (ultimo_punto > ultima_coma) & ~((comas == 0) & ((puntos > 1) | miles))
+    texto = pd.Series(np.select(
+        [coma_decimal, punto_decimal],
+        [texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False),
+         texto.str.replace(',', '', regex=False)],
+        texto.str.replace(r'[,.]', '', regex=True)
+    ), index=texto.index)
+    return pd.to_numeric(texto, errors='coerce').to_numpy(dtype=float)
+
+
+def leer_trm(fuente):
+    """Leer un archivo de tasas con columnas de fecha y valor, ordenado y sin fechas repetidas"""
+    tabla = pd.read_csv(fuente, sep=None, engine='python', dtype=str)
+    columnas = {c.strip().lower(): c for c in tabla.columns}
+    fecha = next((columnas[c] for c in COLUMNAS_FECHA if c in columnas), None)
+    valor = next((columnas[c] for c in COLUMNAS_VALOR if c in columnas), None)
+    if fecha is None or valor is None:
+        raise ValueError(f"No se encontraron columnas de fecha y valor en: {', '.join(tabla.columns)}")
+
+    serie = pd.DataFrame({'fecha': _fechas(tabla[fecha]), 'valor': _numeros(tabla[valor])}).dropna()
+    serie = serie[serie['valor'] > 0]
+    return serie.drop_duplicates('fecha', keep='last').sort_values('fecha', ignore_index=True)
+
+
+class HistorialTasas:
+    """Series diarias de tasas de cambio con consultas por fecha en O(log n)"""
+
+    def __init__(self, directorio=None):
+        self.directorio = Path(directorio) if directorio is not None else DIRECTORIO_POR_DEFECTO
+        self._series = {}
+
+    def _ruta(self, par):
+        if par not in PARES:
+            raise ValueError(f"Par de monedas desconocido: {par}")
+        return self.directorio / f"{par}.csv"
+
+    def serie(self, par):
+        """Fechas (datetime64[D]) y valores ordenados del par; vacíos si no hay historial"""
+        if par not in self._series:
+            ruta = self._ruta(par)
+            if ruta.exists():
+                # Otra sesión pudo agregar fechas fuera de orden: la última registrada prevalece
+                tabla = pd.read_csv(ruta)
+                tabla = pd.DataFrame({'fecha': _fechas(tabla['fecha']), 'valor': tabla['valor'].to_numpy(dtype=float)})
+                tabla = tabla.drop_duplicates('fecha', keep='last').sort_values('fecha', ignore_index=True)
+                self._series[par] = (tabla['fecha'].to_numpy().astype('datetime64[D]'), tabla['valor'].to_numpy())
+            else:
+                self._series[par] = (np.array([], dtype='datetime64[D]'), np.array([], dtype=float))
+        return self._series[par]
+
+    def tasas(self, par, fechas):
+        """Tasa vigente en cada fecha (la última en o antes de ella); NaN antes del historial"""
+        historial, valores = self.serie(par)
+        fechas = _fechas(np.atleast_1d(fechas))
+        posiciones = np.searchsorted(historial, fechas, side='right') - 1
+        return np.where(posiciones >= 0, valores[posiciones.clip(min=0)] if len(valores) else np.nan, np.nan)
+
+    def tasa(self, par, fecha=None):
+        """Tasa vigente en una fecha (por defecto, la última registrada); None si no hay dato"""
+        historial, valores = self.serie(par)
+        if fecha is None:
+            return float(valores[-1]) if len(valores) else None
+        tasa = self.tasas(par, fecha)[0]
+        return None if np.isnan(tasa) else float(tasa)
+
+    def rango(self, par, desde, hasta):
+        """Tasas registradas entre dos fechas (incluidas), sin recorrer la serie"""
+        historial, valores = self.serie(par)
+        inicio = np.searchsorted(historial, _fechas([desde])[0], side='left')
+        fin = np.searchsorted(historial, _fechas([hasta])[0], side='right')
+        return pd.DataFrame({'fecha': historial[inicio:fin], 'valor': valores[inicio:fin]})
+
+    def serie_diaria(self, par, desde, hasta):
+        """Tasa vigente en cada día calendario del rango (fines de semana y festivos incluidos)"""
+        dias = np.arange(_fechas([desde])[0], _fechas([hasta])[0] + 1)
+        return pd.DataFrame({'fecha': dias, 'valor': self.tasas(par, dias)})
+
+    def primera_fecha(self, par):
+        historial, _ = self.serie(par)
+        return historial[0] if len(historial) else None
+
+    def ultima_fecha(self, par):
+        historial, _ = self.serie(par)
+        return historial[-1] if len(historial) else None
+
+    def parametros_a_fecha(self, parametros, fecha):
+        """Copia de los parámetros con USD_COP y CNY_USD vigentes en la fecha (si hay historial)"""
+        parametros = dict(parametros)
+        for par in PARES:
+            tasa = self.tasa(par, fecha)
+            if tasa is not None:
+                parametros[par] = tasa
+        return parametros
+
+    def importar_csv(self, par, fuente):
+        """Combinar un archivo de TRM con el historial; el archivo prevalece en fechas repetidas
+
+        Devuelve cuántas fechas nuevas se agregaron. El archivo del par se
+        reescribe completo (en un temporal que luego lo reemplaza).
+        """
+        nuevas = leer_trm(fuente)
+        ruta = self._ruta(par)
+        with _BLOQUEO:
+            # Releer el archivo: otra sesión pudo escribirlo después de cargar la serie
+            self._series.pop(par, None)
+            historial, valores = self.serie(par)
+            combinada = pd.concat([pd.DataFrame({'fecha': historial, 'valor': valores}), nuevas], ignore_index=True)
+            combinada = combinada.drop_duplicates('fecha', keep='last').sort_values('fecha', ignore_index=True)
+            agregadas = len(combinada) - len(historial)
+
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=ruta.parent, suffix='.tmp', delete=False, newline='') as temporal:
+                combinada.assign(fecha=combinada['fecha'].astype(str)).to_csv(temporal, index=False)
+            os.replace(temporal.name, ruta)
+        self._series[par] = (combinada['fecha'].to_numpy().astype('datetime64[D]'),
+                             combinada['valor'].to_numpy(dtype=float))
+        return agregadas
+
+    def registrar(self, par, fecha, valor):
+        """Agregar la tasa de un día posterior al último registrado (solo se añade al final del archivo)"""
+        valor = float(valor)
+        if not valor > 0:
+            raise ValueError("La tasa debe ser mayor que cero")
+        fecha = _fechas([fecha])[0]
+        ruta = self._ruta(par)
+        with _BLOQUEO:
+            # Releer el archivo: otra sesión pudo registrar fechas después de cargar la serie
+            self._series.pop(par, None)
+            historial, valores = self.serie(par)
+            if len(historial) and fecha <= historial[-1]:
+                if fecha == historial[-1] and valor == valores[-1]:
+                    return False
+                raise ValueError(f"Ya hay tasas de {par} hasta {historial[-1]}; use importar_csv para corregir fechas anteriores")
+
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            nuevo = not ruta.exists()
+            with open(ruta, 'a', encoding='utf-8', newline='') as archivo:
+                if nuevo:
+                    archivo.write('fecha,valor\n')
+                archivo.write(f"{fecha},{valor!r}\n")
+            self._series[par] = (np.append(historial, fecha), np.append(valores, valor))
+        return True
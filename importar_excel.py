@@ -0,0 +1,268 @@
+"""Importación masiva de proformas de proveedores y tablas de aranceles desde Excel
+
+El libro se lee con openpyxl en modo de solo lectura y solo valores
+(``iter_rows(values_only=True)``): las filas llegan como tuplas sin crear
+objetos de celda ni cargar la hoja completa. Los encabezados se reconocen
+por sinónimos (español, inglés y los de las proformas habituales), y cada
+lote de filas se convierte a los tipos del esquema por columnas.
+
+Ejemplo:
+    productos = leer_xlsx('proforma_proveedor.xlsx', 'productos')
+    for lote in lotes_xlsx('arancel_dian.xlsx', 'aranceles', tamano_lote=20000):
+        ...
+"""
+import itertools
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from historial_tasas import _fechas, _numeros
+from motor_calculo import PARAMETROS_POR_DEFECTO
+
+TAMANO_LOTE = 10000
+
+# Filas iniciales donde se busca el encabezado (las proformas traen membrete arriba)
+FILAS_ENCABEZADO = 30
+
+# Sinónimos de encabezado por columna del esquema, ya normalizados (sin tildes ni signos)
+ESQUEMAS = {
+    'productos': {
+        'sku': ['sku', 'codigo', 'item', 'item no', 'ref', 'referencia', 'model', 'modelo', 'part no', 'art no'],
+        'descripcion': ['descripcion', 'description', 'producto', 'product', 'nombre', 'name', 'goods',
+                        'commodity', 'product name', 'descripcion del producto'],
+        'cantidad': ['cantidad', 'qty', 'quantity', 'cant', 'pcs', 'units', 'unidades', 'qty pcs'],
+        'precio_unitario_usd': ['precio unitario usd', 'precio unitario', 'precio', 'unit price', 'price',
+                                'unit price usd', 'fob unit price', 'precio fob', 'usd'],
+        'hs_code': ['hs code', 'hs', 'hs codigo', 'partida', 'partida arancelaria', 'subpartida', 'hts', 'hts code'],
+        'peso_unitario_kg': ['peso unitario kg', 'peso', 'peso kg', 'unit weight', 'weight', 'n w', 'nw', 'kg'],
+        'volumen_unitario_m3': ['volumen unitario m3', 'volumen', 'volumen m3', 'cbm', 'm3', 'volume'],
+        'incoterm': ['incoterm', 'incoterms', 'terminos'],
+        'categoria': ['categoria', 'category', 'linea', 'familia']
+    },
+    'aranceles': {
+        'hs_code': ['hs code', 'hs', 'codigo', 'partida', 'partida arancelaria', 'subpartida', 'nandina', 'hts'],
+        'descripcion': ['descripcion', 'description', 'descripcion de la mercancia', 'texto', 'mercancia'],
+        'arancel_porcentaje': ['arancel porcentaje', 'arancel', 'gravamen', 'gravamen arancelario', 'tariff', 'duty',
+                               'ga', 'arancel %'],
+        'iva_porcentaje': ['iva porcentaje', 'iva', 'vat', 'iva %'],
+        'otros_impuestos': ['otros impuestos', 'otros', 'other taxes'],
+        'fuente': ['fuente', 'source', 'decreto'],
+        'fecha_actualizacion': ['fecha actualizacion', 'vigente desde', 'vigencia', 'fecha', 'desde', 'effective date']
+    }
+}
+
+# Columnas sin las cuales una fila no se importa (filas de totales, notas y separadores)
+CLAVES = {'productos': ['descripcion'], 'aranceles': ['hs_code']}
+
+# Filas de totales al pie de las proformas
+PATRON_TOTALES = r'^\s*(?:sub\s*)?total(?:es)?\b'
+
+OBLIGATORIAS = {
+    'productos': ['descripcion', 'cantidad', 'precio_unitario_usd'],
+    'aranceles': ['hs_code', 'arancel_porcentaje']
+}
+
+NUMERICAS = {'cantidad', 'precio_unitario_usd', 'peso_unitario_kg', 'volumen_unitario_m3',
+             'arancel_porcentaje', 'iva_porcentaje', 'otros_impuestos'}
+
+# Tasas escritas como "5%" o como 5 en lugar de 0.05
+PORCENTAJES = {'arancel_porcentaje', 'iva_porcentaje', 'otros_impuestos'}
+
+VALORES_POR_DEFECTO = {
+    'productos': {'hs_code': '', 'peso_unitario_kg': 0.0, 'volumen_unitario_m3': 0.0,
+                  'incoterm': 'FOB', 'categoria': 'Otros'},
+    'aranceles': {'descripcion': '', 'iva_porcentaje': PARAMETROS_POR_DEFECTO['iva_importacion'],
+                  'otros_impuestos': 0.0, 'fuente': 'Importado', 'fecha_actualizacion': None}
+}
+
+
+def normalizar_encabezado(texto):
+    """Minúsculas, sin tildes y solo letras y números separados por un espacio"""
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode().lower()
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in texto).split())
+
+
+def mapear_columnas(encabezado, esquema):
+    """Posición de cada columna del esquema en la fila de encabezado
+
+    Primero coincidencias exactas con los sinónimos; luego encabezados que
+    contienen un sinónimo (``Unit Price (USD)``). Cada posición se usa una vez.
+    """
+    sinonimos = ESQUEMAS[esquema]
+    nombres = [normalizar_encabezado(c) if c is not None else '' for c in encabezado]
+    mapeo = {}
+    for exacta in (True, False):
+        for columna, opciones in sinonimos.items():
+            if columna in mapeo:
+                continue
+            for opcion in [columna.replace('_', ' ')] + opciones:
+                posicion = next((
+                    i for i, nombre in enumerate(nombres)
+                    if nombre and i not in mapeo.values() and
+                    (nombre == opcion if exacta else len(opcion) > 2 and f" {opcion} " in f" {nombre} ")
+                ), None)
+                if posicion is not None:
+                    mapeo[columna] = posicion
+                    break
+    return mapeo
+
+
+def _texto(valores, codigo=False):
+    """Columna de texto; los números enteros de Excel (8518300000.0) quedan sin decimales"""
+    serie = pd.Series(valores)
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        numeros = serie.to_numpy(dtype=float)
+        enteros = np.isfinite(numeros) & (numeros == np.round(numeros))
+        serie = pd.Series(np.where(enteros, np.where(enteros, numeros, 0).astype(np.int64).astype(str),
+                                   numeros.astype(str)), dtype='string').mask(np.isnan(numeros))
+    elif serie.dtype == object:
+        # Columna mixta: solo los números pasan uno a uno a texto
+        numeros = serie.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)).to_numpy(dtype=bool)
+        if numeros.any():
+            serie[numeros] = _texto(serie[numeros].to_numpy(dtype=float)).to_numpy()
+    serie = serie.astype('string').str.strip()
+    return serie.fillna('') if codigo else serie
+
+
+def _fracciones(valores, numeros, en_porcentaje=False):
+    """Tasas como fracción y si la columna está escrita en porcentaje
+
+    Las celdas con '%' siempre se dividen por 100; las demás, todas o
+    ninguna: en porcentaje si alguna pasa de 1 (en este lote o en uno anterior).
+    """
+    con_signo = pd.Series(valores, dtype=object).map(lambda v: isinstance(v, str) and '%' in v).to_numpy(dtype=bool)
+    en_porcentaje = en_porcentaje or bool((numeros[~con_signo] > 1).any())
+    return np.where(con_signo | en_porcentaje, numeros / 100, numeros), en_porcentaje
+
+
+def _convertir(lote, mapeo, esquema, en_porcentaje=None):
+    """DataFrame tipado a partir de un lote de filas (tuplas de valores)
+
+    ``en_porcentaje`` guarda entre lotes las columnas de tasas escritas en porcentaje.
+    """
+    en_porcentaje = set() if en_porcentaje is None else en_porcentaje
+    # Filas cortas (celdas vacías al final) se completan para transponer el lote
+    ancho = max(mapeo.values()) + 1
+    columnas = list(zip(*(fila if len(fila) >= ancho else fila + (None,) * (ancho - len(fila)) for fila in lote)))
+    datos = {}
+    for columna, posicion in mapeo.items():
+        valores = columnas[posicion]
+        if columna in NUMERICAS:
+            # Texto con separadores locales o símbolos ('5%', '$1.234,50') se limpia por columna
+            numeros = _numeros(pd.Series(valores))
+            if columna in PORCENTAJES:
+                numeros, porcentaje = _fracciones(valores, numeros, columna in en_porcentaje)
+                if porcentaje:
+                    en_porcentaje.add(columna)
+            datos[columna] = numeros
+        elif columna == 'fecha_actualizacion':
+            try:
+                fechas = pd.Series(_fechas(pd.Series(valores, dtype=object)))
+            except (ValueError, TypeError):
+                fechas = pd.to_datetime(pd.Series(valores, dtype=object), errors='coerce', format='mixed', dayfirst=True)
+            datos[columna] = fechas.dt.date
+        else:
+            datos[columna] = _texto(valores, codigo=columna == 'hs_code')
+    tabla = pd.DataFrame(datos)
+
+    # Fuera filas sin clave: totales, notas y separadores de la proforma
+    for clave in CLAVES[esquema]:
+        if clave in tabla.columns:
+            tabla = tabla[tabla[clave].fillna('').str.len() > 0]
+    for columna in ('sku', 'descripcion'):
+        if columna in tabla.columns:
+            tabla = tabla[~tabla[columna].fillna('').str.contains(PATRON_TOTALES, case=False, regex=True)]
+    for columna, valor in VALORES_POR_DEFECTO[esquema].items():
+        if columna not in tabla.columns:
+            tabla[columna] = valor
+        elif columna in NUMERICAS:
+            tabla[columna] = tabla[columna].fillna(valor)
+    return tabla
+
+
+def _completar_productos(tabla, inicio):
+    """Cantidades enteras como int64 y SKU generado (IMP-00001...) para las líneas sin SKU
+
+    ``inicio`` es el número de filas de productos de los lotes anteriores,
+    para que los SKUs generados no se repitan entre lotes.
+    """
+    cantidad = tabla['cantidad'].to_numpy(dtype=float)
+    if len(cantidad) and np.isfinite(cantidad).all() and (cantidad == np.round(cantidad)).all():
+        tabla['cantidad'] = cantidad.astype(np.int64)
+    faltantes = tabla['sku'].fillna('') == '' if 'sku' in tabla.columns else None
+    if faltantes is None:
+        tabla.insert(0, 'sku', [f"IMP-{inicio + i + 1:05d}" for i in range(len(tabla))])
+    elif faltantes.any():
+        tabla.loc[faltantes, 'sku'] = [f"IMP-{inicio + i + 1:05d}" for i in np.flatnonzero(faltantes)]
+    return tabla[[c for c in ESQUEMAS['productos'] if c in tabla.columns]]
+
+
+def lotes_xlsx(fuente, esquema, hoja=None, tamano_lote=TAMANO_LOTE, progreso=None):
+    """Leer un libro de Excel en lotes de DataFrames con las columnas del esquema
+
+    ``esquema`` es 'productos' o 'aranceles'. ``progreso(filas, total)``
+    se llama tras cada lote; ``total`` es la dimensión declarada de la hoja
+    (o None si el archivo no la trae). Los lotes de productos ya traen SKU
+    (generado si falta) y cantidades enteras.
+    """
+    from openpyxl import load_workbook
+
+    if esquema not in ESQUEMAS:
+        raise ValueError(f"Esquema desconocido: {esquema}")
+    libro = load_workbook(fuente, read_only=True, data_only=True)
+    try:
+        hoja = libro[hoja] if hoja is not None else libro.active
+        total = hoja.max_row
+        filas = hoja.iter_rows(values_only=True)
+
+        # Encabezado: la fila inicial que reconoce más columnas del esquema
+        iniciales = list(itertools.islice(filas, FILAS_ENCABEZADO))
+        mapeos = [mapear_columnas(fila, esquema) for fila in iniciales]
+        fila_encabezado = max(range(len(mapeos)), key=lambda i: len(mapeos[i]), default=None)
+        mapeo = mapeos[fila_encabezado] if fila_encabezado is not None else {}
+        faltantes = [c for c in OBLIGATORIAS[esquema] if c not in mapeo]
+        if faltantes:
+            encontrados = [str(c) for c in (iniciales[fila_encabezado] if iniciales else ()) if c is not None]
+            raise ValueError(
+                f"No se reconocieron las columnas {', '.join(faltantes)} en el encabezado: {', '.join(encontrados)}"
+            )
+
+        filas = itertools.chain(iniciales[fila_encabezado + 1:], filas)
+        leidas = fila_encabezado + 1
+        en_porcentaje = set()
+        convertidas = 0
+        while True:
+            lote = list(itertools.islice(filas, tamano_lote))
+            if not lote:
+                break
+            leidas += len(lote)
+            tabla = _convertir(lote, mapeo, esquema, en_porcentaje)
+            # Un lote solo con totales o notas no se entrega: sus columnas vacías serían float
+            if not tabla.empty:
+                if esquema == 'productos':
+                    tabla = _completar_productos(tabla, convertidas)
+                convertidas += len(tabla)
+                yield tabla
+            if progreso is not None:
+                progreso(leidas, total)
+    finally:
+        libro.close()
+
+
+def leer_xlsx(fuente, esquema, hoja=None, tamano_lote=TAMANO_LOTE, progreso=None):
+    """Leer un libro de Excel completo con las columnas del esquema (ver ``lotes_xlsx``)"""
+    lotes = list(lotes_xlsx(fuente, esquema, hoja, tamano_lote, progreso))
+    tabla = pd.concat(lotes, ignore_index=True) if lotes else pd.DataFrame(columns=list(ESQUEMAS[esquema]))
+    return tabla[[c for c in ESQUEMAS[esquema] if c in tabla.columns]]
+
+
+def hojas_xlsx(fuente):
+    """Nombres de las hojas de un libro, sin leer su contenido"""
+    from openpyxl import load_workbook
+
+    libro = load_workbook(fuente, read_only=True)
+    try:
+        return libro.sheetnames
+    finally:
+        libro.close()
@@ -0,0 +1,227 @@
+"""Índice de aranceles por HS Code con búsqueda jerárquica por prefijo
+
+Un HS Code puede tener varias versiones de tasas, cada una vigente desde su
+``fecha_actualizacion``. Para una fecha de nacionalización se toma la última
+versión vigente en esa fecha con una búsqueda binaria sobre las versiones
+ordenadas por código y fecha, para todo el catálogo a la vez.
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Tasa usada cuando el HS Code no aparece en ningún nivel de la tabla
+ARANCEL_POR_DEFECTO = 0.10
+
+# Niveles de respaldo: subpartida NANDINA, subpartida SA, partida y capítulo
+NIVELES_PREFIJO = (8, 6, 4, 2)
+
+NOMBRES_NIVEL = {
+    10: 'Código exacto',
+    8: 'Subpartida NANDINA',
+    6: 'Subpartida',
+    4: 'Partida',
+    2: 'Capítulo',
+    0: 'Por defecto'
+}
+
+COLUMNAS_TASAS = ['arancel_porcentaje', 'iva_porcentaje', 'otros_impuestos']
+
+# Fecha desde la que rige cada versión de las tasas (vacía: desde siempre)
+COLUMNA_VIGENCIA = 'fecha_actualizacion'
+
+# Índices construidos recientemente, por huella de la tabla de aranceles
+_CACHE_INDICES = OrderedDict()
+_MAX_INDICES = 8
+
+
+def normalizar_hs_code(hs_codes):
+    """Dejar solo los dígitos de una columna de HS Codes ('8518.30.00' -> '85183000')"""
+    serie = pd.Series(hs_codes, copy=False)
+    return serie.astype('string').str.replace(r'\D', '', regex=True).fillna('')
+
+
+def dias_vigencia(fechas, vacias=None):
+    """Fechas (texto, date, datetime64) como días desde 1970, con la forma de ``fechas``
+
+    Las fechas vacías o inválidas toman ``vacias`` (por defecto, hoy).
+    """
+    vacias = np.datetime64('today', 'D').astype(np.int64) if vacias is None else vacias
+    forma = np.shape(fechas)
+    if np.asarray(fechas).dtype.kind == 'M':
+        dias = np.asarray(fechas).astype('datetime64[D]')
+        return np.where(np.isnat(dias), vacias, dias.astype(np.int64))
+    fechas = pd.to_datetime(pd.Series(np.ravel(np.asarray(fechas, dtype=object))), errors='coerce', format='mixed')
+    dias = fechas.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    return np.where(fechas.isna().to_numpy(), vacias, dias).reshape(forma)
+
+
+class IndiceAranceles:
+    """Tabla hash de tasas por HS Code, construida una vez por versión de aranceles"""
+
+    def __init__(self, aranceles):
+        claves = normalizar_hs_code(aranceles['hs_code']).to_numpy(dtype=object)
+        self.tasas = np.column_stack([
+            aranceles[columna].to_numpy(dtype=float) for columna in COLUMNAS_TASAS
+        ]) if len(aranceles) else np.empty((0, len(COLUMNAS_TASAS)))
+
+        orden = np.arange(len(claves))
+        validos = claves != ''
+        self._versiones(claves, aranceles[COLUMNA_VIGENCIA] if COLUMNA_VIGENCIA in aranceles.columns else None)
+        longitudes = np.fromiter((len(c) for c in claves), dtype=np.int64, count=len(claves))
+
+        # Código exacto: primera fila por clave, como el filtro original con .iloc[0]
+        exactos = pd.DataFrame({'clave': claves[validos], 'fila': orden[validos]})
+        exactos = exactos.drop_duplicates('clave', keep='first')
+        self._exacto = pd.Index(exactos['clave'])
+        self._exacto_filas = exactos['fila'].to_numpy()
+
+        # Prefijos: se prefiere la fila definida exactamente en ese nivel,
+        # si no existe se toma la primera fila que comparte el prefijo
+        self._prefijos = {}
+        for nivel in NIVELES_PREFIJO:
+            mascara = longitudes >= nivel
+            if not mascara.any():
+                self._prefijos[nivel] = (pd.Index([], dtype=object), np.empty(0, dtype=np.int64))
+                continue
+            tabla = pd.DataFrame({
+                'clave': [c[:nivel] for c in claves[mascara]],
+                'propio': longitudes[mascara] != nivel,
+                'fila': orden[mascara]
+            })
+            tabla = tabla.sort_values(['clave', 'propio', 'fila'], kind='stable')
+            tabla = tabla.drop_duplicates('clave', keep='first')
+            self._prefijos[nivel] = (pd.Index(tabla['clave']), tabla['fila'].to_numpy())
+
+    def _versiones(self, claves, vigencias):
+        """Versiones de cada código ordenadas por (código, vigencia) para las búsquedas por fecha"""
+        grupos, unicas = pd.factorize(pd.Series(claves, dtype=object))
+        self.con_versiones = len(unicas) < len(claves) and vigencias is not None
+        if not self.con_versiones:
+            return
+        dias = dias_vigencia(vigencias, vacias=np.iinfo(np.int64).min)
+        validos = dias != np.iinfo(np.int64).min
+        self._dia_minimo = int(dias[validos].min()) if validos.any() else 0
+        self._dias = int(dias[validos].max()) - self._dia_minimo + 2 if validos.any() else 2
+        # Día relativo: 0 para las versiones sin fecha, que rigen desde siempre
+        relativos = np.where(validos, dias - self._dia_minimo + 1, 0)
+        # Entre versiones del mismo día prevalece la primera fila, como antes con .iloc[0]
+        filas = np.arange(len(claves))
+        orden = np.lexsort((-filas, relativos, grupos))
+        self._grupo_fila = grupos
+        self._version_filas = orden
+        self._version_claves = grupos[orden] * self._dias + relativos[orden]
+        # Primera versión de cada código, la que rige antes de todas las fechas
+        inicio = np.searchsorted(grupos[orden], np.arange(len(unicas)), side='left')
+        self._version_primera = np.searchsorted(self._version_claves, self._version_claves[inicio], side='right') - 1
+
+    def vigentes(self, filas, fechas):
+        """Cambiar cada fila resuelta por la versión de su código vigente en la fecha
+
+        ``fechas`` es una fecha o una por fila (se admiten formas que hagan
+        broadcasting con ``filas``). Antes de la primera versión de un código
+        rige esa primera versión. Las filas -1 (sin coincidencia) se conservan.
+        """
+        if not self.con_versiones:
+            return np.broadcast_to(filas, np.broadcast_shapes(np.shape(filas), np.shape(fechas))).copy()
+        relativos = np.clip(dias_vigencia(fechas) - self._dia_minimo + 1, 0, self._dias - 1)
+        filas, relativos = np.broadcast_arrays(filas, relativos)
+        encontrado = filas >= 0
+        grupos = self._grupo_fila[np.where(encontrado, filas, 0)]
+        posiciones = np.searchsorted(self._version_claves, grupos * self._dias + relativos, side='right') - 1
+        posiciones = np.maximum(posiciones, self._version_primera[grupos])
+        return np.where(encontrado, self._version_filas[posiciones], -1)
+
+    def _resolver_unicos(self, claves):
+        """Resolver fila y nivel de coincidencia para un arreglo de claves únicas"""
+        filas = np.full(len(claves), -1, dtype=np.int64)
+        niveles = np.zeros(len(claves), dtype=np.int8)
+
+        posiciones = self._exacto.get_indexer(claves)
+        encontrado = (posiciones >= 0) & (claves != '')
+        filas[encontrado] = self._exacto_filas[posiciones[encontrado]]
+        niveles[encontrado] = 10
+
+        for nivel in NIVELES_PREFIJO:
+            pendientes = np.flatnonzero(filas < 0)
+            if len(pendientes) == 0:
+                break
+            indice, filas_nivel = self._prefijos[nivel]
+            candidatas = claves[pendientes]
+            largos = np.fromiter((len(c) for c in candidatas), dtype=np.int64, count=len(candidatas))
+            posiciones = indice.get_indexer([c[:nivel] for c in candidatas])
+            encontrado = (posiciones >= 0) & (largos >= nivel)
+            filas[pendientes[encontrado]] = filas_nivel[posiciones[encontrado]]
+            niveles[pendientes[encontrado]] = nivel
+
+        return filas, niveles
+
+    def resolver(self, hs_codes, iva_defecto, fecha=None):
+        """Resolver arancel, IVA, otros impuestos y nivel de coincidencia por SKU
+
+        ``fecha`` es la de nacionalización (una sola o una por SKU); por
+        defecto, y en las fechas vacías, hoy. Solo importa si la tabla tiene varias versiones de un código.
+        """
+        # Se resuelven solo los códigos distintos y se expanden al catálogo;
+        # los nulos quedan con código -1 y toman la última posición (vacía)
+        codigos, unicos = pd.factorize(pd.Series(hs_codes, copy=False), sort=False)
+        claves = np.append(normalizar_hs_code(unicos).to_numpy(dtype=object), '')
+        filas_unicos, niveles_unicos = self._resolver_unicos(claves)
+        if np.ndim(fecha) == 0:
+            filas = self.vigentes(filas_unicos, fecha)[codigos]
+        else:
+            filas = self.vigentes(filas_unicos[codigos], np.asarray(fecha))
+        niveles = niveles_unicos[codigos]
+        return self._tasas(filas, iva_defecto) + (niveles,)
+
+    def resolver_fechas(self, hs_codes, iva_defecto, fechas):
+        """Arancel, IVA y otros impuestos vigentes como matrices fechas × SKUs"""
+        codigos, unicos = pd.factorize(pd.Series(hs_codes, copy=False), sort=False)
+        claves = np.append(normalizar_hs_code(unicos).to_numpy(dtype=object), '')
+        filas_unicos, _ = self._resolver_unicos(claves)
+        filas = self.vigentes(filas_unicos[codigos][None, :], np.asarray(fechas)[:, None])
+        return self._tasas(filas, iva_defecto)
+
+    def _tasas(self, filas, iva_defecto):
+        """Tasas de las filas resueltas; las no encontradas toman los valores por defecto"""
+        encontrado = filas >= 0
+        tomar = np.where(encontrado, filas, 0)
+        defectos = (ARANCEL_POR_DEFECTO, iva_defecto, 0.0)
+        tasas = []
+        for i, defecto in enumerate(defectos):
+            if len(self.tasas) == 0:
+                tasas.append(np.full(np.shape(filas), defecto, dtype=float))
+            else:
+                tasas.append(np.where(encontrado, self.tasas[tomar, i], defecto))
+
+        return tasas[0], tasas[1], tasas[2]
+
+
+def huella_filas(tabla):
+    """Huella del contenido de una tabla que depende del orden de las filas
+
+    El orden importa: entre filas repetidas de un código gana la primera.
+    """
+    return hashlib.blake2b(pd.util.hash_pandas_object(tabla, index=False).to_numpy().tobytes(),
+                           digest_size=16).hexdigest()
+
+
+def huella_aranceles(aranceles):
+    """Huella de contenido de las columnas que usa el índice"""
+    columnas = ['hs_code'] + COLUMNAS_TASAS + ([COLUMNA_VIGENCIA] if COLUMNA_VIGENCIA in aranceles.columns else [])
+    return huella_filas(aranceles[columnas])
+
+
+def obtener_indice(aranceles):
+    """Devolver el índice de la tabla de aranceles, construyéndolo solo si cambió"""
+    huella = (len(aranceles), huella_aranceles(aranceles))
+    indice = _CACHE_INDICES.get(huella)
+    if indice is None:
+        indice = IndiceAranceles(aranceles)
+        _CACHE_INDICES[huella] = indice
+        if len(_CACHE_INDICES) > _MAX_INDICES:
+            _CACHE_INDICES.popitem(last=False)
+    else:
+        _CACHE_INDICES.move_to_end(huella)
+    return indice
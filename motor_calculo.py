@@ -0,0 +1,867 @@
+"""Motor de cálculo vectorizado para la calculadora de importaciones
+
+Módulo sin dependencias de Streamlit ni Plotly: recibe DataFrames y
+diccionarios de parámetros y devuelve DataFrames de resultados, para
+poder usarlo desde las apps, procesos por lotes y workers.
+"""
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from indice_aranceles import obtener_indice
+
+PARAMETROS_POR_DEFECTO = {
+    'USD_COP': 3800.0,
+    'CNY_USD': 0.14,
+    'flete_internacional': 2500.0,
+    'seguro_porcentaje': 0.02,
+    'iva_importacion': 0.19,
+    'despacho_aduana': 850000.0,
+    'transporte_interno': 1200000.0,
+    'almacenaje': 500000.0,
+    'margen_objetivo': 0.35,
+    'costo_packaging': 2500.0,
+    'costo_envio_local': 12000.0,
+    'comision_ml_electronicos': 0.12,
+    'comision_ml_hogar': 0.14,
+    'comision_ml_moda': 0.16,
+    'porcentaje_perdidas': 0.02,
+    'base_flete': 'valor',
+    'divisor_volumetrico': 1000.0
+}
+
+PARAMETROS_LANDED_COST = [
+    'USD_COP', 'flete_internacional', 'seguro_porcentaje', 'iva_importacion',
+    'despacho_aduana', 'transporte_interno', 'almacenaje', 'porcentaje_perdidas'
+]
+
+PARAMETROS_VENTAS = [
+    'margen_objetivo', 'costo_packaging', 'costo_envio_local',
+    'comision_ml_electronicos', 'comision_ml_hogar', 'comision_ml_moda'
+]
+
+COLUMNAS_PRODUCTOS = ['sku', 'descripcion', 'cantidad', 'precio_unitario_usd', 'hs_code']
+
+COLUMNAS_ARANCELES = ['hs_code', 'arancel_porcentaje', 'iva_porcentaje', 'otros_impuestos']
+
+# Base para prorratear el flete internacional: valor FOB o peso cobrable
+BASES_FLETE = ('valor', 'peso_cobrable')
+BASE_FLETE_POR_DEFECTO = PARAMETROS_POR_DEFECTO['base_flete']
+
+# Divisor volumétrico (cm³ por kg cobrable) según el modo de transporte
+DIVISORES_VOLUMETRICOS = {
+    'maritimo_lcl': 1000.0,
+    'aereo': 6000.0
+}
+DIVISOR_VOLUMETRICO_POR_DEFECTO = PARAMETROS_POR_DEFECTO['divisor_volumetrico']
+
+COLUMNAS_PESO = ['peso_unitario_kg', 'volumen_unitario_m3']
+
+# Fecha de nacionalización por línea; si falta, la del parámetro 'fecha_aduana' (o hoy)
+COLUMNA_FECHA_ADUANA = 'fecha_aduana'
+
+# Comisión de Mercado Libre por categoría (parámetro) y para el resto de categorías
+COMISIONES_POR_CATEGORIA = {
+    'Electrónicos': 'comision_ml_electronicos',
+    'Hogar': 'comision_ml_hogar',
+    'Moda': 'comision_ml_moda'
+}
+COMISION_POR_DEFECTO = 0.15
+
+COLUMNAS_LANDED_COST = [
+    'sku', 'descripcion', 'cantidad', 'cif_usd', 'cif_cop', 'arancel_cop',
+    'iva_cop', 'otros_impuestos_cop', 'costos_nacionales', 'costo_total',
+    'costo_unitario', 'factor_perdidas'
+]
+
+# Tolerancia al comparar la rentabilidad con el margen objetivo (redondeo de punto flotante)
+TOLERANCIA_MARGEN = 1e-9
+
+COLUMNAS_VENTAS = [
+    'sku', 'descripcion', 'categoria', 'costo_landed', 'precio_venta', 'comision_ml',
+    'comision_porcentaje', 'envio', 'packaging', 'precio_neto', 'rentabilidad', 'markup',
+    'precio_equilibrio'
+]
+
+# Definición de un escenario: tipo de cambio, flete y factor sobre el arancel de cada SKU
+COLUMNAS_DEFINICION_ESCENARIOS = ['escenario', 'tipo_cambio', 'flete_usd', 'factor_arancel']
+
+# Celdas escenarios × SKUs por bloque (unos 32 MB por matriz de float64)
+MAX_CELDAS_ESCENARIOS = 2**22
+
+COLUMNAS_ESCENARIOS = [
+    'escenario', 'tipo_cambio', 'arancel_porcentaje', 'factor_arancel', 'flete_usd',
+    'costo_promedio', 'costo_total', 'rentabilidad_promedio', 'impacto_rentabilidad'
+]
+
+COLUMNAS_EVOLUCION = [
+    'fecha', 'tipo_cambio', 'costo_promedio', 'costo_total', 'rentabilidad_promedio', 'skus_bajo_margen'
+]
+
+# Puntos por serie que se envían a los gráficos
+MAX_PUNTOS_GRAFICO = 500
+
+
+class ErrorCalculo(ValueError):
+    """Datos de entrada incompletos para el cálculo"""
+
+
+def parametros_por_defecto():
+    """Copia de los parámetros globales por defecto"""
+    return dict(PARAMETROS_POR_DEFECTO)
+
+
+def _verificar_entradas(tablas, parametros, claves):
+    """Verificar columnas y parámetros requeridos antes de calcular"""
+    for nombre, (df, columnas) in tablas.items():
+        faltantes = [c for c in columnas if c not in df.columns]
+        if faltantes:
+            raise ErrorCalculo(f"Faltan columnas en {nombre}: {', '.join(faltantes)}")
+    faltantes = [p for p in claves if p not in parametros]
+    if faltantes:
+        raise ErrorCalculo(f"Faltan parámetros: {', '.join(faltantes)}")
+
+
+def coeficientes_landed(cantidad, valor_fob_usd, participacion_flete, total_cantidad, arancel_porcentaje,
+                        iva_porcentaje, otros_impuestos):
+    """Coeficientes por SKU del costo total, lineal en tipo de cambio, flete, seguro y factor de arancel
+
+    Con K = (1 + IVA + otros) + factor · arancel · (1 + IVA):
+    costo_total = (1 + pérdidas) · (TC · ((1 + seguro) · FOB + flete · participación) · K + nacionales · cantidad / total).
+    Los coeficientes se pueden sumar: la suma sobre un grupo de SKUs da los del
+    grupo, y ``costo_total_landed`` los evalúa igual para un SKU que para un portafolio.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        impuestos = 1 + iva_porcentaje + otros_impuestos
+        arancel = arancel_porcentaje * (1 + iva_porcentaje)
+        return {
+            'fob': valor_fob_usd * impuestos,
+            'fob_arancel': valor_fob_usd * arancel,
+            'flete': participacion_flete * impuestos,
+            'flete_arancel': participacion_flete * arancel,
+            'nacional': cantidad / total_cantidad
+        }
+
+
+def costo_total_landed(coeficientes, parametros, factor_arancel=1.0):
+    """Costo total en COP a partir de ``coeficientes_landed`` (de SKUs o sumados por grupo)
+
+    Los parámetros del costo (tipo de cambio, flete, seguro, pérdidas y costos
+    nacionales) y ``factor_arancel`` pueden ser arreglos que se combinan por broadcasting.
+    """
+    costos_nacionales = parametros['despacho_aduana'] + parametros['transporte_interno'] + parametros['almacenaje']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cif_impuestos = (1 + parametros['seguro_porcentaje']) * (
+            coeficientes['fob'] + factor_arancel * coeficientes['fob_arancel']
+        ) + parametros['flete_internacional'] * (coeficientes['flete'] + factor_arancel * coeficientes['flete_arancel'])
+        return (1 + parametros['porcentaje_perdidas']) * (
+            parametros['USD_COP'] * cif_impuestos + costos_nacionales * coeficientes['nacional']
+        )
+
+
+def costos_landed(cantidad, valor_fob_usd, participacion_flete, total_cantidad, arancel_porcentaje,
+                  iva_porcentaje, otros_impuestos, usd_cop, flete, parametros, perdidas=None):
+    """Componentes del Landed Cost por SKU
+
+    ``participacion_flete`` es la fracción del flete que absorbe cada SKU (ver
+    ``participacion_flete``). ``usd_cop``, ``flete``, ``perdidas`` y ``arancel_porcentaje`` pueden traer un
+    eje de escenarios (columnas de forma (S, 1) o matrices (S, N)); las
+    operaciones se extienden por broadcasting y devuelven matrices de
+    escenarios × SKUs.
+    """
+    seguro = parametros['seguro_porcentaje']
+    coeficientes = coeficientes_landed(
+        cantidad, valor_fob_usd, participacion_flete, total_cantidad, arancel_porcentaje, iva_porcentaje,
+        otros_impuestos
+    )
+    perdidas = parametros['porcentaje_perdidas'] if perdidas is None else perdidas
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Cálculos básicos
+        flete_proporcional = participacion_flete * flete
+        seguro_proporcional = valor_fob_usd * seguro
+
+        valor_cif_usd = valor_fob_usd + flete_proporcional + seguro_proporcional
+        valor_cif_cop = valor_cif_usd * usd_cop
+
+        arancel_cop = valor_cif_cop * arancel_porcentaje
+        iva_cop = (valor_cif_cop + arancel_cop) * iva_porcentaje
+        otros_impuestos_cop = valor_cif_cop * otros_impuestos
+
+        # Costos nacionales proporcionales por cantidad
+        costos_nacionales_prop = coeficientes['nacional'] * (
+            parametros['despacho_aduana'] + parametros['transporte_interno'] + parametros['almacenaje']
+        )
+
+        # Costo total con pérdidas, del mismo modelo lineal que usan simulaciones y consolidación
+        factor_perdidas = 1 + perdidas
+        costo_total = costo_total_landed(coeficientes, {
+            **parametros, 'USD_COP': usd_cop, 'flete_internacional': flete, 'porcentaje_perdidas': perdidas
+        })
+        costo_unitario = np.where(cantidad > 0, costo_total / np.where(cantidad > 0, cantidad, 1), 0)
+
+    return {
+        'cif_usd': valor_cif_usd,
+        'cif_cop': valor_cif_cop,
+        'arancel_cop': arancel_cop,
+        'iva_cop': iva_cop,
+        'otros_impuestos_cop': otros_impuestos_cop,
+        'costos_nacionales': costos_nacionales_prop,
+        'costo_total': costo_total,
+        'costo_unitario': costo_unitario,
+        'factor_perdidas': factor_perdidas
+    }
+
+
+def _componer_landed_cost(sku, descripcion, cantidad, valor_fob_usd, participacion, total_cantidad,
+                          arancel_porcentaje, iva_porcentaje, otros_impuestos, parametros):
+    """Armar la tabla de Landed Cost a partir de las columnas base y los totales globales"""
+    costos = costos_landed(
+        cantidad, valor_fob_usd, participacion, total_cantidad, arancel_porcentaje, iva_porcentaje,
+        otros_impuestos, parametros['USD_COP'], parametros['flete_internacional'], parametros
+    )
+    return pd.DataFrame({'sku': sku, 'descripcion': descripcion, 'cantidad': cantidad, **costos},
+                        columns=COLUMNAS_LANDED_COST)
+
+
+def prorratea_por_peso(parametros):
+    """Indicar si el flete se reparte por peso cobrable en lugar de valor FOB"""
+    base = parametros.get('base_flete', BASE_FLETE_POR_DEFECTO)
+    if base not in BASES_FLETE:
+        raise ErrorCalculo(f"Base de flete desconocida: {base}")
+    return base == 'peso_cobrable'
+
+
+def peso_cobrable_kg(productos, divisor=DIVISOR_VOLUMETRICO_POR_DEFECTO):
+    """Peso cobrable por SKU: el mayor entre el peso real y el volumétrico
+
+    El peso volumétrico es el volumen en cm³ sobre el divisor del modo de
+    transporte (1.000 marítimo LCL, 6.000 aéreo). Pesos o volúmenes vacíos
+    cuentan como cero.
+    """
+    faltantes = [c for c in COLUMNAS_PESO if c not in productos.columns]
+    if faltantes:
+        raise ErrorCalculo(f"Faltan columnas en productos: {', '.join(faltantes)}")
+    if not divisor > 0:
+        raise ErrorCalculo("El divisor volumétrico debe ser mayor que cero")
+    cantidad = productos['cantidad'].to_numpy(dtype=float)
+    peso_real = cantidad * productos['peso_unitario_kg'].to_numpy(dtype=float, na_value=np.nan)
+    peso_volumetrico = cantidad * productos['volumen_unitario_m3'].to_numpy(dtype=float, na_value=np.nan) * (1e6 / divisor)
+    return np.nan_to_num(np.fmax(peso_real, peso_volumetrico), nan=0.0)
+
+
+def _peso_cobrable(productos, parametros):
+    return peso_cobrable_kg(productos, parametros.get('divisor_volumetrico', DIVISOR_VOLUMETRICO_POR_DEFECTO))
+
+
+def _cantidades(productos):
+    """Cantidades como int64 (o float64 si traen decimales), aunque la tabla las guarde en 32 bits"""
+    cantidad = productos['cantidad'].to_numpy()
+    return cantidad.astype(np.int64 if cantidad.dtype.kind in 'iu' else float, copy=False)
+
+
+def participacion_flete(productos, valor_fob_usd, parametros, totales=None):
+    """Fracción del flete internacional que corresponde a cada SKU
+
+    Reparte por valor FOB o, con ``base_flete='peso_cobrable'``, por peso
+    cobrable. Si el catálogo no registra peso ni volumen, vuelve al valor FOB.
+    Con ``totales`` (ver ``totales_prorrateo``) usa los del catálogo completo.
+    """
+    total_fob_usd = valor_fob_usd.sum() if totales is None else totales['total_fob_usd']
+    if not prorratea_por_peso(parametros):
+        return _repartir_flete(valor_fob_usd, total_fob_usd)
+    peso = _peso_cobrable(productos, parametros)
+    total_peso = peso.sum() if totales is None else totales['total_peso_cobrable']
+    return _repartir_flete(valor_fob_usd, total_fob_usd, peso, total_peso)
+
+
+def _repartir_flete(valor_fob_usd, total_fob_usd, peso=None, total_peso=0.0):
+    if peso is not None and total_peso > 0:
+        return peso / total_peso
+    if total_fob_usd > 0:
+        return valor_fob_usd / total_fob_usd
+    return np.zeros(len(valor_fob_usd))
+
+
+def totales_prorrateo(productos, parametros=None):
+    """Totales globales que reparten el flete (FOB o peso cobrable) y los costos nacionales (unidades)"""
+    cantidad = _cantidades(productos)
+    valor_fob_usd = cantidad * productos['precio_unitario_usd'].to_numpy(dtype=float)
+    totales = {'total_fob_usd': valor_fob_usd.sum(), 'total_cantidad': cantidad.sum(), 'total_peso_cobrable': 0.0}
+    if parametros is not None and prorratea_por_peso(parametros):
+        totales['total_peso_cobrable'] = _peso_cobrable(productos, parametros).sum()
+    return totales
+
+
+def fecha_aduana(productos, parametros):
+    """Fecha con la que se buscan las tasas vigentes: una por línea o la del embarque
+
+    Con la columna ``fecha_aduana`` cada línea usa la suya (las vacías, la del
+    parámetro); sin ella, la del parámetro. None equivale a hoy.
+    """
+    fecha = parametros.get('fecha_aduana')
+    if COLUMNA_FECHA_ADUANA not in productos.columns:
+        return fecha
+    fechas = pd.to_datetime(productos[COLUMNA_FECHA_ADUANA], errors='coerce', format='mixed')
+    if fecha is not None:
+        fechas = fechas.fillna(pd.Timestamp(fecha))
+    return fechas.to_numpy(dtype='datetime64[ns]')
+
+
+def calcular_landed_cost(productos, aranceles, parametros, totales=None):
+    """Calcular Landed Cost de todo el catálogo con operaciones por columna
+
+    Con ``totales`` (ver ``totales_prorrateo``) la tabla se trata como un bloque
+    de un catálogo mayor y el prorrateo usa los totales del catálogo completo.
+    """
+    _verificar_entradas(
+        {'productos': (productos, COLUMNAS_PRODUCTOS), 'aranceles': (aranceles, COLUMNAS_ARANCELES)},
+        parametros, PARAMETROS_LANDED_COST
+    )
+    cantidad = _cantidades(productos)
+    valor_fob_usd = cantidad * productos['precio_unitario_usd'].to_numpy(dtype=float)
+
+    # Buscar aranceles de todo el catálogo en un solo join sobre el índice, con las tasas vigentes a la fecha
+    arancel_porcentaje, iva_porcentaje, otros_impuestos, _ = obtener_indice(aranceles).resolver(
+        productos['hs_code'], parametros['iva_importacion'], fecha_aduana(productos, parametros)
+    )
+
+    participacion = participacion_flete(productos, valor_fob_usd, parametros, totales)
+    total_cantidad = cantidad.sum() if totales is None else totales['total_cantidad']
+
+    return _componer_landed_cost(
+        productos['sku'].array, productos['descripcion'].array, cantidad,
+        valor_fob_usd, participacion, total_cantidad,
+        arancel_porcentaje, iva_porcentaje, otros_impuestos, parametros
+    )
+
+
+class LandedCostIncremental:
+    """Landed Cost que recalcula solo las filas editadas y ajusta los totales por delta"""
+
+    def __init__(self, productos, aranceles, parametros):
+        _verificar_entradas(
+            {'productos': (productos, COLUMNAS_PRODUCTOS), 'aranceles': (aranceles, COLUMNAS_ARANCELES)},
+            parametros, PARAMETROS_LANDED_COST
+        )
+        self.indice = obtener_indice(aranceles)
+        self.iva_defecto = parametros['iva_importacion']
+        self.fecha = parametros.get('fecha_aduana')
+        self.modo_flete = self._modo_flete(parametros)
+        self.productos = productos
+
+        self.sku = productos['sku'].to_numpy(dtype=object).copy()
+        self.descripcion = productos['descripcion'].to_numpy(dtype=object).copy()
+        self.cantidad = _cantidades(productos).copy()
+        self.valor_fob_usd = self.cantidad * productos['precio_unitario_usd'].to_numpy(dtype=float)
+        self.arancel, self.iva, self.otros, _ = self.indice.resolver(
+            productos['hs_code'], self.iva_defecto, fecha_aduana(productos, parametros)
+        )
+        self.peso_cobrable = _peso_cobrable(productos, parametros) if prorratea_por_peso(parametros) else None
+
+        # Agregados globales que se ajustan por delta en cada edición
+        self.total_fob_usd = self.valor_fob_usd.sum()
+        self.total_cantidad = self.cantidad.sum()
+        self.total_peso_cobrable = 0.0 if self.peso_cobrable is None else self.peso_cobrable.sum()
+
+    @staticmethod
+    def _modo_flete(parametros):
+        return (
+            prorratea_por_peso(parametros),
+            parametros.get('divisor_volumetrico', DIVISOR_VOLUMETRICO_POR_DEFECTO)
+        )
+
+    def vigente(self, productos, aranceles, parametros):
+        """Indicar si el motor sigue sincronizado con la tabla de productos y aranceles"""
+        return (
+            productos is self.productos and
+            obtener_indice(aranceles) is self.indice and
+            parametros['iva_importacion'] == self.iva_defecto and
+            parametros.get('fecha_aduana') == self.fecha and
+            self._modo_flete(parametros) == self.modo_flete
+        )
+
+    def admite_edicion(self, productos, aranceles, parametros):
+        """Indicar si una nueva tabla con las mismas filas se puede aplicar por delta"""
+        return (
+            len(productos) == len(self.cantidad) and
+            _cantidades(productos).dtype == self.cantidad.dtype and
+            obtener_indice(aranceles) is self.indice and
+            parametros['iva_importacion'] == self.iva_defecto and
+            parametros.get('fecha_aduana') == self.fecha and
+            self._modo_flete(parametros) == self.modo_flete
+        )
+
+    def actualizar(self, productos, filas):
+        """Recalcular solo las filas editadas (posiciones) de la nueva tabla de productos"""
+        filas = np.unique(np.asarray(list(filas), dtype=np.int64))
+        self.productos = productos
+        if len(filas) == 0:
+            return
+
+        editadas = productos.iloc[filas]
+        cantidad = _cantidades(editadas)
+        valor_fob_usd = cantidad * editadas['precio_unitario_usd'].to_numpy(dtype=float)
+
+        self.total_fob_usd += (valor_fob_usd - self.valor_fob_usd[filas]).sum()
+        self.total_cantidad += (cantidad - self.cantidad[filas]).sum()
+
+        self.sku[filas] = editadas['sku'].to_numpy(dtype=object)
+        self.descripcion[filas] = editadas['descripcion'].to_numpy(dtype=object)
+        self.cantidad[filas] = cantidad
+        self.valor_fob_usd[filas] = valor_fob_usd
+        arancel, iva, otros, _ = self.indice.resolver(
+            editadas['hs_code'], self.iva_defecto, fecha_aduana(editadas, {'fecha_aduana': self.fecha})
+        )
+        self.arancel[filas] = arancel
+        self.iva[filas] = iva
+        self.otros[filas] = otros
+
+        if self.peso_cobrable is not None:
+            peso = peso_cobrable_kg(editadas, self.modo_flete[1])
+            self.total_peso_cobrable += (peso - self.peso_cobrable[filas]).sum()
+            self.peso_cobrable[filas] = peso
+
+    def resultado(self, parametros):
+        """Reescalar todo el catálogo con los totales vigentes"""
+        participacion = _repartir_flete(
+            self.valor_fob_usd, self.total_fob_usd, self.peso_cobrable, self.total_peso_cobrable
+        )
+        return _componer_landed_cost(
+            self.sku, self.descripcion, self.cantidad,
+            self.valor_fob_usd, participacion, self.total_cantidad,
+            self.arancel, self.iva, self.otros, parametros
+        )
+
+
+def tasas_comision(categorias, parametros):
+    """Tasa de comisión de Mercado Libre por fila según la categoría"""
+    codigos, unicas = pd.factorize(pd.Series(categorias, copy=False), sort=False)
+    tasas_unicas = np.array([
+        parametros[COMISIONES_POR_CATEGORIA[c]] if c in COMISIONES_POR_CATEGORIA else COMISION_POR_DEFECTO
+        for c in unicas
+    ] + [COMISION_POR_DEFECTO], dtype=float)
+    # Las categorías nulas quedan con código -1 y toman la comisión por defecto
+    return tasas_unicas[codigos]
+
+
+def bajo_margen(rentabilidad, margen_objetivo):
+    """Indicar qué rentabilidades no alcanzan el margen objetivo, tolerando el redondeo"""
+    return rentabilidad < margen_objetivo - TOLERANCIA_MARGEN
+
+
+def precio_objetivo(costo_unitario, comision_ml, envio, packaging, margen):
+    """Precio de lista que deja exactamente la rentabilidad ``margen`` sobre el costo
+
+    Resuelve (P·(1 - comisión) - envío - packaging - costo) / costo = margen:
+    P = (costo·(1 + margen) + envío + packaging) / (1 - comisión). Con margen
+    cero es el precio de equilibrio. Un vector de márgenes de forma (M, 1) da
+    una tabla de precios (M, N) en una sola llamada.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (costo_unitario * (1 + margen) + envio + packaging) / (1 - comision_ml)
+
+
+def precio_lista(costo_unitario, parametros, comision_ml):
+    """Precio de venta de lista que cumple el margen objetivo después de comisión y costos fijos"""
+    return precio_objetivo(
+        costo_unitario, comision_ml, parametros['costo_envio_local'], parametros['costo_packaging'],
+        parametros['margen_objetivo']
+    )
+
+
+def precio_equilibrio(costo_unitario, parametros, comision_ml):
+    """Precio de lista con el que la venta apenas cubre costo, comisión y costos fijos"""
+    return precio_objetivo(
+        costo_unitario, comision_ml, parametros['costo_envio_local'], parametros['costo_packaging'], 0.0
+    )
+
+
+def categorias_por_sku(productos, skus, parametros):
+    """Categoría y tasa de comisión de cada SKU según la primera fila del producto"""
+    # Join por SKU contra la primera fila de cada producto
+    indice = pd.Index(productos['sku'])
+    catalogo = productos
+    if not indice.is_unique:
+        catalogo = productos.drop_duplicates('sku', keep='first')
+        indice = pd.Index(catalogo['sku'])
+    posiciones = indice.get_indexer(skus)
+    if (posiciones < 0).any():
+        faltantes = pd.Series(skus)[posiciones < 0].astype(str).head(5).tolist()
+        raise ErrorCalculo(f"SKUs sin producto asociado: {', '.join(faltantes)}")
+    categoria = catalogo['categoria'].array.take(posiciones)
+    comision_ml = tasas_comision(catalogo['categoria'], parametros)[posiciones]
+    return categoria, comision_ml
+
+
+def calcular_ventas(landed_cost, productos, parametros):
+    """Calcular precios de venta y rentabilidad a partir del Landed Cost"""
+    _verificar_entradas(
+        {'productos': (productos, ['sku', 'categoria']), 'landed_cost': (landed_cost, ['sku', 'costo_unitario'])},
+        parametros, PARAMETROS_VENTAS
+    )
+    packaging = parametros['costo_packaging']
+    envio = parametros['costo_envio_local']
+
+    categoria, comision_ml = categorias_por_sku(productos, landed_cost['sku'], parametros)
+    costo_unitario = landed_cost['costo_unitario'].to_numpy(dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Cálculos de venta
+        precio_venta = precio_lista(costo_unitario, parametros, comision_ml)
+        comision = precio_venta * comision_ml
+        precio_neto = precio_venta - comision - envio - packaging
+        rentabilidad = (precio_neto - costo_unitario) / costo_unitario
+        markup = precio_venta / costo_unitario
+
+    return pd.DataFrame({
+        'sku': landed_cost['sku'].array,
+        'descripcion': landed_cost['descripcion'].array,
+        'categoria': categoria,
+        'costo_landed': costo_unitario,
+        'precio_venta': precio_venta,
+        'comision_ml': comision,
+        'comision_porcentaje': comision_ml,
+        'envio': envio,
+        'packaging': packaging,
+        'precio_neto': precio_neto,
+        'rentabilidad': rentabilidad,
+        'markup': markup,
+        'precio_equilibrio': precio_equilibrio(costo_unitario, parametros, comision_ml)
+    }, columns=COLUMNAS_VENTAS)
+
+
+def calcular_tabla_precios(landed_cost, productos, parametros, margenes):
+    """Precio de equilibrio y precio de lista por SKU para varios márgenes objetivo a la vez"""
+    _verificar_entradas(
+        {'productos': (productos, ['sku', 'categoria']), 'landed_cost': (landed_cost, ['sku', 'costo_unitario'])},
+        parametros, PARAMETROS_VENTAS
+    )
+    margenes = np.atleast_1d(np.asarray(margenes, dtype=float))
+    categoria, comision_ml = categorias_por_sku(productos, landed_cost['sku'], parametros)
+    costo_unitario = landed_cost['costo_unitario'].to_numpy(dtype=float)
+
+    precios = precio_objetivo(
+        costo_unitario, comision_ml, parametros['costo_envio_local'], parametros['costo_packaging'],
+        margenes[:, None]
+    )
+    tabla = pd.DataFrame({
+        'sku': landed_cost['sku'].array,
+        'descripcion': landed_cost['descripcion'].array,
+        'categoria': categoria,
+        'costo_landed': costo_unitario,
+        'comision_porcentaje': comision_ml,
+        'precio_equilibrio': precio_equilibrio(costo_unitario, parametros, comision_ml)
+    })
+    for margen, fila in zip(margenes, precios):
+        tabla[f"precio_margen_{margen * 100:g}"] = fila
+    return tabla
+
+
+def escenarios_estandar(parametros, var_tc=0.10, var_arancel=0.33, var_flete=0.12):
+    """Escenarios Optimista, Base y Pesimista a partir de variaciones relativas
+
+    Para un importador el escenario favorable es un peso más fuerte (menos COP
+    por dólar), aranceles y flete más bajos.
+    """
+    return pd.DataFrame({
+        'escenario': ['Optimista', 'Base', 'Pesimista'],
+        'tipo_cambio': parametros['USD_COP'] * np.array([1 - var_tc, 1.0, 1 + var_tc]),
+        'flete_usd': parametros['flete_internacional'] * np.array([1 - var_flete, 1.0, 1 + var_flete]),
+        'factor_arancel': [1 - var_arancel, 1.0, 1 + var_arancel]
+    }, columns=COLUMNAS_DEFINICION_ESCENARIOS)
+
+
+def preparar_catalogo(productos, aranceles, parametros):
+    """Columnas base del catálogo para recalcular costos bajo distintos supuestos
+
+    Resuelve aranceles y comisiones una sola vez y fija el precio neto de lista
+    del caso base, que se mantiene en escenarios y simulaciones.
+    """
+    _verificar_entradas(
+        {'productos': (productos, COLUMNAS_PRODUCTOS + ['categoria']), 'aranceles': (aranceles, COLUMNAS_ARANCELES)},
+        parametros, PARAMETROS_LANDED_COST + PARAMETROS_VENTAS
+    )
+    cantidad = _cantidades(productos)
+    valor_fob_usd = cantidad * productos['precio_unitario_usd'].to_numpy(dtype=float)
+    arancel_porcentaje, iva_porcentaje, otros_impuestos, niveles = obtener_indice(aranceles).resolver(
+        productos['hs_code'], parametros['iva_importacion'], fecha_aduana(productos, parametros)
+    )
+    catalogo = {
+        'sku': productos['sku'].array,
+        'descripcion': productos['descripcion'].array,
+        'cantidad': cantidad,
+        'valor_fob_usd': valor_fob_usd,
+        'participacion_flete': participacion_flete(productos, valor_fob_usd, parametros),
+        'total_cantidad': cantidad.sum(),
+        'arancel_porcentaje': arancel_porcentaje,
+        'iva_porcentaje': iva_porcentaje,
+        'otros_impuestos': otros_impuestos,
+        'iva_por_defecto': niveles == 0
+    }
+
+    costo_base = costos_catalogo(catalogo, parametros, parametros['USD_COP'], parametros['flete_internacional'])
+    categoria, comision_ml = categorias_por_sku(productos, productos['sku'], parametros)
+    catalogo['categoria'] = categoria
+    catalogo['categoria_codigo'], catalogo['categorias'] = pd.factorize(pd.Series(categoria, copy=False), sort=False)
+    catalogo['costo_unitario'] = costo_base['costo_unitario']
+    catalogo['comision_ml'] = comision_ml
+    catalogo['parametros'] = dict(parametros)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precio_venta = precio_lista(costo_base['costo_unitario'], parametros, comision_ml)
+        comision = precio_venta * comision_ml
+        catalogo['precio_venta'] = precio_venta
+        catalogo['precio_neto'] = precio_venta - comision - parametros['costo_envio_local'] - parametros['costo_packaging']
+    return catalogo
+
+
+def costos_catalogo(catalogo, parametros, usd_cop, flete, factor_arancel=1.0, perdidas=None):
+    """Componentes del Landed Cost de un catálogo preparado (admite ejes de escenarios)"""
+    return costos_landed(
+        catalogo['cantidad'], catalogo['valor_fob_usd'], catalogo['participacion_flete'], catalogo['total_cantidad'],
+        catalogo['arancel_porcentaje'] * factor_arancel, catalogo['iva_porcentaje'], catalogo['otros_impuestos'],
+        usd_cop, flete, parametros, perdidas
+    )
+
+
+def bloques_simulacion(n_escenarios, n_skus, max_celdas=None):
+    """Rebanadas de escenarios cuyo producto escenarios × SKUs cabe en un bloque"""
+    paso = max(1, (max_celdas or MAX_CELDAS_ESCENARIOS) // max(1, n_skus))
+    return [slice(inicio, inicio + paso) for inicio in range(0, n_escenarios, paso)]
+
+
+def media_por_escenario(matriz):
+    """Promedio por fila omitiendo NaN, como Series.mean()"""
+    validos = ~np.isnan(matriz)
+    conteo = validos.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(validos, matriz, 0.0).sum(axis=1) / np.where(conteo > 0, conteo, np.nan)
+
+
+def calcular_escenarios(productos, aranceles, parametros, escenarios=None):
+    """Recalcular Landed Cost y rentabilidad del catálogo en cada escenario
+
+    Cada escenario fija tipo de cambio, flete y un factor sobre el arancel de
+    cada SKU; se evalúan juntos como matrices escenarios × SKUs por broadcasting.
+    Los precios de lista quedan en los del caso base, así que los choques de
+    costo se reflejan en la rentabilidad.
+    """
+    escenarios = escenarios_estandar(parametros) if escenarios is None else pd.DataFrame(escenarios)
+    faltantes = [c for c in COLUMNAS_DEFINICION_ESCENARIOS if c not in escenarios.columns]
+    if faltantes:
+        raise ErrorCalculo(f"Faltan columnas en escenarios: {', '.join(faltantes)}")
+
+    catalogo = preparar_catalogo(productos, aranceles, parametros)
+
+    # Fila 0: caso base con los parámetros vigentes; luego un renglón por escenario
+    tipo_cambio = np.append(parametros['USD_COP'], escenarios['tipo_cambio'].to_numpy(dtype=float))
+    flete = np.append(parametros['flete_internacional'], escenarios['flete_usd'].to_numpy(dtype=float))
+    factor_arancel = np.append(1.0, escenarios['factor_arancel'].to_numpy(dtype=float).clip(min=0))
+
+    # Matrices escenarios × SKUs por bloques de escenarios para acotar la memoria
+    agregados = {'costo_promedio': [], 'costo_total': [], 'rentabilidad_promedio': [], 'arancel_efectivo': []}
+    for bloque in bloques_simulacion(len(tipo_cambio), len(catalogo['cantidad'])):
+        costos = costos_catalogo(catalogo, parametros, tipo_cambio[bloque, None], flete[bloque, None],
+                                 factor_arancel[bloque, None])
+        costo_unitario = costos['costo_unitario']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rentabilidad = (catalogo['precio_neto'] - costo_unitario) / costo_unitario
+            agregados['arancel_efectivo'].append(costos['arancel_cop'].sum(axis=1) / costos['cif_cop'].sum(axis=1))
+        agregados['costo_promedio'].append(media_por_escenario(costo_unitario))
+        agregados['costo_total'].append(costos['costo_total'].sum(axis=1))
+        agregados['rentabilidad_promedio'].append(media_por_escenario(rentabilidad))
+
+    agregados = {clave: np.concatenate(valores) for clave, valores in agregados.items()}
+    rentabilidad_promedio = agregados['rentabilidad_promedio']
+
+    return pd.DataFrame({
+        'escenario': escenarios['escenario'].to_numpy(),
+        'tipo_cambio': tipo_cambio[1:],
+        'arancel_porcentaje': agregados['arancel_efectivo'][1:],
+        'factor_arancel': factor_arancel[1:],
+        'flete_usd': flete[1:],
+        'costo_promedio': agregados['costo_promedio'][1:],
+        'costo_total': agregados['costo_total'][1:],
+        'rentabilidad_promedio': rentabilidad_promedio[1:],
+        'impacto_rentabilidad': rentabilidad_promedio[1:] - rentabilidad_promedio[0]
+    }, columns=COLUMNAS_ESCENARIOS)
+
+
+def calcular_evolucion(productos, aranceles, parametros, fechas, tipo_cambio, skus=None):
+    """Landed Cost y rentabilidad de todo el catálogo en cada fecha
+
+    ``tipo_cambio`` trae el USD/COP vigente en cada fecha (por ejemplo, de
+    ``HistorialTasas.tasas``). Las fechas se evalúan como matrices fechas ×
+    SKUs por broadcasting, en bloques de memoria acotada; un año diario de
+    10.000 SKUs cabe en un solo bloque. Si la tabla trae versiones de tasas
+    por fecha, cada día usa las vigentes ese día. Como en los escenarios, los
+    precios de lista quedan en los del caso base. Con ``skus`` (posiciones)
+    devuelve también el costo unitario diario de esos SKUs.
+    """
+    fechas = np.asarray(fechas, dtype='datetime64[D]')
+    tipo_cambio = np.asarray(tipo_cambio, dtype=float)
+    if len(fechas) != len(tipo_cambio):
+        raise ErrorCalculo("Se necesita un tipo de cambio por fecha")
+
+    catalogo = preparar_catalogo(productos, aranceles, parametros)
+    indice = obtener_indice(aranceles)
+    agregados = {'costo_promedio': [], 'costo_total': [], 'rentabilidad_promedio': [], 'skus_bajo_margen': []}
+    por_sku = []
+    for bloque in bloques_simulacion(len(fechas), len(catalogo['cantidad'])):
+        catalogo_bloque = catalogo
+        if indice.con_versiones:
+            # Tasas vigentes en cada fecha del bloque, como matrices fechas × SKUs
+            arancel, iva, otros = indice.resolver_fechas(productos['hs_code'], parametros['iva_importacion'],
+                                                         fechas[bloque])
+            catalogo_bloque = dict(catalogo, arancel_porcentaje=arancel, iva_porcentaje=iva, otros_impuestos=otros)
+        costos = costos_catalogo(catalogo_bloque, parametros, tipo_cambio[bloque, None],
+                                 parametros['flete_internacional'])
+        costo_unitario = costos['costo_unitario']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rentabilidad = (catalogo['precio_neto'] - costo_unitario) / costo_unitario
+        agregados['costo_promedio'].append(media_por_escenario(costo_unitario))
+        agregados['costo_total'].append(costos['costo_total'].sum(axis=1))
+        agregados['rentabilidad_promedio'].append(media_por_escenario(rentabilidad))
+        agregados['skus_bajo_margen'].append(bajo_margen(rentabilidad, parametros['margen_objetivo']).sum(axis=1))
+        if skus is not None:
+            por_sku.append(costo_unitario[:, skus])
+
+    evolucion = pd.DataFrame(
+        {'fecha': fechas, 'tipo_cambio': tipo_cambio,
+         **{clave: np.concatenate(valores) for clave, valores in agregados.items()}},
+        columns=COLUMNAS_EVOLUCION
+    )
+    if skus is None:
+        return evolucion
+
+    costos_sku = np.concatenate(por_sku) if por_sku else np.empty((0, len(skus)))
+    por_sku = pd.DataFrame({
+        'fecha': np.repeat(fechas, len(skus)),
+        'sku': np.tile(np.asarray(catalogo['sku'])[skus], len(fechas)),
+        'costo_unitario': costos_sku.ravel()
+    })
+    return evolucion, por_sku
+
+
+def submuestrear(tabla, columna, max_puntos=MAX_PUNTOS_GRAFICO):
+    """Reducir una serie ordenada a unos ``max_puntos`` conservando picos y valles
+
+    Divide la serie en tramos iguales y deja, de cada uno, la fila del mínimo
+    y la del máximo de ``columna`` (en su orden original).
+    """
+    if len(tabla) <= max_puntos:
+        return tabla
+    tramos = max(1, max_puntos // 2)
+    valores = tabla[columna].to_numpy(dtype=float)
+    limites = np.linspace(0, len(valores), tramos + 1).astype(np.int64)
+    tramo = np.repeat(np.arange(tramos), np.diff(limites))
+    # Orden por tramo y valor: el primero y el último de cada tramo son su mínimo y su máximo
+    orden = np.lexsort((np.nan_to_num(valores, nan=np.inf), tramo))
+    inicio = limites[:-1][np.diff(limites) > 0]
+    fin = limites[1:][np.diff(limites) > 0] - 1
+    filas = np.unique(np.concatenate([orden[inicio], orden[fin]]))
+    return tabla.iloc[filas]
+
+
+def calcular_todo(productos, aranceles, parametros, totales=None):
+    """Calcular Landed Cost y ventas de un catálogo completo (o de un bloque, con sus totales)"""
+    landed_cost = calcular_landed_cost(productos, aranceles, parametros, totales)
+    ventas = calcular_ventas(landed_cost, productos, parametros) if not landed_cost.empty else pd.DataFrame()
+    return landed_cost, ventas
+
+
+def datos_backup(parametros, productos, aranceles, landed_cost, ventas, escenarios, fecha=None):
+    """Armar el contenido del backup completo de la sesión"""
+    return {
+        'parametros': parametros,
+        'productos': productos.to_dict(),
+        'aranceles': aranceles.to_dict(),
+        'landed_cost': landed_cost.to_dict() if not landed_cost.empty else {},
+        'ventas': ventas.to_dict() if not ventas.empty else {},
+        'escenarios': escenarios.to_dict() if not escenarios.empty else {},
+        'fecha_backup': (fecha or datetime.now()).isoformat(),
+        'version': '1.0'
+    }
+
+
+def serializar_backup(datos):
+    """Serializar el backup a JSON (las fechas de la tabla de aranceles como texto)"""
+    return json.dumps(datos, indent=2, ensure_ascii=False, default=str)
+
+
+# Calculadora simple por embarque (app.py)
+
+def calcular_cif(valor_producto, flete_internacional, seguro):
+    return valor_producto + flete_internacional + seguro
+
+
+def calcular_dai(cif, tasa_arancel):
+    return cif * tasa_arancel
+
+
+def calcular_iva(cif, dai, tasa_iva):
+    base_iva = cif + dai
+    return base_iva * tasa_iva
+
+
+def calcular_anticipo_iva(iva, tasa_anticipo):
+    return iva * tasa_anticipo
+
+
+def calcular_gastos_varios(cif, peso_total_kg):
+    agencia_aduanal = max(cif * 0.015, 300000)
+    almacenamiento = max(150000, peso_total_kg * 500)
+    transporte_interno = max(200000, peso_total_kg * 800)
+    otros_gastos = 100000
+
+    return {
+        'agencia_aduanal': agencia_aduanal,
+        'almacenamiento': almacenamiento,
+        'transporte_interno': transporte_interno,
+        'otros_gastos': otros_gastos,
+        'total': agencia_aduanal + almacenamiento + transporte_interno + otros_gastos
+    }
+
+
+def calcular_costos_importacion(valor_productos_usd, peso_total_kg, flete_usd, seguro_usd, tasa_arancel,
+                                tasa_cambio, tasa_iva=0.19, tasa_anticipo_iva=0.10, porcentaje_rentabilidad=30.0):
+    """Calcular el costo total de un embarque y su precio de venta sugerido"""
+    # Conversión a COP
+    valor_producto_cop = valor_productos_usd * tasa_cambio
+    flete_internacional_cop = flete_usd * tasa_cambio
+    seguro_cop = seguro_usd * tasa_cambio
+
+    # Cálculos
+    cif_cop = calcular_cif(valor_producto_cop, flete_internacional_cop, seguro_cop)
+    dai_cop = calcular_dai(cif_cop, tasa_arancel)
+    iva_cop = calcular_iva(cif_cop, dai_cop, tasa_iva)
+    anticipo_iva_cop = calcular_anticipo_iva(iva_cop, tasa_anticipo_iva)
+    gastos_varios = calcular_gastos_varios(cif_cop, peso_total_kg)
+
+    costo_total_cop = cif_cop + dai_cop + iva_cop + gastos_varios['total']
+    costo_total_usd = costo_total_cop / tasa_cambio
+
+    # Calcular precios de venta
+    precio_venta_sugerido_cop = costo_total_cop * (1 + porcentaje_rentabilidad / 100)
+    precio_venta_sugerido_usd = precio_venta_sugerido_cop / tasa_cambio
+
+    return {
+        'valor_producto_cop': valor_producto_cop,
+        'flete_internacional_cop': flete_internacional_cop,
+        'seguro_cop': seguro_cop,
+        'cif_cop': cif_cop,
+        'dai_cop': dai_cop,
+        'iva_cop': iva_cop,
+        'anticipo_iva_cop': anticipo_iva_cop,
+        'gastos_varios': gastos_varios,
+        'costo_total_cop': costo_total_cop,
+        'costo_total_usd': costo_total_usd,
+        'tasa_arancel': tasa_arancel,
+        'iva_usado': tasa_iva,
+        'precio_venta_sugerido_cop': precio_venta_sugerido_cop,
+        'precio_venta_sugerido_usd': precio_venta_sugerido_usd,
+        'utilidad_esperada_cop': precio_venta_sugerido_cop - costo_total_cop,
+        'utilidad_esperada_usd': (precio_venta_sugerido_cop - costo_total_cop) / tasa_cambio
+    }
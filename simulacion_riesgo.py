@@ -0,0 +1,442 @@
+"""Simulación Monte Carlo del riesgo de tipo de cambio, flete, aranceles y pérdidas
+
+Las muestras conjuntas se generan de una vez con una semilla fija, así que el
+resultado no depende del tamaño de bloque. El modelo de costos y precios se
+evalúa por bloques de simulaciones × SKUs para acotar la memoria.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from motor_calculo import (
+    COMISION_POR_DEFECTO, COMISIONES_POR_CATEGORIA, PARAMETROS_LANDED_COST, PARAMETROS_VENTAS, ErrorCalculo,
+    bloques_simulacion, coeficientes_landed, costo_total_landed, costos_landed, precio_lista, precio_objetivo,
+    preparar_catalogo
+)
+
+SEMILLA_POR_DEFECTO = 42
+
+VARIABLES_RIESGO = ['tipo_cambio', 'flete_usd', 'factor_arancel', 'porcentaje_perdidas']
+
+# Desviación estándar de cada variable: logarítmica para tipo de cambio, flete
+# y factor de arancel; absoluta (en puntos de tasa) para las pérdidas
+VOLATILIDADES_POR_DEFECTO = {
+    'tipo_cambio': 0.10,
+    'flete_usd': 0.20,
+    'factor_arancel': 0.15,
+    'porcentaje_perdidas': 0.01
+}
+
+# Correlaciones entre variables (el resto son independientes)
+CORRELACIONES_POR_DEFECTO = {
+    ('tipo_cambio', 'flete_usd'): 0.30
+}
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Parámetros que intervienen en costos y precios (CNY_USD no entra al modelo)
+PARAMETROS_SENSIBILIDAD = PARAMETROS_LANDED_COST + PARAMETROS_VENTAS
+
+NOMBRES_PARAMETROS = {
+    'USD_COP': 'Tipo de cambio USD/COP',
+    'flete_internacional': 'Flete internacional',
+    'seguro_porcentaje': 'Seguro',
+    'iva_importacion': 'IVA importación (por defecto)',
+    'despacho_aduana': 'Despacho aduana',
+    'transporte_interno': 'Transporte interno',
+    'almacenaje': 'Almacenaje',
+    'porcentaje_perdidas': 'Pérdidas',
+    'margen_objetivo': 'Margen objetivo',
+    'costo_packaging': 'Packaging',
+    'costo_envio_local': 'Envío local',
+    'comision_ml_electronicos': 'Comisión ML Electrónicos',
+    'comision_ml_hogar': 'Comisión ML Hogar',
+    'comision_ml_moda': 'Comisión ML Moda'
+}
+
+# Celdas simulaciones × SKUs por bloque: bloques pequeños caben en la caché del
+# procesador y cada operación elemento a elemento recorre memoria rápida
+MAX_CELDAS_BLOQUE = 2**16
+
+# Simulaciones que se guardan completas por SKU para estimar sus percentiles
+MAX_CELDAS_PERCENTILES = 2**24
+
+
+def matriz_correlacion(correlaciones=None):
+    """Matriz de correlación de las variables de riesgo"""
+    matriz = np.eye(len(VARIABLES_RIESGO))
+    for (a, b), rho in (CORRELACIONES_POR_DEFECTO if correlaciones is None else correlaciones).items():
+        i, j = VARIABLES_RIESGO.index(a), VARIABLES_RIESGO.index(b)
+        matriz[i, j] = matriz[j, i] = rho
+    return matriz
+
+
+def generar_muestras(parametros, n_simulaciones, semilla=SEMILLA_POR_DEFECTO, volatilidades=None,
+                     correlaciones=None):
+    """Muestras conjuntas de las variables de riesgo alrededor de los parámetros base
+
+    Tipo de cambio, flete y factor de arancel son lognormales con mediana en el
+    valor base; el porcentaje de pérdidas es normal truncado en cero.
+    """
+    volatilidades = {**VOLATILIDADES_POR_DEFECTO, **(volatilidades or {})}
+    try:
+        cholesky = np.linalg.cholesky(matriz_correlacion(correlaciones))
+    except np.linalg.LinAlgError:
+        raise ErrorCalculo("La matriz de correlación no es definida positiva")
+
+    rng = np.random.default_rng(semilla)
+    z = rng.standard_normal((n_simulaciones, len(VARIABLES_RIESGO))) @ cholesky.T
+
+    return pd.DataFrame({
+        'tipo_cambio': parametros['USD_COP'] * np.exp(volatilidades['tipo_cambio'] * z[:, 0]),
+        'flete_usd': parametros['flete_internacional'] * np.exp(volatilidades['flete_usd'] * z[:, 1]),
+        'factor_arancel': np.exp(volatilidades['factor_arancel'] * z[:, 2]),
+        'porcentaje_perdidas': np.maximum(
+            0.0, parametros['porcentaje_perdidas'] + volatilidades['porcentaje_perdidas'] * z[:, 3]
+        )
+    }, columns=VARIABLES_RIESGO)
+
+
+def coeficientes_costo(catalogo, iva_porcentaje=None):
+    """Coeficientes del costo total por SKU de un catálogo preparado (ver ``coeficientes_landed``)"""
+    return coeficientes_landed(
+        catalogo['cantidad'], catalogo['valor_fob_usd'], catalogo['participacion_flete'], catalogo['total_cantidad'],
+        catalogo['arancel_porcentaje'], catalogo['iva_porcentaje'] if iva_porcentaje is None else iva_porcentaje,
+        catalogo['otros_impuestos']
+    )
+
+
+def agregados_portafolio(catalogo):
+    """Sumas del catálogo con las que la utilidad del portafolio queda en forma cerrada
+
+    Los coeficientes del costo se suman sobre el catálogo; como son lineales en
+    el IVA, se separa la parte de los SKUs con IVA por defecto para que el
+    parámetro ``iva_importacion`` pueda variar. El ingreso neto, con precio de
+    lista fijado sobre el costo base, depende solo del costo base y las
+    unidades por categoría; así el portafolio se evalúa sin recorrer los SKUs.
+    """
+    defecto = catalogo['iva_por_defecto']
+    sin_iva = coeficientes_costo(catalogo, np.where(defecto, 0.0, catalogo['iva_porcentaje']))
+    con_iva = coeficientes_costo(catalogo, np.where(defecto, 1.0, catalogo['iva_porcentaje']))
+    coeficientes = {clave: np.nansum(valores) for clave, valores in sin_iva.items()}
+    # Sin unidades el prorrateo nacional queda indefinido, como en costos_landed
+    coeficientes['nacional'] = np.sum(sin_iva['nacional'])
+
+    # Costo base y unidades por categoría (posición 0: categoría nula)
+    with np.errstate(invalid='ignore'):
+        costo_base = catalogo['cantidad'] * catalogo['costo_unitario']
+    costo_base = np.where(np.isfinite(costo_base), costo_base, 0.0)
+    posiciones = catalogo['categoria_codigo'] + 1
+    n_categorias = len(catalogo['categorias']) + 1
+    base = catalogo['parametros']
+
+    return {
+        'coeficientes': coeficientes,
+        # Derivada de cada coeficiente respecto del IVA por defecto
+        'coeficientes_iva': {clave: np.nansum(con_iva[clave] - valores) for clave, valores in sin_iva.items()},
+        'total_cantidad': catalogo['total_cantidad'],
+        'costo_categoria': np.bincount(posiciones, weights=costo_base, minlength=n_categorias),
+        'cantidad_categoria': np.bincount(posiciones, weights=catalogo['cantidad'], minlength=n_categorias),
+        'comision_base': np.array([COMISION_POR_DEFECTO] + [
+            base[COMISIONES_POR_CATEGORIA[c]] if c in COMISIONES_POR_CATEGORIA else COMISION_POR_DEFECTO
+            for c in catalogo['categorias']
+        ]),
+        'envio_base': base['costo_envio_local'],
+        'packaging_base': base['costo_packaging'],
+        'categorias': catalogo['categorias']
+    }
+
+
+def utilidad_portafolio(agregados, p):
+    """Utilidad y costo total del portafolio para parámetros escalares o en arreglos
+
+    ``p`` trae los parámetros del modelo (y opcionalmente ``factor_arancel``);
+    los arreglos se combinan por broadcasting.
+    """
+    coeficientes = {
+        clave: valor + p['iva_importacion'] * agregados['coeficientes_iva'][clave]
+        for clave, valor in agregados['coeficientes'].items()
+    }
+    costo_total = costo_total_landed(coeficientes, p, p.get('factor_arancel', 1.0))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Ingreso neto: precio de lista sobre el costo base (lineal en costo y
+        # unidades, así que se suma por categoría), menos la comisión, el envío
+        # y el packaging vigentes en cada juego de parámetros
+        ingreso = 0.0
+        for posicion, categoria in enumerate([None] + list(agregados['categorias'])):
+            clave = COMISIONES_POR_CATEGORIA.get(categoria)
+            tasa = p[clave] if clave else COMISION_POR_DEFECTO
+            unidades = agregados['cantidad_categoria'][posicion]
+            ingreso = ingreso + (1 - tasa) * precio_objetivo(
+                agregados['costo_categoria'][posicion], agregados['comision_base'][posicion],
+                agregados['envio_base'] * unidades, agregados['packaging_base'] * unidades, p['margen_objetivo']
+            )
+        ingreso = ingreso - (p['costo_envio_local'] + p['costo_packaging']) * agregados['total_cantidad']
+    return ingreso - costo_total, costo_total
+
+
+def simular_montecarlo(productos, aranceles, parametros, n_simulaciones=10_000, semilla=SEMILLA_POR_DEFECTO,
+                       volatilidades=None, correlaciones=None, nivel_confianza=0.95):
+    """Simular rentabilidad por SKU y del portafolio con precios de lista del caso base
+
+    Devuelve un diccionario con las muestras y la utilidad del portafolio por
+    simulación, el resumen del portafolio (percentiles, probabilidad de pérdida,
+    VaR y CVaR) y la distribución de rentabilidad por SKU. La probabilidad de
+    pérdida y la media por SKU usan todas las simulaciones; sus percentiles, las
+    primeras que caben en ``MAX_CELDAS_PERCENTILES``.
+    """
+    if n_simulaciones < 1:
+        raise ErrorCalculo("El número de simulaciones debe ser positivo")
+
+    catalogo = preparar_catalogo(productos, aranceles, parametros)
+    muestras = generar_muestras(parametros, n_simulaciones, semilla, volatilidades, correlaciones)
+    n_skus = len(catalogo['cantidad'])
+    coeficientes = coeficientes_costo(catalogo)
+
+    tipo_cambio = muestras['tipo_cambio'].to_numpy()
+    flete = muestras['flete_usd'].to_numpy()
+    factor_arancel = muestras['factor_arancel'].to_numpy()
+    factor_perdidas = 1 + muestras['porcentaje_perdidas'].to_numpy()
+
+    # El portafolio se evalúa en forma cerrada, sin recorrer los SKUs
+    utilidad, costo_portafolio = utilidad_portafolio(agregados_portafolio(catalogo), {
+        **parametros,
+        'USD_COP': tipo_cambio,
+        'flete_internacional': flete,
+        'factor_arancel': factor_arancel,
+        'porcentaje_perdidas': factor_perdidas - 1
+    })
+
+    # Distribución por SKU, en bloques de simulaciones × SKUs
+    cantidad = catalogo['cantidad']
+    divisor = np.where(cantidad > 0, cantidad, np.inf)
+    precio_neto = catalogo['precio_neto']
+    perdidas_sku = np.zeros(n_skus, dtype=np.int64)
+    suma_sku = np.zeros(n_skus)
+    validas_sku = np.zeros(n_skus, dtype=np.int64)
+    n_guardadas = min(n_simulaciones, max(1, MAX_CELDAS_PERCENTILES // max(1, n_skus)))
+    guardadas = np.empty((n_guardadas, n_skus), dtype=np.float32)
+
+    for bloque in bloques_simulacion(n_simulaciones, n_skus, MAX_CELDAS_BLOQUE):
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            costo_unitario = costo_total_landed(coeficientes, {
+                **parametros,
+                'USD_COP': tipo_cambio[bloque, None],
+                'flete_internacional': flete[bloque, None],
+                'porcentaje_perdidas': factor_perdidas[bloque, None] - 1
+            }, factor_arancel[bloque, None])
+            costo_unitario /= divisor
+            rentabilidad = (precio_neto - costo_unitario) / costo_unitario
+
+        validas = np.isfinite(rentabilidad)
+        perdidas_sku += (rentabilidad < 0).sum(axis=0)
+        suma_sku += np.where(validas, rentabilidad, 0.0).sum(axis=0)
+        validas_sku += validas.sum(axis=0)
+        if bloque.start < n_guardadas:
+            hasta = min(bloque.stop, n_guardadas)
+            guardadas[bloque.start:hasta] = rentabilidad[:hasta - bloque.start]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rentabilidad_portafolio = utilidad / costo_portafolio
+    muestras['utilidad_portafolio'] = utilidad
+    muestras['rentabilidad_portafolio'] = rentabilidad_portafolio
+
+    # VaR y CVaR de la utilidad frente a su media, al nivel de confianza pedido
+    media_utilidad = utilidad.mean()
+    corte = np.percentile(utilidad, 100 * (1 - nivel_confianza))
+    cola = utilidad[utilidad <= corte]
+    resumen = {
+        'simulaciones': n_simulaciones,
+        'semilla': semilla,
+        'nivel_confianza': nivel_confianza,
+        'utilidad_media': media_utilidad,
+        'rentabilidad_media': np.nanmean(rentabilidad_portafolio),
+        'probabilidad_perdida': (utilidad < 0).mean(),
+        'var': media_utilidad - corte,
+        'cvar': media_utilidad - cola.mean(),
+        **{f'rentabilidad_p{p}': valor for p, valor in zip(
+            PERCENTILES, np.nanpercentile(rentabilidad_portafolio, PERCENTILES)
+        )}
+    }
+
+    with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+        # SKUs sin costo (cantidad cero) no tienen rentabilidad definida
+        warnings.simplefilter('ignore', RuntimeWarning)
+        percentiles_sku = np.nanpercentile(guardadas, PERCENTILES, axis=0)
+        por_sku = pd.DataFrame({
+            'sku': catalogo['sku'],
+            'descripcion': catalogo['descripcion'],
+            'rentabilidad_media': suma_sku / np.where(validas_sku > 0, validas_sku, np.nan),
+            **{f'rentabilidad_p{p}': fila for p, fila in zip(PERCENTILES, percentiles_sku)},
+            'probabilidad_perdida': perdidas_sku / n_simulaciones
+        })
+
+    return {'muestras': muestras, 'resumen': resumen, 'por_sku': por_sku}
+
+
+def evaluar_parametros(catalogo, valores, columnas=slice(None)):
+    """Costo unitario, precio neto y rentabilidad por juego de parámetros × SKU
+
+    ``valores`` asocia cada parámetro a un arreglo con un valor por juego. El
+    precio de lista se fija sobre el costo base y solo el margen objetivo lo
+    recalcula; los demás parámetros (incluidas comisiones, envío y packaging)
+    se reflejan en la rentabilidad con ese precio.
+    """
+    p = {clave: np.asarray(valor, dtype=float)[:, None] for clave, valor in valores.items()}
+    iva = np.where(catalogo['iva_por_defecto'][columnas], p['iva_importacion'], catalogo['iva_porcentaje'][columnas])
+    costos = costos_landed(
+        catalogo['cantidad'][columnas], catalogo['valor_fob_usd'][columnas],
+        catalogo['participacion_flete'][columnas], catalogo['total_cantidad'],
+        catalogo['arancel_porcentaje'][columnas], iva, catalogo['otros_impuestos'][columnas],
+        p['USD_COP'], p['flete_internacional'], p
+    )
+
+    # Comisión por categoría para cada juego de parámetros
+    codigos = catalogo['categoria_codigo'][columnas]
+    n_juegos = len(p['USD_COP'])
+    tasas = np.column_stack([
+        np.broadcast_to(p[COMISIONES_POR_CATEGORIA[c]] if c in COMISIONES_POR_CATEGORIA else COMISION_POR_DEFECTO,
+                        (n_juegos, 1))[:, 0]
+        for c in catalogo['categorias']
+    ] + [np.full(n_juegos, COMISION_POR_DEFECTO)])
+    comision_ml = tasas[:, codigos]
+
+    costo_unitario = costos['costo_unitario']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        base = {**catalogo['parametros'], 'margen_objetivo': p['margen_objetivo']}
+        precio_venta = precio_lista(catalogo['costo_unitario'][columnas], base, catalogo['comision_ml'][columnas])
+        comision = precio_venta * comision_ml
+        precio_neto = precio_venta - comision - p['costo_envio_local'] - p['costo_packaging']
+        rentabilidad = (precio_neto - costo_unitario) / costo_unitario
+    return costo_unitario, precio_neto, rentabilidad
+
+
+def analizar_sensibilidad(productos, aranceles, parametros, variacion=0.10, parametros_analizados=None):
+    """Impacto de bajar y subir cada parámetro sobre la utilidad y la rentabilidad (tornado)
+
+    Todas las variaciones (caso base, baja y alta de cada parámetro) se evalúan
+    juntas como matrices juegos de parámetros × SKUs, por bloques de SKUs, con
+    el precio de lista del caso base (solo el margen objetivo lo recalcula).
+    Devuelve el tornado ordenado por rango de utilidad del portafolio y, por SKU,
+    el parámetro que más mueve su rentabilidad.
+    """
+    nombres = list(parametros_analizados or PARAMETROS_SENSIBILIDAD)
+    desconocidos = [n for n in nombres if n not in PARAMETROS_SENSIBILIDAD]
+    if desconocidos:
+        raise ErrorCalculo(f"Parámetros sin efecto en el modelo: {', '.join(desconocidos)}")
+    catalogo = preparar_catalogo(productos, aranceles, parametros)
+
+    # Juego 0: caso base; juegos 2i+1 y 2i+2: baja y alta del parámetro i
+    n_juegos = 1 + 2 * len(nombres)
+    valores = {clave: np.full(n_juegos, float(parametros[clave])) for clave in PARAMETROS_SENSIBILIDAD}
+    for i, nombre in enumerate(nombres):
+        valores[nombre][2 * i + 1] *= 1 - variacion
+        valores[nombre][2 * i + 2] *= 1 + variacion
+
+    n_skus = len(catalogo['cantidad'])
+    utilidad = np.zeros(n_juegos)
+    suma_rentabilidad = np.zeros(n_juegos)
+    validas = np.zeros(n_juegos, dtype=np.int64)
+    rentabilidad_base = np.empty(n_skus)
+    rango_dominante = np.zeros(n_skus)
+    indice_dominante = np.full(n_skus, -1, dtype=np.int64)
+
+    paso = max(1, MAX_CELDAS_BLOQUE // n_juegos)
+    for inicio in range(0, n_skus, paso):
+        columnas = slice(inicio, inicio + paso)
+        costo_unitario, precio_neto, rentabilidad = evaluar_parametros(catalogo, valores, columnas)
+        utilidad += np.nansum(catalogo['cantidad'][columnas] * (precio_neto - costo_unitario), axis=1)
+        finitas = np.isfinite(rentabilidad)
+        suma_rentabilidad += np.where(finitas, rentabilidad, 0.0).sum(axis=1)
+        validas += finitas.sum(axis=1)
+
+        rentabilidad_base[columnas] = rentabilidad[0]
+        if nombres:
+            rangos = np.abs(rentabilidad[2::2] - rentabilidad[1::2])
+            rangos = np.where(np.isfinite(rangos), rangos, -1.0)
+            indice_dominante[columnas] = rangos.argmax(axis=0)
+            rango_dominante[columnas] = rangos.max(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rentabilidad_media = suma_rentabilidad / np.where(validas > 0, validas, np.nan)
+
+    tornado = pd.DataFrame({
+        'parametro': nombres,
+        'nombre': [NOMBRES_PARAMETROS[n] for n in nombres],
+        'valor_base': [float(parametros[n]) for n in nombres],
+        'valor_bajo': valores_juego(valores, nombres, 1),
+        'valor_alto': valores_juego(valores, nombres, 2),
+        'utilidad_baja': utilidad[1::2],
+        'utilidad_alta': utilidad[2::2],
+        'rentabilidad_baja': rentabilidad_media[1::2],
+        'rentabilidad_alta': rentabilidad_media[2::2]
+    })
+    tornado['rango_utilidad'] = (tornado['utilidad_alta'] - tornado['utilidad_baja']).abs()
+    tornado['rango_rentabilidad'] = (tornado['rentabilidad_alta'] - tornado['rentabilidad_baja']).abs()
+    tornado = tornado.sort_values('rango_utilidad', ascending=False, kind='stable').reset_index(drop=True)
+
+    sin_dominante = rango_dominante <= 0
+    por_sku = pd.DataFrame({
+        'sku': catalogo['sku'],
+        'descripcion': catalogo['descripcion'],
+        'rentabilidad_base': rentabilidad_base,
+        'parametro_dominante': np.where(
+            sin_dominante, None, np.array(nombres + [None], dtype=object)[indice_dominante]
+        ),
+        'rango_rentabilidad': np.where(sin_dominante, np.nan, rango_dominante)
+    })
+
+    return {
+        'tornado': tornado,
+        'por_sku': por_sku,
+        'utilidad_base': utilidad[0],
+        'rentabilidad_base': rentabilidad_media[0],
+        'variacion': variacion
+    }
+
+
+def valores_juego(valores, nombres, desplazamiento):
+    """Valor de cada parámetro en su juego de baja (1) o alta (2)"""
+    return [valores[nombre][2 * i + desplazamiento] for i, nombre in enumerate(nombres)]
+
+
+def rango_parametro(parametros, nombre, variacion=0.30, puntos=50):
+    """Valores equiespaciados de un parámetro alrededor de su valor base"""
+    base = float(parametros[nombre])
+    return np.linspace(base * (1 - variacion), base * (1 + variacion), puntos)
+
+
+def barrido_grilla(productos, aranceles, parametros, parametro_x, valores_x, parametro_y, valores_y):
+    """Utilidad y rentabilidad del portafolio en cada punto de una grilla de dos parámetros
+
+    La grilla se evalúa por broadcasting sobre la forma cerrada del portafolio
+    (filas: ``valores_y``, columnas: ``valores_x``).
+    """
+    for nombre in (parametro_x, parametro_y):
+        if nombre not in PARAMETROS_SENSIBILIDAD:
+            raise ErrorCalculo(f"Parámetro sin efecto en el modelo: {nombre}")
+    if parametro_x == parametro_y:
+        raise ErrorCalculo("Elija dos parámetros distintos para la grilla")
+
+    valores_x = np.asarray(valores_x, dtype=float)
+    valores_y = np.asarray(valores_y, dtype=float)
+    agregados = agregados_portafolio(preparar_catalogo(productos, aranceles, parametros))
+    utilidad, costo_total = utilidad_portafolio(agregados, {
+        **{clave: float(parametros[clave]) for clave in PARAMETROS_SENSIBILIDAD},
+        parametro_x: valores_x[None, :],
+        parametro_y: valores_y[:, None]
+    })
+    utilidad = np.broadcast_to(utilidad, (len(valores_y), len(valores_x)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rentabilidad = utilidad / costo_total
+
+    return {
+        'parametro_x': parametro_x,
+        'parametro_y': parametro_y,
+        'valores_x': valores_x,
+        'valores_y': valores_y,
+        'utilidad': utilidad,
+        'rentabilidad': np.broadcast_to(rentabilidad, utilidad.shape)
+    }
@@ -0,0 +1,106 @@
+"""Las formas cerradas de consolidación y simulación deben coincidir con el motor de cálculo
+
+Ejecutar con: python -m pytest test_modelo_costos.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark_calculo import generar_aranceles, generar_productos
+from consolidacion import _costos_grupos, agregados_ordenes
+from motor_calculo import (
+    calcular_escenarios, calcular_landed_cost, calcular_ventas, costos_landed, parametros_por_defecto
+)
+from simulacion_riesgo import barrido_grilla, simular_montecarlo
+
+TOLERANCIA = 1e-9
+
+
+@pytest.fixture(scope='module')
+def aranceles():
+    return generar_aranceles(300)
+
+
+@pytest.fixture(scope='module')
+def productos(aranceles):
+    return generar_productos(400, aranceles)
+
+
+def _utilidad(productos, aranceles, parametros, costo_total):
+    """Utilidad del portafolio con los precios de lista del caso base y otro costo total"""
+    ventas = calcular_ventas(calcular_landed_cost(productos, aranceles, parametros), productos, parametros)
+    return (productos['cantidad'].to_numpy() * ventas['precio_neto'].to_numpy()).sum() - costo_total
+
+
+def test_costo_total_suma_sus_componentes(productos, aranceles):
+    parametros = parametros_por_defecto()
+    landed_cost = calcular_landed_cost(productos, aranceles, parametros)
+    componentes = landed_cost[['cif_cop', 'arancel_cop', 'iva_cop', 'otros_impuestos_cop', 'costos_nacionales']]
+    esperado = componentes.sum(axis=1) * (1 + parametros['porcentaje_perdidas'])
+    np.testing.assert_allclose(landed_cost['costo_total'], esperado, rtol=TOLERANCIA)
+
+
+def test_costos_landed_admite_eje_de_escenarios():
+    costos = costos_landed(
+        np.array([10, 20]), np.array([100.0, 50.0]), np.array([0.5, 0.5]), 30, np.array([0.1, 0.0]),
+        np.array([0.19, 0.05]), np.array([0.0, 0.08]), np.array([[4000.0], [4200.0]]), 1000.0,
+        parametros_por_defecto()
+    )
+    assert costos['costo_total'].shape == (2, 2)
+
+
+@pytest.mark.parametrize('base_flete', ['valor', 'peso_cobrable'])
+def test_costos_grupos_coinciden_con_calcular_landed_cost(productos, aranceles, base_flete):
+    parametros = {**parametros_por_defecto(), 'base_flete': base_flete}
+    rng = np.random.default_rng(7)
+    lineas = productos.assign(
+        orden=rng.integers(0, 12, len(productos)),
+        fecha_lista=pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 60, len(productos)), unit='D')
+    )
+    ordenes = agregados_ordenes(lineas, aranceles, parametros).sort_values('orden', ignore_index=True)
+    acumulados = {
+        columna: np.concatenate([[0.0], np.cumsum(ordenes[columna].to_numpy(dtype=float))])
+        for columna in ordenes.columns.drop(['orden', 'fecha_lista', 'lineas'])
+    }
+
+    for _ in range(10):
+        inicio, fin = np.sort(rng.choice(len(ordenes) + 1, 2, replace=False))
+        grupo = lineas[lineas['orden'].isin(ordenes['orden'].iloc[inicio:fin])]
+        esperado = calcular_landed_cost(grupo, aranceles, parametros)['costo_total'].sum()
+        obtenido = _costos_grupos(acumulados, np.array([inicio]), fin, parametros)[0]
+        assert obtenido == pytest.approx(esperado, rel=TOLERANCIA)
+
+
+def test_simulacion_coincide_con_calcular_escenarios(productos, aranceles):
+    parametros = parametros_por_defecto()
+    # Sin volatilidad en las pérdidas, cada simulación es un escenario de tipo de cambio, flete y arancel
+    muestras = simular_montecarlo(
+        productos, aranceles, parametros, n_simulaciones=3, volatilidades={'porcentaje_perdidas': 0.0}
+    )['muestras']
+    escenarios = calcular_escenarios(productos, aranceles, parametros, pd.DataFrame({
+        'escenario': ['uno', 'dos', 'tres'],
+        'tipo_cambio': muestras['tipo_cambio'],
+        'flete_usd': muestras['flete_usd'],
+        'factor_arancel': muestras['factor_arancel']
+    }))
+    esperado = _utilidad(productos, aranceles, parametros, escenarios['costo_total'].to_numpy())
+    np.testing.assert_allclose(muestras['utilidad_portafolio'], esperado, rtol=TOLERANCIA)
+
+
+def test_grilla_coincide_con_calcular_escenarios(productos, aranceles):
+    parametros = parametros_por_defecto()
+    grilla = barrido_grilla(productos, aranceles, parametros, 'USD_COP', [4100.0], 'flete_internacional', [3100.0])
+    escenarios = calcular_escenarios(productos, aranceles, parametros, pd.DataFrame({
+        'escenario': ['celda'], 'tipo_cambio': [4100.0], 'flete_usd': [3100.0], 'factor_arancel': [1.0]
+    }))
+    esperado = _utilidad(productos, aranceles, parametros, escenarios['costo_total'].iloc[0])
+    assert grilla['utilidad'][0, 0] == pytest.approx(esperado, rel=TOLERANCIA)
+
+
+def test_grilla_de_iva_y_costos_nacionales_coincide_con_calcular_landed_cost(productos, aranceles):
+    parametros = parametros_por_defecto()
+    grilla = barrido_grilla(productos, aranceles, parametros, 'iva_importacion', [0.05], 'despacho_aduana', [2e6])
+    cambiados = {**parametros, 'iva_importacion': 0.05, 'despacho_aduana': 2e6}
+    costo_total = calcular_landed_cost(productos, aranceles, cambiados)['costo_total'].sum()
+    esperado = _utilidad(productos, aranceles, parametros, costo_total)
+    assert grilla['utilidad'][0, 0] == pytest.approx(esperado, rel=TOLERANCIA)
@@ -0,0 +1,168 @@
+"""Validación del catálogo de productos antes de calcular
+
+Cada regla es una máscara booleana por fila calculada por columnas; los
+textos repetidos (HS Codes, incoterms, categorías) se evalúan una vez por
+valor distinto y se expanden al catálogo. El reporte resume cada regla
+violada con su severidad, conteo y unos ejemplos; las reglas de severidad
+'error' bloquean el cálculo del Landed Cost.
+
+Ejemplo:
+    reporte = validar_productos(productos, aranceles, parametros)
+    verificar_catalogo(productos, aranceles, parametros)  # ErrorCalculo si hay errores
+"""
+import numpy as np
+import pandas as pd
+
+from indice_aranceles import normalizar_hs_code, obtener_indice
+from motor_calculo import (
+    COLUMNAS_PESO, COLUMNAS_PRODUCTOS, COMISIONES_POR_CATEGORIA, ErrorCalculo, prorratea_por_peso
+)
+
+INCOTERMS = ('EXW', 'FCA', 'FAS', 'FOB', 'CFR', 'CIF', 'CPT', 'CIP', 'DAP', 'DPU', 'DDP')
+
+CATEGORIAS = tuple(COMISIONES_POR_CATEGORIA) + ('Deportes', 'Otros')
+
+# Largos válidos de un HS Code en dígitos: partida, subpartida SA, NANDINA y nacional
+LARGOS_HS_CODE = (4, 6, 8, 10)
+
+# Regla: (severidad, mensaje)
+REGLAS = {
+    'sku_vacio': ('error', "SKU vacío"),
+    'sku_duplicado': ('error', "SKU repetido en varias filas"),
+    'descripcion_vacia': ('advertencia', "Descripción vacía"),
+    'cantidad_invalida': ('error', "Cantidad vacía, cero o negativa (costo unitario indefinido)"),
+    'cantidad_fraccionaria': ('advertencia', "Cantidad con decimales"),
+    'precio_invalido': ('error', "Precio unitario vacío o negativo"),
+    'precio_cero': ('advertencia', "Precio unitario en cero"),
+    'hs_code_vacio': ('advertencia', "Sin HS Code: se aplica el arancel por defecto"),
+    'hs_code_malformado': ('error', "HS Code con caracteres o número de dígitos inválidos"),
+    'hs_code_sin_arancel': ('advertencia', "HS Code sin arancel en la tabla: se aplica el arancel por defecto"),
+    'hs_code_parcial': ('advertencia', "HS Code resuelto por partida o capítulo, no por subpartida"),
+    'incoterm_desconocido': ('advertencia', "Incoterm desconocido"),
+    'categoria_desconocida': ('advertencia', "Categoría desconocida: se aplica la comisión por defecto"),
+    'peso_invalido': ('error', "Peso o volumen negativo"),
+    'sin_peso_cobrable': ('advertencia', "Sin peso ni volumen: no absorbe flete al prorratear por peso"),
+}
+
+COLUMNAS_REPORTE = ['regla', 'severidad', 'mensaje', 'filas', 'ejemplos']
+
+MAX_EJEMPLOS = 5
+
+
+def _por_valor(serie, *funciones):
+    """Evaluar cada función sobre los valores distintos de una columna y expandir a las filas
+
+    Devuelve una máscara por función (una sola si se pasa una función).
+    """
+    codigos, unicos = pd.factorize(serie, sort=False)
+    # Los nulos quedan con código -1 y toman la última posición
+    unicos = pd.Series(np.append(np.asarray(unicos, dtype=object), None), dtype=object)
+    mascaras = [np.asarray(funcion(unicos), dtype=bool)[codigos] for funcion in funciones]
+    return mascaras[0] if len(mascaras) == 1 else mascaras
+
+
+def _numero(productos, columna):
+    return pd.to_numeric(productos[columna], errors='coerce').to_numpy(dtype=float)
+
+
+def mascaras_validacion(productos, aranceles=None, parametros=None):
+    """Máscara booleana por regla (solo las que aplican a las columnas presentes)
+
+    Con ``aranceles`` se revisa también la coincidencia de HS Codes; con
+    ``parametros``, las reglas del prorrateo por peso.
+    """
+    faltantes = [c for c in COLUMNAS_PRODUCTOS if c not in productos.columns]
+    if faltantes:
+        raise ErrorCalculo(f"Faltan columnas en productos: {', '.join(faltantes)}")
+    mascaras = {}
+
+    sku = productos['sku'].astype('string').str.strip()
+    mascaras['sku_vacio'] = (sku.fillna('') == '').to_numpy()
+    mascaras['sku_duplicado'] = (sku.duplicated(keep=False) & ~pd.Series(mascaras['sku_vacio'], index=sku.index)).to_numpy()
+    mascaras['descripcion_vacia'] = (productos['descripcion'].astype('string').str.strip().fillna('') == '').to_numpy()
+
+    with np.errstate(invalid='ignore'):
+        cantidad = _numero(productos, 'cantidad')
+        mascaras['cantidad_invalida'] = ~(cantidad > 0)
+        mascaras['cantidad_fraccionaria'] = (cantidad > 0) & (cantidad != np.round(cantidad))
+        precio = _numero(productos, 'precio_unitario_usd')
+        mascaras['precio_invalido'] = ~(precio >= 0)
+        mascaras['precio_cero'] = precio == 0
+
+    def malformado(valores):
+        texto = valores.astype('string').str.strip().fillna('')
+        digitos = normalizar_hs_code(texto)
+        return (texto != '') & (~texto.str.fullmatch(r'[\d.\s-]+').fillna(False) | ~digitos.str.len().isin(LARGOS_HS_CODE))
+
+    hs_code = productos['hs_code']
+    mascaras['hs_code_vacio'], mascaras['hs_code_malformado'] = _por_valor(
+        hs_code, lambda v: normalizar_hs_code(v) == '', malformado
+    )
+    if aranceles is not None:
+        niveles = obtener_indice(aranceles).resolver(hs_code, 0.0)[3]
+        validos = ~mascaras['hs_code_vacio'] & ~mascaras['hs_code_malformado']
+        mascaras['hs_code_sin_arancel'] = validos & (niveles == 0)
+        mascaras['hs_code_parcial'] = validos & (niveles > 0) & (niveles < 6)
+
+    if 'incoterm' in productos.columns:
+        mascaras['incoterm_desconocido'] = _por_valor(
+            productos['incoterm'], lambda v: ~v.astype('string').str.strip().str.upper().isin(INCOTERMS).fillna(False)
+        )
+    if 'categoria' in productos.columns:
+        mascaras['categoria_desconocida'] = _por_valor(
+            productos['categoria'], lambda v: ~v.isin(CATEGORIAS)
+        )
+
+    if all(c in productos.columns for c in COLUMNAS_PESO):
+        peso, volumen = (_numero(productos, c) for c in COLUMNAS_PESO)
+        with np.errstate(invalid='ignore'):
+            mascaras['peso_invalido'] = (peso < 0) | (volumen < 0)
+            if parametros is not None and prorratea_por_peso(parametros):
+                mascaras['sin_peso_cobrable'] = ~(peso > 0) & ~(volumen > 0)
+    return mascaras
+
+
+def reporte_validacion(mascaras, productos, max_ejemplos=MAX_EJEMPLOS):
+    """Una fila por regla violada: severidad, mensaje, filas afectadas y SKUs de ejemplo"""
+    filas = []
+    for regla, mascara in mascaras.items():
+        conteo = int(np.count_nonzero(mascara))
+        if conteo == 0:
+            continue
+        posiciones = np.flatnonzero(mascara)[:max_ejemplos]
+        ejemplos = [
+            str(sku) if pd.notna(sku) and str(sku).strip() else f"fila {posicion + 1}"
+            for posicion, sku in zip(posiciones, productos['sku'].iloc[posiciones])
+        ]
+        severidad, mensaje = REGLAS[regla]
+        filas.append({
+            'regla': regla, 'severidad': severidad, 'mensaje': mensaje,
+            'filas': conteo, 'ejemplos': ', '.join(dict.fromkeys(ejemplos))
+        })
+    reporte = pd.DataFrame(filas, columns=COLUMNAS_REPORTE)
+    # Errores primero, luego por filas afectadas
+    return reporte.sort_values(['severidad', 'filas'], ascending=[False, False], kind='stable', ignore_index=True)
+
+
+def validar_productos(productos, aranceles=None, parametros=None, max_ejemplos=MAX_EJEMPLOS):
+    """Validar todo el catálogo en una pasada y devolver el reporte de reglas violadas"""
+    return reporte_validacion(mascaras_validacion(productos, aranceles, parametros), productos, max_ejemplos)
+
+
+def filas_con_errores(mascaras):
+    """Máscara de filas que violan alguna regla de severidad 'error'"""
+    errores = [m for regla, m in mascaras.items() if REGLAS[regla][0] == 'error']
+    return np.logical_or.reduce(errores) if errores else np.zeros(0, dtype=bool)
+
+
+def verificar_catalogo(productos, aranceles=None, parametros=None, omitir=()):
+    """Reporte de validación; lanza ErrorCalculo si alguna regla de severidad 'error' se viola
+
+    Las reglas en ``omitir`` quedan en el reporte pero no bloquean.
+    """
+    reporte = validar_productos(productos, aranceles, parametros)
+    errores = reporte[(reporte['severidad'] == 'error') & ~reporte['regla'].isin(omitir)]
+    if not errores.empty:
+        detalle = '; '.join(f"{r.mensaje}: {r.filas:,} filas ({r.ejemplos})" for r in errores.itertuples())
+        raise ErrorCalculo(f"El catálogo tiene errores: {detalle}")
+    return reporte